@@ -0,0 +1,50 @@
+"""Benchmark do analisador de datas: microssegundos por frase, com e sem cache.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_date_parser --calls 100000
+"""
+import argparse
+import itertools
+import time
+
+from utils import date_parser
+from utils.date_parser import split_schedule, parse_period
+
+AGENDAMENTOS = [
+    'reunião amanhã às 10h',
+    'dentista sexta às 14:30 por 2 horas',
+    'curso dia 25 das 9h às 12h',
+    'aniversário da ana 25/12',
+    'jantar com a equipe às 8 da noite',
+    'almoço ao meio-dia de amanhã',
+    'inglês na próxima segunda-feira às 07h30 por meia hora',
+    'treino às 7 por 1h30',
+]
+
+PERIODOS = ['hoje', 'de amanhã', 'sexta', 'da semana que vem', 'do mes', 'mês passado', 'março de 2024',
+            'últimos 7 dias', 'de 01/10 a 15/10', 'dia 5']
+
+
+def measure(func, phrases, calls):
+    started = time.perf_counter()
+    for phrase in itertools.islice(itertools.cycle(phrases), calls):
+        func(phrase)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100_000)
+    args = parser.parse_args()
+
+    # Frases sempre diferentes: cada chamada passa pela gramática inteira
+    unique = [f'evento {index} {phrase}' for index, phrase in enumerate(AGENDAMENTOS * (args.calls // len(AGENDAMENTOS) // 10))]
+    print(f"agendar, sem cache:  {measure(split_schedule, unique, len(unique)):6.2f} µs/frase")
+    print(f"agendar, com cache:  {measure(split_schedule, AGENDAMENTOS, args.calls):6.2f} µs/frase")
+    print(f"período, com cache:  {measure(parse_period, PERIODOS, args.calls):6.2f} µs/frase")
+    for name, info in date_parser.cache_info().items():
+        print(f"  cache {name}: {info.hits} acertos, {info.misses} erros, {info.currsize} frases")
+
+
+if __name__ == '__main__':
+    main()
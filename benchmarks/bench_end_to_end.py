@@ -0,0 +1,131 @@
+"""Benchmark ponta a ponta do bot, sem rede: mensagens por segundo e latência por fluxo.
+
+Sobe o Telegram e o Google falsos (benchmarks/fake_backends.py), monta a
+aplicação de verdade (main.build_application) no mesmo processo e passa por
+ela atualizações sintéticas (benchmarks/synthetic_updates.py). Cada chat é
+processado em ordem e os chats em paralelo, como no bot real. A latência de
+cada mensagem vai do process_update até a resposta enviada.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_end_to_end --chats 20 --messages-per-chat 30
+    python -m benchmarks.bench_end_to_end --google-latency-ms 80 --google-jitter-ms 40
+    python -m benchmarks.bench_end_to_end --error-rate 0.05 --sheets-quota 60 --real-quotas
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.fake_backends import FakeServers
+from benchmarks.load_test_webhook import percentile
+from benchmarks.synthetic_updates import generate, parse_mix, DEFAULT_MIX, FLOWS
+
+# Respostas que indicam que o fluxo falhou
+ERROR_MARKERS = ('Ocorreu um erro', 'demorou demais', 'Não consegui', 'Não encontrei')
+
+
+def configure_environment(servers, args):
+    os.environ.update(
+        TELEGRAM_TOKEN='123456:bench',
+        TELEGRAM_API_URL=servers.telegram_url,
+        GOOGLE_API_ENDPOINT=servers.google_url,
+        SPREADSHEET_ID='planilha-bench',
+        FINANCE_FLUSH_INTERVAL_MS='200',
+    )
+    if not args.outbox:
+        # O ritmo do Telegram (1 mensagem/s por chat) esconderia o custo do próprio bot
+        os.environ['TELEGRAM_OUTBOX'] = '0'
+    if not args.real_quotas:
+        # Sem isso o agendador seguraria a planilha em ~1 chamada/s (a cota real da conta)
+        os.environ.update(GOOGLE_SHEETS_RATE='100000', GOOGLE_SHEETS_BURST='100000',
+                          GOOGLE_CALENDAR_RATE='100000', GOOGLE_CALENDAR_BURST='100000',
+                          GOOGLE_SHEETS_PROJECT_RATE='100000', GOOGLE_SHEETS_PROJECT_BURST='100000',
+                          GOOGLE_CALENDAR_PROJECT_RATE='100000', GOOGLE_CALENDAR_PROJECT_BURST='100000')
+
+
+async def run(updates, chats_in_parallel):
+    # Importado só agora: os módulos leem o ambiente na importação
+    import main
+    from telegram import Update
+
+    application = main.build_application()
+    await application.initialize()
+    await application.post_init(application)
+    await application.bot_data['warm_up']
+
+    by_chat = {}
+    for flow, update in updates:
+        by_chat.setdefault(update['message']['chat']['id'], []).append((flow, update))
+    latencies = {flow: [] for flow in FLOWS}
+    semaphore = asyncio.Semaphore(chats_in_parallel)
+
+    async def run_chat(chat_updates):
+        async with semaphore:
+            for flow, data in chat_updates:
+                update = Update.de_json(data, application.bot)
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies[flow].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_chat(chat_updates) for chat_updates in by_chat.values()))
+    elapsed = time.perf_counter() - started
+
+    # Desligar envia os lançamentos que ainda estão na fila
+    await application.shutdown()
+    await application.post_shutdown(application)
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--messages-per-chat', type=int, default=30)
+    parser.add_argument('--parallel', type=int, default=64, help='chats processados ao mesmo tempo')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='peso de cada fluxo, ex.: finance=5,schedule=2,list=2,delete=1,edit=1,total=1')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--google-latency-ms', type=float, default=0)
+    parser.add_argument('--google-jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0, help='fração de chamadas ao Google com 429')
+    parser.add_argument('--sheets-quota', type=int, default=0, help='chamadas/minuto do Sheets falso (0 = sem limite)')
+    parser.add_argument('--calendar-quota', type=int, default=0, help='chamadas/minuto do Calendar falso')
+    parser.add_argument('--real-quotas', action='store_true', help='mantém as cotas do agendador de chamadas')
+    parser.add_argument('--outbox', action='store_true', help='mantém a fila de saída (ritmo do Telegram)')
+    args = parser.parse_args()
+
+    updates = generate(args.chats, args.messages_per_chat, args.mix, args.seed)
+    quota = {api: limit for api, limit in (('sheets', args.sheets_quota), ('calendar', args.calendar_quota)) if limit}
+    with FakeServers(latency=args.google_latency_ms / 1000, jitter=args.google_jitter_ms / 1000,
+                     error_rate=args.error_rate, quota=quota, seed=args.seed) as servers:
+        configure_environment(servers, args)
+        os.chdir(tempfile.mkdtemp(prefix='bench_e2e_'))
+        elapsed, latencies = asyncio.run(run(updates, args.parallel))
+
+    from utils.metrics import snapshot
+    replies = [message['text'] for _, message in servers.telegram.sent]
+    errors = sum(1 for text in replies if text.startswith(ERROR_MARKERS))
+
+    print(f"{len(updates)} mensagens ({args.chats} chats), Google falso: "
+          f"{args.google_latency_ms:.0f}±{args.google_jitter_ms:.0f} ms, {args.error_rate:.0%} de 429\n")
+    print(f"{'fluxo':<10} {'msgs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}")
+    for flow in FLOWS:
+        values = latencies[flow]
+        if values:
+            print(f"{flow:<10} {len(values):>6} {percentile(values, 50) * 1000:9.1f} {percentile(values, 95) * 1000:9.1f} "
+                  f"{percentile(values, 99) * 1000:9.1f} {max(values) * 1000:9.1f}")
+    print(f"\nVazão: {len(updates) / elapsed:,.0f} mensagens/s ({elapsed:.2f} s)")
+    print(f"Respostas: {len(replies)} ({errors} de erro)")
+    for text in sorted({text for text in replies if text.startswith(ERROR_MARKERS)}):
+        print(f"  {text.splitlines()[0][:100]}")
+    print(f"Chamadas ao Google falso: {servers.google.calls}")
+    if servers.google.rejected:
+        print(f"Recusadas com 429: {servers.google.rejected} (novas tentativas: "
+              f"{snapshot()[1].get('google.retries', 0)})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Benchmark dos relatórios financeiros sobre um livro-caixa sintético.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_finance_reports --rows 1000000
+"""
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from utils.finance_reports import (
+    DESPESA, FinanceColumns, totals_by_category, weekly_totals, monthly_totals, year_summary
+)
+
+CATEGORIAS = ['Alimentação', 'Transporte', 'Moradia', 'Lazer', 'Saúde', 'Educação', 'Mercado', 'Bico', 'Salário']
+
+
+def synthetic_rows(n_rows, years=5, seed=42):
+    """Linhas (timestamp, valor, tipo, categoria) espalhadas pelos últimos anos"""
+    rng = np.random.default_rng(seed)
+    end = int(time.time())
+    start = end - years * 365 * 86400
+    timestamps = np.sort(rng.integers(start, end, n_rows))
+    values = np.round(rng.gamma(2.0, 40.0, n_rows), 2)
+    tipos = np.where(rng.random(n_rows) < 0.85, 'Despesa', 'Receita')
+    categorias = rng.choice(CATEGORIAS, n_rows)
+    return list(zip(timestamps.tolist(), values.tolist(), tipos.tolist(), categorias.tolist()))
+
+
+def row_by_row_category_totals(rows, start, end):
+    """Versão antiga: um loop em Python por linha"""
+    start_ts = datetime.datetime.combine(start, datetime.time.min).replace(tzinfo=datetime.timezone.utc).timestamp()
+    end_ts = datetime.datetime.combine(end, datetime.time.min).replace(tzinfo=datetime.timezone.utc).timestamp()
+    totals = {}
+    for timestamp, valor, tipo, categoria in rows:
+        if tipo == 'Despesa' and start_ts <= timestamp < end_ts:
+            totals[categoria] = totals.get(categoria, 0) + valor
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def bench(label, func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<40} {best * 1000:10.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Gerando {args.rows} linhas sintéticas...")
+    rows = synthetic_rows(args.rows)
+    today = datetime.date.today()
+    year = today.year
+    month_start = today.replace(day=1)
+    year_start = datetime.date(year, 1, 1)
+    year_end = datetime.date(year + 1, 1, 1)
+
+    columns = FinanceColumns.empty()
+    bench("carga das colunas (extend)", lambda: FinanceColumns.empty().extend(rows), 1)
+    columns.extend(rows)
+
+    bench("gastos por categoria (loop por linha)",
+          lambda: row_by_row_category_totals(rows, month_start, year_end), args.repeat)
+    bench("gastos por categoria (numpy)",
+          lambda: totals_by_category(columns, month_start, year_end, DESPESA), args.repeat)
+    bench("totais por semana do ano", lambda: weekly_totals(columns, year_start, year_end), args.repeat)
+    bench("totais por mês do ano", lambda: monthly_totals(columns, year), args.repeat)
+    bench("resumo do ano completo", lambda: year_summary(columns, year, today.month), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
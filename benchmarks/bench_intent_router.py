@@ -0,0 +1,57 @@
+"""Benchmark do roteador de intenções: mensagens por segundo.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_intent_router --messages 200000
+"""
+import argparse
+import itertools
+import time
+
+from main import router
+
+MENSAGENS = [
+    'gasto 15 reais coxinha',
+    'ganhei 100 reais de bico',
+    'agendar reunião amanhã às 10h',
+    'eventos de hoje',
+    'eventos de amanhã',
+    'excluir evento reunião',
+    'mudar nome do evento reunião para time meeting',
+    'total do mes',
+    'gastos por categoria',
+    'resumo do ano',
+    'bom dia, tudo bem?',
+    'gasto alguma coisa',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    router.compile()
+    print(f"{len(router.intents())} intenções compiladas em {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    messages = list(itertools.islice(itertools.cycle(MENSAGENS), args.messages))
+    match = router.match
+    started = time.perf_counter()
+    for message in messages:
+        match(message)
+    elapsed = time.perf_counter() - started
+    print(f"{args.messages} mensagens em {elapsed:.3f} s "
+          f"({args.messages / elapsed:,.0f} mensagens/s, {elapsed / args.messages * 1e6:.2f} µs/mensagem)")
+
+    print("\nPor mensagem:")
+    for message in MENSAGENS:
+        started = time.perf_counter()
+        for _ in range(10_000):
+            match(message)
+        elapsed = (time.perf_counter() - started) / 10_000
+        intent, _ = match(message)
+        print(f"  {message!r:<52} {intent.name if intent else '-':<32} {elapsed * 1e6:6.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
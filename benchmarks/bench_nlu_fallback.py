@@ -0,0 +1,68 @@
+"""Benchmark do fallback por modelo de linguagem: quantas chamadas ao modelo e quanto cada mensagem espera.
+
+Usa o StubClient com uma latência simulada. As mensagens chegam em rajadas
+(como vários chats ao mesmo tempo), com frases repetidas entre os usuários.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_nlu_fallback --messages 2000 --model-latency-ms 400
+    python -m benchmarks.bench_nlu_fallback --batch-window-ms 0 --max-batch 1    # sem lotes
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from benchmarks.load_test_webhook import percentile
+from utils.nlu_fallback import FallbackNLU, StubClient
+
+FRASES = [
+    'quanto gastei esse mês?', 'quanto gastei na semana passada', 'o que tenho amanhã?', 'minha agenda de sexta',
+    'paguei {n} reais no mercado', 'comprei {n} reais de pão', 'recebi {n} reais do freela',
+    'marca dentista sexta às {h}h', 'bom dia!', 'obrigado',
+]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    client = StubClient(latency=args.model_latency_ms / 1000)
+    nlu = FallbackNLU(client, latency_budget=args.budget_ms / 1000, batch_window=args.batch_window_ms / 1000,
+                      max_batch=args.max_batch)
+    latencies = []
+
+    async def one(text):
+        started = time.perf_counter()
+        await nlu.interpret(text)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(args.messages // args.burst):
+        burst = [rng.choice(FRASES).format(n=rng.randint(1, args.distinct), h=rng.randint(8, 18))
+                 for _ in range(args.burst)]
+        await asyncio.gather(*(one(text) for text in burst))
+    elapsed = time.perf_counter() - started
+    await nlu.close()
+    return client.calls, latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--burst', type=int, default=20, help='mensagens que chegam juntas')
+    parser.add_argument('--distinct', type=int, default=50, help='valores diferentes nas frases (menos = mais cache)')
+    parser.add_argument('--model-latency-ms', type=float, default=400)
+    parser.add_argument('--budget-ms', type=float, default=2500)
+    parser.add_argument('--batch-window-ms', type=float, default=30)
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    calls, latencies, elapsed = asyncio.run(run(args))
+    print(f"{len(latencies)} mensagens em rajadas de {args.burst}, modelo simulado com {args.model_latency_ms:.0f} ms")
+    print(f"Chamadas ao modelo: {calls} ({calls / len(latencies):.1%} das mensagens)")
+    print(f"Espera por mensagem: p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms, máx {max(latencies) * 1000:.1f} ms")
+    print(f"Tempo total: {elapsed:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
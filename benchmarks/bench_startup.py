@@ -0,0 +1,117 @@
+"""Benchmark da inicialização: quanto tempo um processo novo leva até responder.
+
+Cada rodada sobe um processo Python novo (como um restart ou um worker a mais),
+com o Telegram e o Google falsos, e mede: import do main.py, montagem da
+aplicação (initialize + post_init), a primeira mensagem respondida e o fim do
+aquecimento em segundo plano.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --importtime    # maiores imports do main.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from benchmarks.fake_backends import FakeServers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = '''
+import time
+started = time.perf_counter()
+import sys, json, asyncio
+import main
+from telegram import Update
+imported = time.perf_counter()
+
+async def run():
+    application = main.build_application()
+    await application.initialize()
+    await application.post_init(application)
+    ready = time.perf_counter()
+    await application.process_update(Update.de_json(json.loads(sys.argv[1]), application.bot))
+    replied = time.perf_counter()
+    await application.bot_data['warm_up']
+    warmed = time.perf_counter()
+    await application.shutdown()
+    await application.post_shutdown(application)
+    return ready, replied, warmed
+
+ready, replied, warmed = asyncio.run(run())
+print(json.dumps({'import': imported - started, 'ready': ready - started,
+                  'first_reply': replied - started, 'warm_up_done': warmed - started}))
+'''
+
+
+def update_for(text):
+    return {'update_id': 1, 'message': {
+        'message_id': 1, 'date': int(time.time()), 'text': text,
+        'chat': {'id': 1, 'type': 'private'}, 'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+    }}
+
+
+def child_env(servers):
+    env = dict(os.environ)
+    env.update(TELEGRAM_TOKEN='123:bench', TELEGRAM_API_URL=servers.telegram_url,
+               GOOGLE_API_ENDPOINT=servers.google_url, SPREADSHEET_ID='bench',
+               PYTHONPATH=ROOT + os.pathsep + env.get('PYTHONPATH', ''))
+    return env
+
+
+def run_once(servers, text):
+    with tempfile.TemporaryDirectory() as directory:
+        spawned = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', _CHILD, json.dumps(update_for(text))],
+                                cwd=directory, env=child_env(servers), capture_output=True, text=True)
+        total = time.perf_counter() - spawned
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    phases['process'] = total
+    return phases
+
+
+def show_importtime(servers, top):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=ROOT, env=child_env(servers), capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    print(f"{'acumulado':>10}  módulo")
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f}ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--text', default='eventos de hoje', help='primeira mensagem enviada ao bot')
+    parser.add_argument('--importtime', action='store_true')
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    with FakeServers() as servers:
+        if args.importtime:
+            show_importtime(servers, args.top)
+            return
+        runs = [run_once(servers, args.text) for _ in range(args.runs)]
+
+    print(f"{args.runs} processos novos, primeira mensagem: {args.text!r}\n")
+    print(f"{'fase (desde o início do processo)':<36} {'mediana':>9} {'pior':>9}")
+    for phase, label in (('import', 'import do main'), ('ready', 'aplicação pronta'),
+                         ('first_reply', 'primeira resposta'), ('warm_up_done', 'aquecimento concluído'),
+                         ('process', 'processo inteiro (com shutdown)')):
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{label:<36} {statistics.median(values):7.0f}ms {max(values):7.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
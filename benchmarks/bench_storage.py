@@ -0,0 +1,95 @@
+"""Benchmark do armazenamento dos lançamentos: planilha (servidor falso local) x SQLite.
+
+Mede gravação (appends em lotes, como a fila de lançamentos faz), total do mês
+(lendo a planilha inteira e somando em Python x consulta indexada no SQLite)
+e a cópia em lote do SQLite para a planilha.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_storage --rows 20000 --batch 50
+"""
+import os
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+from benchmarks.fake_backends import FakeServers
+
+CATEGORIAS = ['Alimentação', 'Transporte', 'Moradia', 'Lazer', 'Saúde', 'Mercado']
+
+
+def synthetic_rows(n_rows, seed=42):
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    rows = []
+    for _ in range(n_rows):
+        entry_date = now - datetime.timedelta(days=rng.randrange(365), seconds=rng.randrange(86400))
+        rows.append([entry_date.strftime('%d/%m/%Y %H:%M:%S'), 'lançamento', round(rng.uniform(1, 300), 2),
+                     'Despesa' if rng.random() < 0.85 else 'Receita', rng.choice(CATEGORIAS)])
+    return rows
+
+
+def sheet_month_totals(read, spreadsheet_id, year, month):
+    """Caminho antigo: baixa a planilha inteira e soma em Python"""
+    from utils.finance_storage import parse_row
+    totals = {}
+    for row in read(spreadsheet_id, 'Sheet1!A2:E'):
+        parsed = parse_row(row)
+        if parsed and parsed[0].year == year and parsed[0].month == month:
+            totals[parsed[3]] = totals.get(parsed[3], 0) + parsed[2]
+    return totals
+
+
+def timed_run(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=50, help='linhas por append (a fila usa 50)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeServers() as servers:
+        # O servidor falso não tem cota: sem isso o agendador seguraria a planilha em ~1 chamada/s
+        os.environ.update(GOOGLE_API_ENDPOINT=servers.google_url,
+                          GOOGLE_SHEETS_RATE='100000', GOOGLE_SHEETS_BURST='100000',
+                          GOOGLE_SHEETS_PROJECT_RATE='100000', GOOGLE_SHEETS_PROJECT_BURST='100000')
+        from utils.finance_storage import SheetsStorage, SQLiteStorage, SheetsMirror
+
+        rows = synthetic_rows(args.rows)
+        batches = [rows[start:start + args.batch] for start in range(0, len(rows), args.batch)]
+        today = datetime.date.today()
+        directory = tempfile.mkdtemp()
+
+        sheets = SheetsStorage()
+        sqlite = SQLiteStorage(os.path.join(directory, 'finance.db'), seed_func=None)
+        print(f"{args.rows} linhas em appends de {args.batch}\n")
+
+        print(f"{'gravação':<34} {'tempo':>10} {'linhas/s':>12}")
+        for label, storage, spreadsheet_id in (('planilha (fake local)', sheets, 'bench'),
+                                               ('sqlite', sqlite, 'bench')):
+            elapsed, _ = timed_run(lambda: [storage.append(spreadsheet_id, batch) for batch in batches])
+            print(f"{label:<34} {elapsed:9.2f}s {args.rows / elapsed:12.0f}")
+
+        print(f"\n{'total do mês':<34} {'melhor':>10}")
+        for label, func in (
+            ('planilha: lê tudo + soma', lambda: sheet_month_totals(sheets.read, 'bench', today.year, today.month)),
+            ('sqlite: consulta indexada', lambda: sqlite.month_totals('bench', today.year, today.month)),
+        ):
+            best = min(timed_run(func)[0] for _ in range(args.repeat))
+            print(f"{label:<34} {best * 1000:8.2f}ms")
+
+        mirror = SheetsMirror(sqlite, append_func=sheets.append)
+        calls_before = servers.google.calls.get('sheets.append', 0)
+        elapsed, sent = timed_run(mirror.run_once)
+        calls = servers.google.calls.get('sheets.append', 0) - calls_before
+        print(f"\ncópia sqlite -> planilha: {sent} linhas em {calls} append(s), {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
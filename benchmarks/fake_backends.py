@@ -0,0 +1,396 @@
+"""Servidores locais que imitam as APIs do Telegram e do Google (Sheets e Calendar).
+
+Guardam tudo em memória e respondem só o que o bot usa. Servem para testes
+de carga e benchmarks sem rede. O Google falso pode simular latência e erros
+de cota (429), como os reais:
+
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:<porta>/   (ver utils/google_auth.py)
+    TELEGRAM_API_URL=http://127.0.0.1:<porta>       (ver main.py)
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_SHEETS_VALUES = re.compile(r'/v4/spreadsheets/(?P<id>[^/]+)/values/(?P<range>[^/?:]+)(?P<append>:append)?')
+_EVENTS = re.compile(r'(?:/calendar/v3)?/calendars/(?P<calendar>[^/]+)/events(?:/(?P<event_id>[^/?]+))?')
+_A1_ROW = re.compile(r'!(?P<column>[A-Z]+)(?P<row>\d+)')
+_CONTENT_ID = re.compile(r'Content-ID:\s*<([^>]+)>', re.IGNORECASE)
+
+
+class FakeGoogle:
+    """Estado em memória da planilha e da agenda falsas.
+
+    latency/jitter (segundos): atraso de cada requisição (um lote conta uma vez).
+    error_rate: fração das chamadas que recebe 429 sem motivo (como os picos do Google).
+    quota: chamadas por minuto de cada API, ex.: {'sheets': 60}; passou disso, 429 com Retry-After.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, quota=None, seed=None):
+        self.lock = threading.Lock()
+        self.sheets = {}
+        self.events = {}
+        self.deleted = set()
+        # Histórico de alterações da agenda: o syncToken é a posição nessa lista
+        self.changes = []
+        self.calls = {}
+        self.rejected = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota = dict(quota or {})
+        # api -> (início da janela de um minuto, chamadas na janela)
+        self._windows = {}
+        self._random = random.Random(seed)
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self._random.uniform(0, self.jitter)
+            time.sleep(self.latency + extra)
+
+    def admit(self, api):
+        """None se a chamada passa; senão (status, resposta, segundos para o Retry-After)"""
+        now = time.monotonic()
+        with self.lock:
+            limit = self.quota.get(api)
+            if limit:
+                started, used = self._windows.get(api, (now, 0))
+                if now - started >= 60:
+                    started, used = now, 0
+                if used >= limit:
+                    self.rejected[api] = self.rejected.get(api, 0) + 1
+                    retry_after = math.ceil(60 - (now - started))
+                    return 429, _quota_error(f'Quota exceeded for {api} (per minute)'), retry_after
+                self._windows[api] = (started, used + 1)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.rejected[api] = self.rejected.get(api, 0) + 1
+                return 429, _quota_error('Rate limit exceeded'), None
+        return None
+
+    # --- Sheets ---
+    def append_rows(self, spreadsheet_id, rows):
+        with self.lock:
+            sheet = self.sheets.setdefault(spreadsheet_id, [])
+            first = len(sheet) + 2
+            sheet.extend([[str(value) for value in row] for row in rows])
+            last = len(sheet) + 1
+        return {'updates': {'spreadsheetId': spreadsheet_id, 'updatedRange': f'Sheet1!A{first}:E{last}',
+                            'updatedRows': len(rows)}}
+
+    def get_rows(self, spreadsheet_id, range_name):
+        match = _A1_ROW.search(range_name)
+        first = int(match.group('row')) if match else 2
+        # Só colunas de uma letra (A-Z), que é o que o bot lê
+        column = ord(match.group('column')) - ord('A') if match else 0
+        with self.lock:
+            rows = [row[column:] for row in self.sheets.get(spreadsheet_id, [])[max(first - 2, 0):]]
+        return {'range': range_name, 'majorDimension': 'ROWS', 'values': rows}
+
+    # --- Calendar ---
+    def _record(self, event):
+        self.changes.append(dict(event))
+
+    def insert_event(self, body):
+        """Evento criado, ou None se o id escolhido pelo cliente já existe (409)"""
+        event = dict(body, status='confirmed')
+        event.setdefault('id', uuid.uuid4().hex)
+        with self.lock:
+            if event['id'] in self.events or event['id'] in self.deleted:
+                return None
+            self.events[event['id']] = event
+            self._record(event)
+        return event
+
+    def get_event(self, event_id):
+        with self.lock:
+            event = self.events.get(event_id)
+            if event is None and event_id in self.deleted:
+                # Como no Google: o evento excluído ainda existe, cancelado
+                return {'id': event_id, 'status': 'cancelled'}
+        return dict(event) if event else None
+
+    def update_event(self, event_id, body, merge=False):
+        with self.lock:
+            if event_id not in self.events:
+                return None
+            base = self.events[event_id] if merge else {}
+            # O PUT manda o evento inteiro (com id e status): os do servidor prevalecem
+            event = {**base, **body, 'id': event_id, 'status': 'confirmed'}
+            self.events[event_id] = event
+            self._record(event)
+        return event
+
+    def delete_event(self, event_id):
+        with self.lock:
+            event = self.events.pop(event_id, None)
+            if event is None:
+                return False
+            self.deleted.add(event_id)
+            self._record({'id': event_id, 'status': 'cancelled'})
+        return True
+
+    def list_events(self, params):
+        with self.lock:
+            if 'syncToken' in params:
+                start = int(params['syncToken'])
+                items = self.changes[start:]
+            else:
+                items = list(self.events.values())
+                query = params.get('q', '').lower()
+                if query:
+                    items = [e for e in items if query in e.get('summary', '').lower()]
+                time_min = params.get('timeMin')
+                time_max = params.get('timeMax')
+                if time_min:
+                    items = [e for e in items if e['start'].get('dateTime', '') >= time_min[:19]]
+                if time_max:
+                    items = [e for e in items if e['start'].get('dateTime', '') <= time_max[:19]]
+            sync_token = str(len(self.changes))
+        return {'items': items, 'nextSyncToken': sync_token}
+
+
+class FakeTelegram:
+    """Estado em memória da API do Telegram falsa: guarda as mensagens enviadas"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []
+        self.edits = []
+        self.condition = threading.Condition(self.lock)
+        self._message_id = 0
+
+    def send_message(self, params):
+        with self.condition:
+            self._message_id += 1
+            message = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+            self.sent.append((time.perf_counter(), message))
+            self.condition.notify_all()
+        return message
+
+    def edit_message(self, params):
+        with self.condition:
+            message = {
+                'message_id': int(params['message_id']),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+            self.edits.append((time.perf_counter(), message))
+        return message
+
+    def wait_for(self, count, timeout):
+        """Espera até count mensagens terem sido enviadas. Retorna True se chegou lá"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.sent) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+
+def _quota_error(message):
+    return {'error': {'code': 429, 'message': message, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em escritas separadas; sem isso cada resposta espera ~40 ms de ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if 'json' in content_type:
+            return json.loads(raw or b'{}')
+        # O python-telegram-bot envia form-urlencoded com valores em JSON
+        return {key: values[0] for key, values in urllib.parse.parse_qs(raw.decode()).items()}
+
+    def _reply(self, status, payload=None, retry_after=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _google_handler(google):
+    class GoogleHandler(_Handler):
+        def _route(self, method, path, query, body):
+            """(status, resposta, Retry-After) de uma chamada; usado também para cada parte de um lote"""
+            path = urllib.parse.unquote(path)
+            rejection = google.admit('sheets' if _SHEETS_VALUES.search(path) else 'calendar')
+            if rejection:
+                return rejection
+            return (*self._call(method, path, query, body), None)
+
+        def _call(self, method, path, query, body):
+            params = {key: values[0] for key, values in urllib.parse.parse_qs(query).items()}
+
+            match = _SHEETS_VALUES.search(path)
+            if match:
+                if match.group('append') and method == 'POST':
+                    google.count('sheets.append')
+                    return 200, google.append_rows(match.group('id'), body().get('values', []))
+                if method == 'GET':
+                    google.count('sheets.get')
+                    return 200, google.get_rows(match.group('id'), match.group('range'))
+
+            match = _EVENTS.search(path)
+            if match:
+                event_id = match.group('event_id')
+                if method == 'GET' and not event_id:
+                    google.count('calendar.list')
+                    return 200, google.list_events(params)
+                if method == 'POST' and not event_id:
+                    google.count('calendar.insert')
+                    event = google.insert_event(body())
+                    return (200, event) if event else (409, {'error': {'code': 409, 'message': 'duplicate'}})
+                if method == 'GET' and event_id:
+                    google.count('calendar.get')
+                    event = google.get_event(event_id)
+                    return (200, event) if event else (404, {'error': {'code': 404}})
+                if method in ('PUT', 'PATCH') and event_id:
+                    google.count(f'calendar.{method.lower()}')
+                    event = google.update_event(event_id, body(), merge=method == 'PATCH')
+                    return (200, event) if event else (404, {'error': {'code': 404}})
+                if method == 'DELETE' and event_id:
+                    google.count('calendar.delete')
+                    if google.delete_event(event_id):
+                        return 204, None
+                    return 404, {'error': {'code': 404}}
+
+            return 404, {'error': {'code': 404, 'message': f'{method} {path} não implementado'}}
+
+        def _batch(self):
+            """Lote HTTP (multipart/mixed): cada parte é uma requisição HTTP completa"""
+            google.count('batch')
+            google.delay()
+            boundary = self.headers.get_param('boundary')
+            raw = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            parts = []
+            for part in raw.split(f'--{boundary}')[1:]:
+                if part.startswith('--'):
+                    break
+                part_headers, _, request = part.strip('\r\n').partition('\r\n\r\n')
+                if not request:
+                    part_headers, _, request = part.strip('\n').partition('\n\n')
+                # Cabeçalhos longos chegam quebrados em várias linhas
+                content_id = ' '.join(_CONTENT_ID.search(part_headers).group(1).split())
+                head, _, payload = request.replace('\r\n', '\n').partition('\n\n')
+                method, target, _ = head.split('\n', 1)[0].split(' ', 2)
+                url = urllib.parse.urlsplit(target)
+                status, result, retry_after = self._route(method, url.path, url.query,
+                                                          lambda: json.loads(payload or '{}'))
+                body = json.dumps(result) if result is not None else ''
+                extra = f'Retry-After: {retry_after}\r\n' if retry_after is not None else ''
+                parts.append(
+                    f'--batch_fake\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                    f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n'
+                    f'{extra}Content-Length: {len(body.encode())}\r\n\r\n{body}\r\n'
+                )
+            data = (''.join(parts) + '--batch_fake--\r\n').encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/mixed; boundary=batch_fake')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, method):
+            url = urllib.parse.urlsplit(self.path)
+            if method == 'POST' and url.path.startswith('/batch'):
+                return self._batch()
+            google.delay()
+            # Lê o corpo antes: uma chamada recusada (429) não pode deixá-lo na conexão
+            body = self._body()
+            self._reply(*self._route(method, url.path, url.query, lambda: body))
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def do_PUT(self):
+            self._handle('PUT')
+
+        def do_PATCH(self):
+            self._handle('PATCH')
+
+        def do_DELETE(self):
+            self._handle('DELETE')
+
+    return GoogleHandler
+
+
+def _telegram_handler(telegram):
+    class TelegramHandler(_Handler):
+        def do_POST(self):
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+            params = self._body()
+            if method == 'getMe':
+                result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'fake_bot',
+                          'can_join_groups': True, 'can_read_all_group_messages': False,
+                          'supports_inline_queries': False}
+            elif method == 'sendMessage':
+                result = telegram.send_message(params)
+            elif method == 'editMessageText':
+                result = telegram.edit_message(params)
+            else:
+                result = True
+            self._reply(200, {'ok': True, 'result': result})
+
+        do_GET = do_POST
+
+    return TelegramHandler
+
+
+class FakeServers:
+    """Sobe os dois servidores falsos em threads, em portas livres.
+    google_options (latency, jitter, error_rate, quota, seed) vão para o FakeGoogle"""
+
+    def __init__(self, host='127.0.0.1', **google_options):
+        self.google = FakeGoogle(**google_options)
+        self.telegram = FakeTelegram()
+        self._servers = [
+            ThreadingHTTPServer((host, 0), _google_handler(self.google)),
+            ThreadingHTTPServer((host, 0), _telegram_handler(self.telegram)),
+        ]
+        for server in self._servers:
+            server.daemon_threads = True
+        self.google_url = f'http://{host}:{self._servers[0].server_address[1]}/'
+        self.telegram_url = f'http://{host}:{self._servers[1].server_address[1]}'
+
+    def __enter__(self):
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
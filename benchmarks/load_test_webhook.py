@@ -0,0 +1,174 @@
+"""Teste de carga do modo webhook contra APIs falsas do Telegram e do Google.
+
+Sobe os servidores falsos (benchmarks/fake_backends.py), inicia o bot em modo
+webhook com N workers e reenvia atualizações gravadas (JSON, uma por linha)
+ou sintéticas. Mede atualizações por segundo, latência até a resposta e
+confere se as respostas de cada chat chegaram na ordem.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.load_test_webhook --workers 4 --chats 50 --messages-per-chat 20
+    python -m benchmarks.load_test_webhook --updates gravadas.jsonl
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_backends import FakeServers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_updates(chats, messages_per_chat):
+    """Mistura de comandos; os gastos têm valores crescentes por chat para conferir a ordem"""
+    updates = []
+    update_id = 0
+    for i in range(messages_per_chat):
+        for chat in range(chats):
+            chat_id = 1000 + chat
+            update_id += 1
+            if i % 10 == 5:
+                text = 'eventos de hoje'
+            elif i % 10 == 9:
+                text = 'total do mes'
+            else:
+                text = f'gasto {i + 1} reais teste carga'
+            updates.append({
+                'update_id': update_id,
+                'message': {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Teste'},
+                    'text': text,
+                },
+            })
+    return updates
+
+
+def load_updates(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', help='arquivo JSONL com atualizações gravadas')
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--messages-per-chat', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32, help='requisições simultâneas ao webhook')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--verbose', action='store_true', help='mostra o log do bot')
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.chats, args.messages_per_chat)
+    port = free_port()
+
+    with FakeServers() as fakes, tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            BOT_MODE='webhook',
+            WEBHOOK_HOST='127.0.0.1',
+            WEBHOOK_PORT=str(port),
+            WEBHOOK_WORKERS=str(args.workers),
+            TELEGRAM_TOKEN='123456:fake',
+            TELEGRAM_API_URL=fakes.telegram_url,
+            GOOGLE_API_ENDPOINT=fakes.google_url,
+            SPREADSHEET_ID='planilha-carga',
+            FINANCE_FLUSH_INTERVAL_MS='200',
+            # Mede o bot, não os limites do Telegram: sem a fila de saída (nem junção de respostas)
+            TELEGRAM_OUTBOX='0',
+        )
+        env.pop('WEBHOOK_URL', None)
+        output = None if args.verbose else subprocess.DEVNULL
+        bot = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=workdir, env=env,
+                               stdout=output, stderr=output)
+        try:
+            if not wait_for_port(port):
+                print("O bot não abriu a porta do webhook a tempo")
+                return 1
+            # Espera os workers avisarem o Telegram falso (getMe) antes de medir
+            time.sleep(2)
+
+            url = f'http://127.0.0.1:{port}/telegram'
+            sent_at = {}
+
+            def post(update):
+                request = urllib.request.Request(url, data=json.dumps(update).encode(),
+                                                 headers={'Content-Type': 'application/json'})
+                chat_id = update['message']['chat']['id']
+                sent_at.setdefault(chat_id, []).append(time.perf_counter())
+                urllib.request.urlopen(request).read()
+
+            started = time.perf_counter()
+            # Cada chat é enviado em sequência (como o Telegram faz); chats diferentes em paralelo
+            by_chat = {}
+            for update in updates:
+                by_chat.setdefault(update['message']['chat']['id'], []).append(update)
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                list(pool.map(lambda chat_updates: [post(u) for u in chat_updates], by_chat.values()))
+            posted = time.perf_counter() - started
+
+            completed = fakes.telegram.wait_for(len(updates), args.timeout)
+            elapsed = time.perf_counter() - started
+        finally:
+            bot.send_signal(signal.SIGTERM)
+            bot.wait(timeout=60)
+
+        replies = fakes.telegram.sent
+        latencies = []
+        replies_by_chat = {}
+        for replied_at, message in replies:
+            replies_by_chat.setdefault(message['chat']['id'], []).append((replied_at, message['text']))
+        out_of_order = 0
+        for chat_id, chat_replies in replies_by_chat.items():
+            for (replied_at, _), posted_at in zip(chat_replies, sent_at.get(chat_id, [])):
+                latencies.append(replied_at - posted_at)
+            valores = [float(text.split('R$')[1].split()[0]) for _, text in chat_replies if text.startswith('Despesa')]
+            out_of_order += sum(1 for a, b in zip(valores, valores[1:]) if b < a)
+
+        print(f"Atualizações enviadas: {len(updates)} ({len(by_chat)} chats, {args.workers} workers)")
+        print(f"Respostas recebidas:   {len(replies)}{'' if completed else ' (tempo esgotado)'}")
+        print(f"Envio ao webhook:      {posted:.2f} s")
+        print(f"Tempo total:           {elapsed:.2f} s ({len(replies) / elapsed:,.0f} atualizações/s)")
+        print(f"Latência p50/p95/p99:  {percentile(latencies, 50) * 1000:.1f} / "
+              f"{percentile(latencies, 95) * 1000:.1f} / {percentile(latencies, 99) * 1000:.1f} ms")
+        print(f"Respostas fora de ordem: {out_of_order}")
+        print(f"Chamadas ao Google falso: {fakes.google.calls}")
+        return 0 if completed and not out_of_order else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
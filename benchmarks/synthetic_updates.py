@@ -0,0 +1,93 @@
+"""Gerador de atualizações sintéticas do Telegram, por fluxo do bot.
+
+Cada chat recebe uma sequência de mensagens sorteadas entre os fluxos
+(lançamento, agendamento, listagem, exclusão, edição e total do mês). As
+exclusões e edições só apontam para eventos que o próprio chat agendou antes,
+com títulos únicos (um não contém o outro), então cada uma acha exatamente um evento.
+
+    from benchmarks.synthetic_updates import generate
+    for flow, update in generate(chats=10, messages_per_chat=20): ...
+"""
+import time
+import random
+
+FLOWS = ('finance', 'schedule', 'list', 'delete', 'edit', 'total')
+
+# Peso de cada fluxo no sorteio (parecido com o uso real: muitos lançamentos, poucas edições)
+DEFAULT_MIX = {'finance': 5, 'schedule': 2, 'list': 2, 'delete': 1, 'edit': 1, 'total': 1}
+
+CATEGORIAS = ['alimentação', 'transporte', 'mercado', 'lazer', 'saúde']
+DESCRICOES = ['coxinha', 'uber', 'feira', 'cinema', 'farmácia', 'almoço', 'padaria']
+TITULOS = ['reunião', 'dentista', 'academia', 'inglês', 'call', 'almoço']
+
+
+def parse_mix(text):
+    """'finance=4,list=1' -> {'finance': 4, 'list': 1}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in FLOWS:
+            raise ValueError(f"Fluxo desconhecido: {name!r} (use {', '.join(FLOWS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def make_update(update_id, chat_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Teste'},
+            'text': text,
+        },
+    }
+
+
+class _Chat:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.events = []
+        self.created = 0
+
+
+def _message(flow, chat, rng):
+    """Texto da mensagem do fluxo; exclusão/edição sem evento disponível viram agendamento"""
+    if flow in ('delete', 'edit') and not chat.events:
+        flow = 'schedule'
+    if flow == 'finance':
+        if rng.random() < 0.15:
+            return flow, f"ganhei {rng.randint(50, 2000)} reais salário {rng.choice(DESCRICOES)}"
+        return flow, f"gasto {rng.randint(1, 300)} reais {rng.choice(CATEGORIAS)} {rng.choice(DESCRICOES)}"
+    if flow == 'schedule':
+        chat.created += 1
+        title = f"{rng.choice(TITULOS)} c{chat.chat_id} n{chat.created:04d}"
+        chat.events.append(title)
+        return flow, f"agendar {title} {rng.choice(['hoje', 'amanhã'])} às {rng.randint(8, 20)}h"
+    if flow == 'list':
+        return flow, f"eventos de {rng.choice(['hoje', 'amanhã'])}"
+    if flow == 'delete':
+        title = chat.events.pop(rng.randrange(len(chat.events)))
+        return flow, f"excluir evento {title}"
+    if flow == 'edit':
+        index = rng.randrange(len(chat.events))
+        chat.created += 1
+        new_title = f"{rng.choice(TITULOS)} c{chat.chat_id} n{chat.created:04d}"
+        old_title, chat.events[index] = chat.events[index], new_title
+        return flow, f"mudar nome do evento {old_title} para {new_title}"
+    return flow, "total do mes"
+
+
+def generate(chats=10, messages_per_chat=20, mix=None, seed=42, first_chat_id=1000):
+    """Lista de (fluxo, atualização), intercalando os chats (a ordem dentro de cada chat importa)"""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    flows, weights = zip(*mix.items())
+    states = [_Chat(first_chat_id + index) for index in range(chats)]
+    updates = []
+    for _ in range(messages_per_chat):
+        for chat in states:
+            flow, text = _message(rng.choices(flows, weights)[0], chat, rng)
+            updates.append((flow, make_update(len(updates) + 1, chat.chat_id, text)))
+    return updates
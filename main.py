@@ -1,7 +1,12 @@
 import logging
 import os.path
 import datetime
-import re
+import asyncio
+import math
+import time
+import tempfile
+import importlib
+import contextlib
 
 from telegram import Update
 from telegram.ext import (
@@ -11,36 +16,68 @@ from telegram.ext import (
     MessageHandler, 
     filters
 )
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from utils.gdrive_utils import add_finance_entry
-from utils.gcalendar_utils import create_calendar_event, list_calendar_events, delete_calendar_event, update_calendar_event 
-
-# If modifying these scopes, delete the file token.json.
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/calendar"]
+from utils.google_auth import (
+    get_google_creds, get_spreadsheet_id, current_tenant, set_tenant_registry, needs_authorization, warm_up
+)
+from utils.async_google import (
+    create_calendar_event_async,
+    delete_calendar_event_async,
+    update_calendar_event_async,
+    create_calendar_events_async,
+    delete_calendar_events_async,
+    patch_calendar_events_async,
+    run_google_call,
+    run_long_call,
+    shutdown as shutdown_google_calls
+)
+from utils.finance_queue import FinanceWriteQueue, JOURNAL_PATH as FINANCE_JOURNAL_PATH
+from utils.ledger_cache import LedgerCache, LEDGER_PATH
+from utils.finance_storage import (
+    SheetsMirror, get_storage, add_write_listener, remove_write_listener, FINANCE_STORAGE, MIRROR_ENABLED
+)
+from utils.finance_alerts import FinanceAlerts, digest_offset, DIGEST_HOUR
+from utils.intent_router import IntentRouter
+from utils.calendar_cache import CalendarCache, event_start, shifted_times, LOCAL_TZ
+from utils.gcalendar_utils import event_body
+from utils.webhook_server import run_webhook, worker_path, orphan_worker_paths
+from utils.tenant_registry import TenantRegistry, LRUCache, TENANT_STORE_KEY, TENANT_CACHE_SIZE
+from utils.metrics import render_text, start_metrics_server, METRICS_PORT
+from utils.telegram_request import TimedHTTPXRequest
+from utils.telegram_outbox import OutboundLimiter, ProgressMessage, OUTBOX_ENABLED
+from utils.statement_import import import_statement, StatementError
+from utils.chat_sessions import SessionStore, LastEntry
+from utils.date_parser import split_schedule, parse_period, month_of
+from utils.nlu_fallback import FallbackNLU, make_client, NLU_BACKEND
+from utils.update_journal import (
+    UpdateJournal, JournaledApplication, ChatOrderedUpdateProcessor, replay, idempotency_key, calendar_event_id,
+    UPDATE_JOURNAL_ENABLED
+)
 
 # The ID and range of a sample spreadsheet.
 SAMPLE_SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 
-# --- Google Authentication Setup ---
-def get_google_creds():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(os.getenv("GOOGLE_CREDENTIALS_JSON"), SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    return creds
+# "polling" (padrão, um processo) ou "webhook" (servidor HTTP + vários processos)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Permite apontar o bot para outro servidor da API do Telegram (ex.: teste de carga)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Máximo de ocorrências criadas por um agendamento repetido
+MAX_RECURRING_EVENTS = 100
+
+# Quantos eventos mostrar quando a busca por título encontra mais de um
+MAX_CHOICES = 10
+
+# Maior extrato aceito (o Telegram só deixa bots baixarem arquivos de até 20 MB)
+MAX_STATEMENT_BYTES = 20 * 1024 * 1024
+# Quanto tempo a resposta espera pela importação do extrato (vários appends);
+# depois disso ela continua em segundo plano e o resultado aparece na mesma mensagem
+IMPORT_TIMEOUT = float(os.getenv("IMPORT_TIMEOUT", "300"))
+
+# IDs do Telegram (separados por vírgula) que podem usar o /stats
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
 
 # --- Telegram Bot Functions ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -57,12 +94,23 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         *Comandos Financeiros:*
         - Para registrar um gasto, digite algo como: `gasto 15 reais coxinha`
         - Para registrar uma receita, digite: `ganhei 100 reais de bico`
+        - Para desfazer o último lançamento, digite: `desfazer último gasto`
+        - Para ver o resumo do mês, digite: `total do mes` (ou `total da semana`, `gastos de março`, `total de 01/10 a 15/10`)
+        - Para ver os gastos do mês por categoria, digite: `gastos por categoria` (ou `gastos por categoria do mês passado`)
+        - Para ver o resumo do ano, digite: `resumo do ano`
+        - Para importar um extrato do banco, envie o arquivo CSV ou OFX
+        - Para definir um orçamento mensal: `orçamento alimentação 500` (e `orçamentos` para ver como está)
+        - Para receber um resumo todo dia ou toda segunda: `resumo diário` ou `resumo semanal` (`parar resumo` cancela)
 
         *Comandos de Agenda:*
-        - Para agendar um evento, digite: `agendar reunião amanhã às 10h`
-        - Para listar eventos, digite: `eventos de hoje` ou `eventos de amanhã`
+        - Para agendar um evento, digite: `agendar reunião amanhã às 10h` (ou `agendar dentista sexta às 14h30 por 2 horas`, `agendar curso 25/12 das 9h às 12h`)
+        - Para listar eventos, digite: `eventos de hoje`, `eventos de sexta` ou `eventos da semana`
         - Para editar um evento, digite: `mudar nome do evento reunião para time meeting`
         - Para excluir um evento, digite: `excluir evento reunião de amanhã`
+        - Depois de listar os eventos, para excluir um deles pelo número: `excluir 2`
+        - Para excluir todos os eventos do dia: `excluir eventos de amanhã`
+        - Para mover os eventos do dia: `mover todos os eventos de hoje para sexta`
+        - Para repetir um evento: `agendar academia às 7h todos os dias por 10 dias` ou `agendar inglês às 19h toda terça por 8 semanas`
 
         *Outros Comandos:*
         - /start: Inicia a conversa com o bot.
@@ -71,259 +119,938 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
 
-# Novo handler para processar a mensagem do usuário
-async def processar_mensagem(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_message = update.message.text.lower()
-    
-    # Lógica para registrar gastos ou receitas
-    if "gasto" in user_message or "ganhei" in user_message:
-        try:
-            # Padrão para encontrar valor e descrição
-            match_gasto = re.search(r'(gasto|ganhei)\s(\d+)\sreais\s(.+)', user_message)
-            if match_gasto:
-                valor = float(match_gasto.group(2))
-                descricao_completa = match_gasto.group(3)
-                tipo = "Despesa" if "gasto" in user_message else "Receita"
-                
-                # Assume que a primeira palavra da descrição é a categoria
-                categoria = descricao_completa.split()[0].capitalize()
-                descricao = ' '.join(descricao_completa.split()[1:])
-                
-                # Adiciona a entrada na planilha
-                values = [[
-                    datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                    descricao,
-                    valor,
-                    tipo,
-                    categoria
-                ]]
-                add_finance_entry(SAMPLE_SPREADSHEET_ID, values)
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"{tipo} de R${valor:.2f} com '{descricao}' na categoria '{categoria}' registrado com sucesso!"
-                )
-            else:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="Não entendi o formato. Tente 'gasto 15 reais coxinha'."
-                )
-        except Exception as e:
-            logging.error(f"Erro ao processar mensagem de gasto: {e}")
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Ocorreu um erro ao registrar seu gasto. Por favor, tente novamente."
-            )
-    
-    # Lógica para agendar eventos
-    elif "agendar" in user_message:
-        # Padrão flexível para capturar o evento e a hora (com ou sem 'h', com ou sem 'amanhã')
-        match_agendar = re.search(r'agendar\s(.+?)\s(?:(hoje|amanh[aã])\s)?(?:às|as)\s(\d{1,2})h?', user_message)
-
-        if match_agendar:
-            title = match_agendar.group(1).strip()
-            day_str = match_agendar.group(2)
-            hour_str = match_agendar.group(3)
-
-            now = datetime.datetime.now()
-            event_date = now
-
-            if day_str and 'amanhã' in day_str:
-                event_date += datetime.timedelta(days=1)
-
-            try:
-                hour = int(hour_str)
-                # Lógica para converter o horário para o formato correto (12h/24h)
-                event_hour = hour
-                if hour >= 1 and hour <= 11 and (now.hour >= 12 or hour < now.hour):
-                    event_hour += 12
-                
-                event_datetime = event_date.replace(hour=event_hour, minute=0, second=0, microsecond=0)
-
-                create_calendar_event(
-                    summary=title,
-                    start_time=event_datetime.isoformat(),
-                    duration="1h"
-                )
-                
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Evento '{title}' agendado para {event_datetime.strftime('%d/%m/%Y às %Hh')}."
-                )
-
-            except ValueError:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="Não consegui entender a hora. Tente um formato como '14h'."
-                )
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Latências p50/p95/p99 por operação (só para administradores)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    worker_id = context.bot_data.get('worker_id')
+    header = f"Processo {worker_id}\n" if worker_id is not None else ""
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=header + render_text())
+
+# Cada usuário cadastrado tem sua própria agenda, então o cache da agenda é por usuário
+def calendar_cache_for(context: ContextTypes.DEFAULT_TYPE):
+    return context.bot_data['calendar_caches'].get_or_create(current_tenant.get(), CalendarCache)
+
+# --- Intenções reconhecidas nas mensagens ---
+# Todos os padrões são compilados num único regex. A prioridade desempata
+# quando dois padrões casam na mesma posição (o mais específico primeiro).
+router = IntentRouter()
+
+# Relatórios
+def report_engine_for(context: ContextTypes.DEFAULT_TYPE):
+    """Motor dos relatórios. O NumPy só é importado aqui (ou no aquecimento), não na inicialização"""
+    report_engine = context.bot_data.get('report_engine')
+    if report_engine is None:
+        from utils.finance_reports import ReportEngine
+        report_engine = context.bot_data.setdefault('report_engine', ReportEngine(context.bot_data['ledger']))
+    return report_engine
+
+@router.intent('gastos_por_categoria', r'gastos por categoria(?:\s(?P<periodo>.+))?', priority=20)
+async def gastos_por_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    from utils.finance_reports import format_category_report
+    period = parse_period(groups['periodo'] or 'mês', future=False)
+    if period is None:
+        await periodo_invalido(update, context)
+        return
+    report_engine = report_engine_for(context)
+    totals = await run_google_call(report_engine.category_report, get_spreadsheet_id(SAMPLE_SPREADSHEET_ID), period.start, period.end)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=format_category_report(totals, period.label),
+        parse_mode="Markdown"
+    )
+
+@router.intent('resumo_do_ano', r'resumo do ano', priority=20)
+async def resumo_do_ano(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    from utils.finance_reports import format_year_summary
+    now = datetime.datetime.now()
+    report_engine = report_engine_for(context)
+    summary = await run_google_call(report_engine.year_report, get_spreadsheet_id(SAMPLE_SPREADSHEET_ID), now.year, now.month)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=format_year_summary(summary),
+        parse_mode="Markdown"
+    )
+
+async def periodo_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o período. Tente 'total do mês', 'gastos de março', 'total da semana' ou 'total de 01/10 a 15/10'."
+    )
+
+def period_totals(ledger, finance_queue, spreadsheet_id, period):
+    """Totais por tipo do período e se há algum dado. Além da planilha, soma as linhas que
+    ainda estão na fila de envio (o usuário vê o lançamento que acabou de fazer)"""
+    month = month_of(period)
+    if month:
+        # Mês inteiro: sincroniza só as linhas novas da planilha e lê os totais pré-calculados
+        totals = ledger.synced_month_totals(spreadsheet_id, *month)
+    else:
+        totals = ledger.synced_period_totals(spreadsheet_id, period.start, period.end)
+
+    pending = finance_queue.pending_entries(spreadsheet_id)
+    # Um envio em andamento pode já ter chegado ao ledger: a chave evita contar duas vezes
+    # (linhas sem chave em envio já vêm de fora de pending_entries)
+    arrived = ledger.known_keys(spreadsheet_id, [key for key, _ in pending if key])
+    for key, (entry_date, _, valor, tipo, _) in pending:
+        if key not in arrived and period.start <= entry_date.date() < period.end:
+            totals[tipo] = totals.get(tipo, 0) + valor
+    return totals, bool(pending) or bool(ledger.rows_synced(spreadsheet_id))
+
+# Lógica para mostrar totais financeiros ("total do mês", "gastos de março", "total da semana passada")
+@router.intent('total_do_periodo', r'(?:total|gastos)\s(?:d[eoa]s?\s|n[ao]s?\s|em\s)(?P<periodo>.+)', priority=20)
+async def total_do_periodo(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    period = parse_period(groups['periodo'], future=False)
+    if period is None:
+        await periodo_invalido(update, context)
+        return
+
+    spreadsheet_id = get_spreadsheet_id(SAMPLE_SPREADSHEET_ID)
+    month = month_of(period)
+    totals, has_data = await run_google_call(
+        period_totals, context.bot_data['ledger'], context.bot_data['finance_queue'], spreadsheet_id, period
+    )
+
+    if not has_data:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não consegui encontrar dados na sua planilha."
+        )
+        return
+
+    total_despesas = totals.get("Despesa", 0)
+    total_receitas = totals.get("Receita", 0)
+
+    today = datetime.date.today()
+    title = "Resumo do Mês" if month == (today.year, today.month) else f"Resumo de {period.label}"
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"*{title}:*\n"
+             f"Total de Despesas: R${total_despesas:.2f}\n"
+             f"Total de Receitas: R${total_receitas:.2f}\n"
+             f"Saldo: R${total_receitas - total_despesas:.2f}",
+        parse_mode="Markdown"
+    )
+
+# Orçamentos mensais por categoria (os avisos saem quando os lançamentos são gravados)
+@router.intent(
+    'definir_orcamento',
+    r'or[cç]amento\s(?:de\s|para\s)?(?P<categoria>[^\d]+?)\s(?:de\s)?(?:r\$\s?)?(?P<valor>\d+(?:[.,]\d{1,2})?)',
+    priority=10
+)
+async def definir_orcamento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    categoria = groups['categoria'].strip().capitalize()
+    valor = float(groups['valor'].replace(',', '.'))
+    if valor <= 0:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="O orçamento precisa ser maior que zero.")
+        return
+    context.bot_data['finance_alerts'].set_budget(
+        update.effective_chat.id, get_spreadsheet_id(SAMPLE_SPREADSHEET_ID), categoria, valor, current_tenant.get()
+    )
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"Orçamento de {categoria} definido em R${valor:.2f} por mês. Aviso quando passar de 80% e de 100%."
+    )
+
+@router.intent(
+    'remover_orcamento',
+    r'(?:remover|excluir|apagar|cancelar)\s(?:o\s)?or[cç]amento\s(?:de\s)?(?P<categoria>.+)',
+    priority=20, whole_message=True
+)
+async def remover_orcamento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    categoria = groups['categoria'].strip()
+    if context.bot_data['finance_alerts'].remove_budget(update.effective_chat.id, categoria):
+        text = f"Orçamento de {categoria.capitalize()} removido."
+    else:
+        text = f"Não encontrei orçamento de {categoria.capitalize()}."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+@router.intent('listar_orcamentos', r'(?:meus\s)?or[cç]amentos')
+async def listar_orcamentos(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    status = await run_google_call(context.bot_data['finance_alerts'].budget_status, update.effective_chat.id)
+    if not status:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Nenhum orçamento definido. Tente 'orçamento alimentação 500'."
+        )
+        return
+    lines = ["Orçamentos do mês:"]
+    for budget, spent in status:
+        lines.append(f"- {budget.label}: R${spent:.2f} de R${budget.amount:.2f} ({spent / budget.amount:.0%})")
+    await context.bot.send_message(chat_id=update.effective_chat.id, text="\n".join(lines))
+
+@router.intent('orcamento_invalido', r'or[cç]amento')
+async def orcamento_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o orçamento. Tente 'orçamento alimentação 500'."
+    )
+
+# Resumos periódicos (enviados pelo JobQueue, ver digest_job)
+@router.intent('assinar_resumo', r'resumo\s(?P<frequencia>di[aá]rio|semanal)', priority=20)
+async def assinar_resumo(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    frequencia = 'semanal' if groups['frequencia'] == 'semanal' else 'diario'
+    context.bot_data['finance_alerts'].subscribe(
+        update.effective_chat.id, get_spreadsheet_id(SAMPLE_SPREADSHEET_ID), frequencia, current_tenant.get()
+    )
+    quando = "toda segunda-feira" if frequencia == 'semanal' else "todo dia"
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"Combinado! Vou mandar o resumo das suas finanças {quando} de manhã. Digite 'parar resumo' para cancelar."
+    )
+
+@router.intent('cancelar_resumo', r'(?:parar|cancelar)\s(?:o\s)?resumo', priority=20)
+async def cancelar_resumo(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    if context.bot_data['finance_alerts'].unsubscribe(update.effective_chat.id):
+        text = "Resumo cancelado."
+    else:
+        text = "Você não recebe resumos."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+# Lógica para registrar gastos ou receitas
+@router.intent('registrar_lancamento', r'(?P<tipo>gasto|ganhei)\s(?P<valor>\d+)\sreais\s(?P<descricao>.+)', priority=10)
+async def registrar_lancamento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    try:
+        valor = float(groups['valor'])
+        descricao_completa = groups['descricao']
+        tipo = "Despesa" if groups['tipo'] == "gasto" else "Receita"
+
+        # Assume que a primeira palavra da descrição é a categoria
+        categoria = descricao_completa.split()[0].capitalize()
+        descricao = ' '.join(descricao_completa.split()[1:])
+
+        # Grava no diário local; a fila envia para a planilha em lote
+        row = [
+            datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+            descricao,
+            valor,
+            tipo,
+            categoria
+        ]
+        spreadsheet_id = get_spreadsheet_id(SAMPLE_SPREADSHEET_ID)
+        # A chave da atualização impede o lançamento em dobro num reenvio ou replay
+        journal_id = context.bot_data['finance_queue'].enqueue(spreadsheet_id, row, key=idempotency_key(update))
+        # Lembrado para o "desfazer último gasto"
+        context.bot_data['sessions'].remember_entry(update.effective_chat.id, LastEntry(journal_id, spreadsheet_id, row))
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"{tipo} de R${valor:.2f} com '{descricao}' na categoria '{categoria}' registrado com sucesso!"
+        )
+    except Exception as e:
+        logging.error(f"Erro ao processar mensagem de gasto: {e}")
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Ocorreu um erro ao registrar seu gasto. Por favor, tente novamente."
+        )
+
+@router.intent(
+    'desfazer_lancamento',
+    r'desfazer(?:\s(?:o\s)?[uú]ltimo\s(?:gasto|ganho|lan[cç]amento|registro|receita))?',
+    priority=10, whole_message=True
+)
+async def desfazer_lancamento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    entry = context.bot_data['sessions'].pop_entry(update.effective_chat.id)
+    if entry is None:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não encontrei nenhum lançamento recente seu para desfazer."
+        )
+        return
+
+    _, descricao, valor, tipo, categoria = entry.row
+    finance_queue = context.bot_data['finance_queue']
+    if finance_queue.cancel(entry.journal_id):
+        # Ainda estava só no diário local: nada chegou à planilha
+        text = f"{tipo} de R${valor:.2f} com '{descricao}' desfeito."
+    else:
+        # Já foi para a planilha, que só cresce por append: lança o estorno (valor negativo)
+        estorno = [datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S"), f"Estorno: {descricao}", -valor, tipo, categoria]
+        finance_queue.enqueue(entry.spreadsheet_id, estorno, key=idempotency_key(update))
+        text = f"{tipo} de R${valor:.2f} com '{descricao}' já estava na planilha; lancei um estorno de R${valor:.2f}."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+@router.intent('registrar_lancamento_invalido', r'gasto|ganhei')
+async def registrar_lancamento_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o formato. Tente 'gasto 15 reais coxinha'."
+    )
+
+# Lógica para agendar eventos
+# Data, hora e duração ficam no fim: "agendar dentista sexta às 14h30 por 2 horas", "agendar curso dia 25 das 9h às 12h"
+@router.intent('agendar', r'agendar\s(?P<texto>.+)', priority=10)
+async def agendar(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    title, when = split_schedule(groups['texto'])
+    if when is None or not title:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não consegui entender a data ou a hora. Tente algo como `agendar reunião amanhã às 14h` "
+                 "ou `agendar dentista sexta às 9h30 por 2 horas`."
+        )
+        return
+
+    if when.all_day:
+        start_time = when.start.date().isoformat()
+        when_text = f"{when.start.strftime('%d/%m/%Y')} (dia inteiro)"
+    else:
+        start_time = when.start.isoformat()
+        when_text = f"{when.start.strftime('%d/%m/%Y')} às {_hour_text(when.start)}"
+        if when.end:
+            when_text += f" até {_hour_text(when.end)}"
+
+    event = await create_calendar_event_async(
+        summary=title,
+        start_time=start_time,
+        duration=when.end - when.start if when.end else None,
+        event_id=calendar_event_id(idempotency_key(update))
+    )
+    if event is None:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não consegui criar o evento na agenda agora. Por favor, tente novamente."
+        )
+        return
+    calendar_cache_for(context).apply(event)
+
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"Evento '{title}' agendado para {when_text}."
+    )
+
+def _hour_text(moment):
+    return moment.strftime('%Hh') if moment.minute == 0 else moment.strftime('%Hh%M')
+
+@router.intent('agendar_invalido', r'agendar')
+async def agendar_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o formato. Tente `agendar nome do evento amanhã às 14h`."
+    )
+
+# Agendamento repetido: cria todas as ocorrências num único lote
+DIAS_DA_SEMANA = {'segunda': 0, 'terca': 1, 'terça': 1, 'quarta': 2, 'quinta': 3, 'sexta': 4,
+                  'sabado': 5, 'sábado': 5, 'domingo': 6}
+
+def recurrence_count(count, unit, weekly):
+    """Quantas ocorrências criar: "por 10 dias" numa regra semanal são 2, "por 2 semanas"
+    numa diária são 14; "por N vezes" (ou sem unidade) são N"""
+    if count is None:
+        return 4 if weekly else 7
+    if unit == 'dias' and weekly:
+        return math.ceil(count / 7)
+    if unit == 'semanas' and not weekly:
+        return count * 7
+    return count
+
+@router.intent(
+    'agendar_repetido',
+    r'agendar\s(?P<texto>.+?)\s'
+    r'(?:todos os dias|toda\s(?P<weekday>segunda|ter[cç]a|quarta|quinta|sexta)|todo\s(?P<weekend>s[aá]bado|domingo))'
+    r'(?:\spor\s(?P<count>\d+)\s(?P<unit>dias|semanas|vezes))?',
+    priority=15
+)
+async def agendar_repetido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    weekday = groups['weekday'] or groups['weekend']
+    count = min(recurrence_count(groups['count'] and int(groups['count']), groups['unit'], bool(weekday)),
+                MAX_RECURRING_EVENTS)
+
+    # O horário é o mesmo do "agendar" ("às 7h30", "10:30", "3 da tarde"). Resolvido a partir
+    # da meia-noite, vale como escrito ("às 9" não vira 21h por já ter passado das 9 hoje)
+    now = datetime.datetime.now()
+    title, when = split_schedule(groups['texto'], now.replace(hour=0, minute=0, second=0, microsecond=0))
+    if when is None or when.all_day or not title:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não consegui entender a hora. Tente `agendar academia às 7h30 todos os dias`."
+        )
+        return
+
+    first = when.start
+    if weekday:
+        first += datetime.timedelta(days=(DIAS_DA_SEMANA[weekday] - first.weekday()) % 7)
+    step = datetime.timedelta(days=7 if weekday else 1)
+    while first <= now:
+        first += step
+    duration = when.end - when.start if when.end else None
+    starts = [first + step * index for index in range(count)]
+
+    bodies = [dict(event_body(title, start.isoformat(), duration), id=calendar_event_id(idempotency_key(update, index)))
+              for index, start in enumerate(starts)]
+    results = await create_calendar_events_async(bodies)
+    calendar_cache = calendar_cache_for(context)
+    failed = []
+    for start, (event, error) in zip(starts, results):
+        if error is None:
+            calendar_cache.apply(event)
         else:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Não entendi o formato. Tente `agendar nome do evento amanhã às 14h`."
-            )
-    
-   # Lógica para listar eventos
-    elif "eventos" in user_message:
-        target_date = datetime.datetime.now().date()
-        date_text = "hoje"
-        
-        if "amanha" in user_message:
-            target_date += datetime.timedelta(days=1)
-            date_text = "amanhã"
-        
-        # Converte a data para um formato que a API do Google entenda
-        time_min = datetime.datetime.combine(target_date, datetime.time.min).isoformat() + 'Z'
-        time_max = datetime.datetime.combine(target_date, datetime.time.max).isoformat() + 'Z'
-        
-        events = list_calendar_events(time_min=time_min, time_max=time_max)
-        
-        if not events:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"Nenhum evento encontrado para {date_text}."
-            )
-            return
+            failed.append(start)
+
+    created = len(starts) - len(failed)
+    text = f"{created} evento(s) '{title}' agendados de {starts[0].strftime('%d/%m')} a {starts[-1].strftime('%d/%m')} às {_hour_text(starts[0])}."
+    if failed:
+        text += "\nNão consegui criar: " + ", ".join(start.strftime('%d/%m') for start in failed)
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+# Lógica para listar eventos
+# "eventos", "eventos de sexta", "eventos da semana", "eventos de 20/12 a 05/01"
+@router.intent('listar_eventos', r'eventos(?:\s+(?P<periodo>.+))?')
+async def listar_eventos(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    period = parse_period(groups['periodo'] or 'hoje')
+    if period is None:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não entendi o dia. Tente 'eventos de amanhã', 'eventos de sexta' ou 'eventos da semana'."
+        )
+        return
+    date_text = period.label
+
+    # Lê do cache local da agenda (sincronizado por syncToken)
+    events = await run_google_call(
+        calendar_cache_for(context).events_between,
+        datetime.datetime.combine(period.start, datetime.time.min),
+        datetime.datetime.combine(period.end, datetime.time.min)
+    )
+
+    if not events:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Nenhum evento encontrado para {date_text}."
+        )
+        return
+
+    # Lembrada para "excluir 2" não precisar buscar de novo
+    context.bot_data['sessions'].remember_events(update.effective_chat.id, events, date_text)
+
+    response_text = f"Seus eventos para {date_text}:\n"
+    for i, event in enumerate(events):
+        # Formata a data e hora para ficar mais bonita
+        start_time_obj = event_start(event)
+        formatted_time = start_time_obj.strftime('%d/%m às %Hh:%M')
+        response_text += f"*{i+1}. {event['summary']}* - {formatted_time}\n"
+    response_text += "\nPara excluir um deles, digite `excluir` e o número."
+
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=response_text,
+        parse_mode="Markdown"
+    )
+
+# Lógica para excluir eventos
+# As intenções que apagam só valem com a mensagem inteira ("não vou excluir evento x" não exclui)
+@router.intent('excluir_evento', r'excluir evento (?P<title>.+)', priority=10, whole_message=True)
+async def excluir_evento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    event_title = groups['title'].strip()
+
+    calendar_cache = calendar_cache_for(context)
+    events = await run_google_call(_search_events, calendar_cache, event_title)
+
+    if not events:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Não encontrei nenhum evento com o nome '{event_title}' para excluir."
+        )
+        return
 
-        response_text = f"Seus eventos para {date_text}:\n"
-        for i, event in enumerate(events):
-            # Formata a data e hora para ficar mais bonita
-            start_time_obj = datetime.datetime.fromisoformat(event['start'].get('dateTime'))
-            formatted_time = start_time_obj.strftime('%d/%m às %Hh:%M')
-            response_text += f"*{i+1}. {event['summary']}* - {formatted_time}\n"
-        
+    if len(events) > 1:
+        # Mais de um evento com esse nome: pergunta qual, em vez de excluir o primeiro
+        choices = events[:MAX_CHOICES]
+        context.bot_data['sessions'].remember_events(update.effective_chat.id, choices, f"'{event_title}'")
+        lines = [f"{i}. {_event_line(event)}" for i, event in enumerate(choices, start=1)]
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=response_text,
-            parse_mode="Markdown"
+            text=f"Encontrei {len(events)} eventos com '{event_title}':\n" + "\n".join(lines)
+                 + "\nQual deles? Digite 'excluir' e o número."
         )
+        return
+
+    await _delete_event(update, context, events[0]['id'], events[0]['summary'])
 
-    # Lógica para excluir eventos
-    elif "excluir evento" in user_message:
-        match_delete = re.search(r'excluir evento (.+)', user_message)
-        if match_delete:
-            event_title = match_delete.group(1).strip()
-            
-            events = list_calendar_events(query=event_title)
-            
-            if not events:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Não encontrei nenhum evento com o nome '{event_title}' para excluir."
-                )
-                return
-            
-            event_id_to_delete = events[0]['id']
-            
-            if delete_calendar_event(event_id_to_delete):
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Evento '{events[0]['summary']}' excluído com sucesso!"
-                )
-            else:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="Ocorreu um erro ao tentar excluir o evento."
-                )
+def _search_events(calendar_cache, text):
+    """Busca por título. "reunião de amanhã": procura "reunião" e fica com as de amanhã
+    (ou a do horário, se ele foi dito); sem nenhuma assim, procura o texto inteiro"""
+    title, when = split_schedule(text)
+    if when is not None:
+        events = calendar_cache.search(title)
+        if when.all_day:
+            events = [event for event in events if event_start(event).astimezone(LOCAL_TZ).date() == when.start.date()]
         else:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Não entendi qual evento excluir. Tente 'excluir evento reunião de amanhã'."
-            )
+            events = [event for event in events
+                      if event_start(event).astimezone(LOCAL_TZ).replace(tzinfo=None) == when.start]
+        if events:
+            return events
+    return calendar_cache.search(text)
+
+async def _delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id, summary):
+    if await delete_calendar_event_async(event_id):
+        calendar_cache_for(context).remove(event_id)
+        context.bot_data['sessions'].forget_event(update.effective_chat.id, event_id)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Evento '{summary}' excluído com sucesso!"
+        )
+    else:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Ocorreu um erro ao tentar excluir o evento."
+        )
+
+# "excluir 2": o número se refere à última lista mostrada neste chat (sem buscar de novo)
+@router.intent('excluir_evento_numero', r'excluir (?:o |evento )?(?P<number>\d{1,2})', priority=30, whole_message=True)
+async def excluir_evento_numero(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    number = int(groups['number'])
+    session = context.bot_data['sessions'].get(update.effective_chat.id)
+    if session is None or not session.listed_events:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Não sei a qual evento esse número se refere. Liste os eventos antes, por exemplo: 'eventos de hoje'."
+        )
+        return
+
+    listed = session.listed_event(number)
+    if listed is None or calendar_cache_for(context).get(listed.id) is None:
+        if 1 <= number <= len(session.listed_events):
+            text = f"O evento {number} da lista não está mais na agenda."
+        else:
+            text = f"A última lista ({session.listed_label}) tem {len(session.listed_events)} evento(s)."
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+        return
+
+    await _delete_event(update, context, listed.id, listed.summary)
+
+def _event_line(event):
+    return f"{event_start(event).strftime('%d/%m %H:%M')} {event.get('summary', '(sem título)')}"
+
+def _single_day(text):
+    """Período de um dia só ("hoje", "sexta", "25/12") ou None"""
+    period = parse_period(text)
+    if period is None or period.end - period.start != datetime.timedelta(days=1):
+        return None
+    return period
+
+async def dia_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o dia. Use um dia só, como 'hoje', 'amanhã', 'sexta' ou '25/12'."
+    )
 
-    # Abaixo da lógica de "excluir evento"
-    
-    # Lógica para editar eventos
-    elif "mudar nome do evento" in user_message:
-        # Padrão para extrair o nome antigo e o novo nome do evento
-        match_edit = re.search(r'mudar nome do evento (.+) para (.+)', user_message)
-        if match_edit:
-            old_title = match_edit.group(1).strip()
-            new_title = match_edit.group(2).strip()
-            
-            # Encontra o evento pelo título antigo
-            events = list_calendar_events(query=old_title)
-            
-            if not events:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Não encontrei nenhum evento com o nome '{old_title}'."
-                )
-                return
-            
-            # Pega o primeiro evento encontrado e seu ID
-            event_to_update = events[0]
-            event_id = event_to_update['id']
-            
-            # Cria o corpo da requisição com o novo título
-            updated_body = event_to_update
-            updated_body['summary'] = new_title
-            
-            # Tenta atualizar o evento
-            updated_event = update_calendar_event(event_id, updated_body)
-            
-            if updated_event:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Nome do evento alterado de '{old_title}' para '{new_title}' com sucesso!"
-                )
-            else:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="Ocorreu um erro ao tentar editar o evento."
-                )
+# Exclui todos os eventos de um dia num único lote
+@router.intent('excluir_eventos_do_dia', r'excluir (?:todos os )?eventos (?P<day>.+)', priority=20, whole_message=True)
+async def excluir_eventos_do_dia(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    period = _single_day(groups['day'])
+    if period is None:
+        await dia_invalido(update, context)
+        return
+    day = period.label
+    calendar_cache = calendar_cache_for(context)
+    events = await run_google_call(calendar_cache.events_on, period.start)
+    if not events:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Nenhum evento para {day}.")
+        return
+
+    errors = await delete_calendar_events_async([event['id'] for event in events])
+    failed = []
+    for event in events:
+        if errors.get(event['id']) is None:
+            calendar_cache.remove(event['id'])
+        else:
+            failed.append(event)
+
+    text = f"{len(events) - len(failed)} de {len(events)} evento(s) de {day} excluídos."
+    if failed:
+        text += "\nNão consegui excluir:\n" + "\n".join(_event_line(event) for event in failed)
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+# Move todos os eventos de um dia para outro num único lote
+@router.intent(
+    'mover_eventos_do_dia',
+    r'mover (?:todos os )?eventos (?P<source>.+?) para (?P<target>.+)',
+    priority=10
+)
+async def mover_eventos_do_dia(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    source_period, target_period = _single_day(groups['source']), _single_day(groups['target'])
+    if source_period is None or target_period is None:
+        await dia_invalido(update, context)
+        return
+    source, target = source_period.label, target_period.label
+    days = (target_period.start - source_period.start).days
+    calendar_cache = calendar_cache_for(context)
+    events = await run_google_call(calendar_cache.events_on, source_period.start)
+    if not events or days == 0:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Nenhum evento para mover de {source}.")
+        return
+
+    results = await patch_calendar_events_async({event['id']: shifted_times(event, days) for event in events})
+    failed = []
+    for event in events:
+        updated, error = results[event['id']]
+        if error is None:
+            calendar_cache.apply(updated)
         else:
+            failed.append(event)
+
+    text = f"{len(events) - len(failed)} de {len(events)} evento(s) movidos de {source} para {target}."
+    if failed:
+        text += "\nNão consegui mover:\n" + "\n".join(_event_line(event) for event in failed)
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+@router.intent('excluir_evento_invalido', r'excluir evento', priority=5)
+async def excluir_evento_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi qual evento excluir. Tente 'excluir evento reunião de amanhã'."
+    )
+
+# Lógica para editar eventos
+# Padrão para extrair o nome antigo e o novo nome do evento
+@router.intent('editar_evento', r'mudar nome do evento (?P<old>.+) para (?P<new>.+)', priority=10)
+async def editar_evento(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    old_title = groups['old'].strip()
+    new_title = groups['new'].strip()
+
+    # Encontra o evento pelo título antigo
+    calendar_cache = calendar_cache_for(context)
+    events = await run_google_call(_search_events, calendar_cache, old_title)
+
+    if not events:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Não encontrei nenhum evento com o nome '{old_title}'."
+        )
+        return
+
+    # Pega o primeiro evento encontrado e seu ID
+    event_to_update = events[0]
+    event_id = event_to_update['id']
+
+    # Cria o corpo da requisição com o novo título (cópia, para não mexer no cache)
+    updated_body = dict(event_to_update)
+    updated_body['summary'] = new_title
+
+    # Tenta atualizar o evento
+    updated_event = await update_calendar_event_async(event_id, updated_body)
+
+    if updated_event:
+        calendar_cache.apply(updated_event)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Nome do evento alterado de '{old_title}' para '{new_title}' com sucesso!"
+        )
+    else:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Ocorreu um erro ao tentar editar o evento."
+        )
+
+@router.intent('editar_evento_invalido', r'mudar nome do evento', priority=5)
+async def editar_evento_invalido(update: Update, context: ContextTypes.DEFAULT_TYPE, groups):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Não entendi o formato para editar. Tente `mudar nome do evento reunião para time meeting`."
+    )
+
+async def reject_unregistered(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Com o cadastro ligado só usuários cadastrados usam o bot (o dono também se cadastra,
+    com o próprio token.json). Retorna True se a mensagem foi recusada"""
+    tenant_registry = context.bot_data.get('tenant_registry')
+    if tenant_registry is None or tenant_registry.get(update.effective_user.id):
+        return False
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Você ainda não está cadastrado. Peça ao administrador do bot para cadastrar sua planilha e agenda."
+    )
+    return True
+
+@contextlib.contextmanager
+def tenant_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usuários cadastrados usam a própria planilha, agenda e credenciais.
+    Com o cadastro ligado o usuário é sempre definido: se não estiver cadastrado,
+    as chamadas ao Google falham (TenantNotRegistered) em vez de usar as do dono"""
+    token = None
+    if context.bot_data.get('tenant_registry'):
+        token = current_tenant.set(update.effective_user.id)
+    try:
+        yield
+    finally:
+        if token is not None:
+            current_tenant.reset(token)
+
+def understood(command):
+    """Comando vindo do modelo só vale se o roteador o reconhecer (e não como formato inválido)"""
+    intent, _ = router.match(command)
+    return intent is not None and not intent.name.endswith('_invalido')
+
+# Novo handler para processar a mensagem do usuário
+async def processar_mensagem(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await reject_unregistered(update, context):
+        return
+    user_message = update.message.text.lower()
+    with tenant_context(update, context):
+        nlu = context.bot_data.get('nlu')
+        if nlu is not None:
+            intent, _ = router.match(user_message)
+            if intent is None or intent.name.endswith('_invalido'):
+                # Só o que os padrões não entenderam vai para o modelo (utils/nlu_fallback.py)
+                user_message = await nlu.interpret(user_message) or user_message
+        await router.dispatch(user_message, update, context)
+
+# Extrato bancário enviado como arquivo (CSV ou OFX)
+async def importar_extrato(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await reject_unregistered(update, context):
+        return
+    document = update.message.document
+    chat_id = update.effective_chat.id
+    if document.file_size and document.file_size > MAX_STATEMENT_BYTES:
+        await context.bot.send_message(chat_id=chat_id, text="O arquivo é grande demais (máximo 20 MB).")
+        return
+
+    with tenant_context(update, context):
+        spreadsheet_id = get_spreadsheet_id(SAMPLE_SPREADSHEET_ID)
+        # Uma importação por planilha: a segunda não veria as linhas que a primeira ainda está enviando
+        imports = context.bot_data['statement_imports']
+        if spreadsheet_id in imports:
             await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Não entendi o formato para editar. Tente `mudar nome do evento reunião para time meeting`."
+                chat_id=chat_id,
+                text="Ainda estou importando o extrato anterior. Envie este arquivo de novo quando eu terminar."
             )
+            return
 
-    # Abaixo da lógica de "excluir evento"
+        # Uma mensagem só, editada com o andamento e depois com o resultado
+        progress = ProgressMessage(context.bot, chat_id)
+        # A tarefa copia o usuário atual (contextvars) e segue mesmo se este handler desistir de esperar
+        task = asyncio.create_task(_import_statement_file(context, document, spreadsheet_id, progress))
+    imports[spreadsheet_id] = task
+    task.add_done_callback(lambda done: imports.pop(spreadsheet_id, None))
 
-    # Lógica para mostrar totais financeiros
-    elif "total do mes" in user_message or "gastos do mes" in user_message:
-        # Pega os dados do Google Sheets
-        rows = list_finance_data(SAMPLE_SPREADSHEET_ID)
+    try:
+        await asyncio.wait_for(asyncio.shield(task), IMPORT_TIMEOUT)
+    except asyncio.TimeoutError:
+        await progress.finish(
+            "O extrato é grande e continua sendo importado em segundo plano. "
+            "O resultado aparece nesta mensagem quando terminar."
+        )
 
-        if not rows:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Não consegui encontrar dados na sua planilha."
+async def _import_statement_file(context: ContextTypes.DEFAULT_TYPE, document, spreadsheet_id, progress):
+    await progress.start("Importando o extrato, aguarde...")
+    loop = asyncio.get_running_loop()
+
+    def report(imported):
+        # Chamado na thread da importação a cada append
+        asyncio.run_coroutine_threadsafe(
+            progress.update(f"Importando o extrato: {imported} lançamentos enviados até agora..."), loop
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'extrato')
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            # Pool próprio das tarefas longas: a importação não ocupa as threads das chamadas curtas
+            result = await run_long_call(
+                import_statement, path, spreadsheet_id, context.bot_data['ledger'],
+                filename=document.file_name or '', progress=report
+            )
+        except StatementError as e:
+            await progress.finish(f"Não consegui ler o extrato: {e}")
+            return
+        except HttpError as e:
+            logging.error(f"Erro ao importar extrato: {e}")
+            await progress.finish(
+                "A planilha recusou a importação no meio do caminho. Envie o arquivo de novo: "
+                "o que já foi importado não será duplicado."
+            )
+            return
+        except Exception as e:
+            logging.error(f"Erro ao importar extrato: {e}")
+            await progress.finish(
+                "Ocorreu um erro ao importar o extrato. Envie o arquivo de novo: "
+                "o que já foi importado não será duplicado."
             )
             return
 
-        total_despesas = 0
-        total_receitas = 0
-
-        # Filtra os dados pelo mês atual
-        current_month = datetime.datetime.now().month
-
-        for row in rows:
-            try:
-                # O formato da data na planilha é 26/09/2025
-                entry_date = datetime.datetime.strptime(row[0], '%d/%m/%Y %H:%M:%S').month
-                if entry_date == current_month:
-                    valor = float(row[2])
-                    tipo = row[3]
-                    if tipo == "Despesa":
-                        total_despesas += valor
-                    elif tipo == "Receita":
-                        total_receitas += valor
-            except (ValueError, IndexError):
-                continue
+    lines = [f"Extrato importado: {result.imported} lançamentos em {result.appends} envio(s) para a planilha."]
+    if result.imported:
+        lines.append(f"Despesas: R${result.expenses:.2f} | Receitas: R${result.income:.2f}")
+    if result.duplicates:
+        lines.append(f"{result.duplicates} lançamento(s) já estavam na planilha e foram ignorados.")
+    if result.invalid:
+        lines.append(f"{result.invalid} linha(s) não puderam ser lidas.")
+    await progress.finish("\n".join(lines))
 
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"Resumo do Mês:"
-                    "Total de Despesas: R${total_despesas:.2f}"
-                    "Total de Receitas: R${total_receitas:.2f}"
-                    "Saldo: R${total_receitas - total_despesas:.2f}"
-                    ,
-                    parse_mode="Markdown"
-                    )
+# --- Tarefas agendadas (JobQueue) ---
+async def digest_job(context: ContextTypes.DEFAULT_TYPE):
+    """Uma vez por dia: agenda o resumo de cada assinante espalhado pela janela"""
+    finance_alerts = context.bot_data['finance_alerts']
+    # Recarrega os contadores do ledger (no modo webhook cada processo só somou o que ele gravou)
+    finance_alerts.reset_counters()
+    subscriptions = finance_alerts.due_subscriptions(datetime.date.today())
+    for subscription in subscriptions:
+        context.job_queue.run_once(send_digest, digest_offset(subscription.chat_id), data=subscription,
+                                   chat_id=subscription.chat_id, name=f"resumo-{subscription.chat_id}")
+    logging.info(f"{len(subscriptions)} resumo(s) agendado(s)")
+
+async def send_digest(context: ContextTypes.DEFAULT_TYPE):
+    subscription = context.job.data
+    token = current_tenant.set(subscription.tenant_id)
+    try:
+        text = await run_google_call(context.bot_data['finance_alerts'].digest, subscription)
+    finally:
+        current_tenant.reset(token)
+    await context.bot.send_message(chat_id=subscription.chat_id, text=text)
+
+async def send_alert(context: ContextTypes.DEFAULT_TYPE):
+    await context.bot.send_message(chat_id=context.job.chat_id, text=context.job.data)
+
+# Chamadas ao Google que passam do tempo limite (ou falham) caem aqui
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    logging.error(f"Erro ao processar atualização: {context.error}")
+    if isinstance(update, Update) and update.effective_chat:
+        if isinstance(context.error, asyncio.TimeoutError):
+            text = "O Google demorou demais para responder. Por favor, tente novamente."
+        else:
+            text = "Ocorreu um erro ao processar sua mensagem. Por favor, tente novamente."
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
+async def post_init(application):
+    # No modo webhook cada processo tem seus próprios arquivos locais
+    worker_id = application.bot_data.get('worker_id')
+    finance_queue = FinanceWriteQueue(journal_path=worker_path(FINANCE_JOURNAL_PATH, worker_id))
+    if not worker_id:
+        # Diários de workers que não existem mais (menos processos, ou de volta ao polling):
+        # as linhas deles passam para este diário em vez de ficarem esquecidas
+        for path in orphan_worker_paths(FINANCE_JOURNAL_PATH, application.bot_data.get('workers', 0)):
+            adopted = finance_queue.adopt(path)
+            logging.info(f"{adopted} lançamento(s) pendente(s) recuperado(s) de {path}")
+    finance_queue.start()
+    application.bot_data['finance_queue'] = finance_queue
+    if FINANCE_STORAGE == 'sqlite' and MIRROR_ENABLED and not worker_id:
+        # Só um processo copia o SQLite (compartilhado) para a planilha
+        mirror = SheetsMirror(get_storage())
+        mirror.start()
+        application.bot_data['finance_mirror'] = mirror
+    ledger = LedgerCache(db_path=worker_path(LEDGER_PATH, worker_id))
+    add_write_listener(ledger.on_rows_written)
+    application.bot_data['ledger'] = ledger
+    setup_finance_alerts(application, ledger)
+    application.bot_data['calendar_caches'] = LRUCache(TENANT_CACHE_SIZE)
+    application.bot_data['sessions'] = SessionStore()
+    application.bot_data['statement_imports'] = {}
+    if NLU_BACKEND:
+        application.bot_data['nlu'] = FallbackNLU(make_client(NLU_BACKEND), accept=understood)
+    if TENANT_STORE_KEY:
+        tenant_registry = TenantRegistry()
+        set_tenant_registry(tenant_registry)
+        application.bot_data['tenant_registry'] = tenant_registry
+    if METRICS_PORT:
+        # No modo webhook cada processo expõe as métricas numa porta seguinte
+        application.bot_data['metrics_server'] = start_metrics_server(int(METRICS_PORT) + (worker_id or 0))
+    # O bot já atende enquanto credenciais, clientes do Google e NumPy carregam
+    application.bot_data['warm_up'] = asyncio.get_running_loop().create_task(warm_up_in_background())
+    if UPDATE_JOURNAL_ENABLED:
+        # Um diário só para todos os processos (no modo webhook o servidor grava e reenvia os pendentes)
+        update_journal = UpdateJournal()
+        application.bot_data['update_journal'] = update_journal
+        if worker_id is None:
+            # Antes do polling: o que caiu no meio da última execução vem antes das novas
+            await replay(application, update_journal)
+
+def setup_finance_alerts(application, ledger):
+    """Orçamentos e resumos: contadores atualizados a cada gravação e resumo diário pelo JobQueue"""
+    job_queue = application.job_queue
+    loop = asyncio.get_running_loop()
+
+    def notify(chat_id, text):
+        # Chamada na thread que gravou as linhas: o envio vai para o JobQueue, no loop do bot
+        if job_queue is not None:
+            loop.call_soon_threadsafe(lambda: job_queue.run_once(send_alert, 0, data=text, chat_id=chat_id))
+
+    finance_alerts = FinanceAlerts(ledger, notify=notify)
+    add_write_listener(finance_alerts.on_rows_written)
+    application.bot_data['finance_alerts'] = finance_alerts
+    if job_queue is None:
+        logging.warning("JobQueue indisponível: instale python-telegram-bot[job-queue] para alertas e resumos")
+    elif not application.bot_data.get('worker_id'):
+        # No modo webhook só um processo manda os resumos
+        job_queue.run_daily(digest_job, datetime.time(DIGEST_HOUR, tzinfo=LOCAL_TZ), name="resumos")
+
+async def warm_up_in_background():
+    started = time.perf_counter()
+    try:
+        # Roda no pool das chamadas ao Google, para a thread já ficar com os clientes montados
+        await run_google_call(warm_up)
+        await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, 'utils.finance_reports')
+        logging.info(f"Aquecimento concluído em {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        logging.error(f"Erro no aquecimento: {e}")
+
+async def post_shutdown(application):
+    nlu = application.bot_data.get('nlu')
+    if nlu:
+        await nlu.close()
+    finance_alerts = application.bot_data.get('finance_alerts')
+    if finance_alerts:
+        remove_write_listener(finance_alerts.on_rows_written)
+    # Envia os lançamentos que ainda estão na fila antes de sair
+    finance_queue = application.bot_data.get('finance_queue')
+    if finance_queue:
+        await asyncio.get_running_loop().run_in_executor(None, finance_queue.close)
+    finance_mirror = application.bot_data.get('finance_mirror')
+    if finance_mirror:
+        await asyncio.get_running_loop().run_in_executor(None, finance_mirror.close)
+    ledger = application.bot_data.get('ledger')
+    if ledger:
+        remove_write_listener(ledger.on_rows_written)
+        ledger.close()
+    update_journal = application.bot_data.get('update_journal')
+    if update_journal:
+        update_journal.close()
+    if finance_alerts:
+        finance_alerts.close()
+    tenant_registry = application.bot_data.get('tenant_registry')
+    if tenant_registry:
+        tenant_registry.close()
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server:
+        metrics_server.shutdown()
+    shutdown_google_calls()
 
-    
-            
 # --- Main Bot Logic ---
+def build_application(worker_id=None):
+    """Monta a aplicação do Telegram com todos os handlers"""
+    builder = (
+        ApplicationBuilder()
+        .token(os.getenv("TELEGRAM_TOKEN"))
+        # Chats diferentes em paralelo, cada chat em ordem
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        .application_class(JournaledApplication)
+        .request(TimedHTTPXRequest(connection_pool_size=256))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot")
+    if OUTBOX_ENABLED:
+        # Filas por chat, limites do Telegram e retry em 429 (utils/telegram_outbox.py)
+        builder = builder.rate_limiter(OutboundLimiter())
+    application = builder.build()
+    application.bot_data['worker_id'] = worker_id
+
+    # Handlers
+    start_handler = CommandHandler('start', start)
+    help_handler = CommandHandler('ajuda', help_command)
+    stats_handler = CommandHandler('stats', stats_command)
+    message_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), processar_mensagem)
+    statement_handler = MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("ofx"), importar_extrato
+    )
+
+    application.add_handler(start_handler)
+    application.add_handler(help_handler)
+    application.add_handler(stats_handler)
+    application.add_handler(message_handler)
+    application.add_handler(statement_handler)
+    application.add_error_handler(error_handler)
+    return application
+
 def main():
     try:
         logging.basicConfig(
@@ -331,25 +1058,21 @@ def main():
             level=logging.INFO
         )
 
-        # Autentica com o Google
-        get_google_creds()
+        # Só o primeiro acesso (sem token.json) precisa autenticar antes de subir o bot;
+        # nos demais o token é carregado e renovado em segundo plano (warm_up)
+        if needs_authorization():
+            get_google_creds()
 
         # Configura o bot do Telegram
-        application = ApplicationBuilder().token(os.getenv("TELEGRAM_TOKEN")).build()
-
-        # Handlers
-        start_handler = CommandHandler('start', start)
-        help_handler = CommandHandler('ajuda', help_command)
-        message_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), processar_mensagem)
-
-        application.add_handler(start_handler)
-        application.add_handler(help_handler)
-        application.add_handler(message_handler)
+        if BOT_MODE == 'webhook':
+            # Vários processos, cada um com sua própria aplicação
+            run_webhook(build_application, os.getenv("TELEGRAM_TOKEN"),
+                        base_url=f"{TELEGRAM_API_URL}/bot" if TELEGRAM_API_URL else None)
+        else:
+            build_application().run_polling()
 
-        application.run_polling()
-        
     except Exception as e:
         logging.error(f"Erro na execução principal: {e}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
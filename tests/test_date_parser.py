@@ -0,0 +1,45 @@
+import datetime
+
+import pytest
+
+from utils.date_parser import split_schedule
+
+# Sábado, 17/10/2026, 15h30
+NOW = datetime.datetime(2026, 10, 17, 15, 30)
+
+
+def _start(text):
+    _, when = split_schedule(text, now=NOW)
+    return when.start
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Já passou e não foi dito o dia: amanhã, no mesmo horário (não 22h de hoje)
+    ('reunião às 10h', datetime.datetime(2026, 10, 18, 10, 0)),
+    ('reunião às 10:30', datetime.datetime(2026, 10, 18, 10, 30)),
+    ('reunião às 9h30', datetime.datetime(2026, 10, 18, 9, 30)),
+    ('reunião às 10 horas', datetime.datetime(2026, 10, 18, 10, 0)),
+    # Ainda não passou: hoje
+    ('reunião às 16h', datetime.datetime(2026, 10, 17, 16, 0)),
+    ('reunião às 11h', datetime.datetime(2026, 10, 18, 11, 0)),
+    # Dia dito: fica no dia, mesmo que o horário já tenha passado
+    ('reunião hoje às 9h', datetime.datetime(2026, 10, 17, 9, 0)),
+    ('dentista amanhã às 9h', datetime.datetime(2026, 10, 18, 9, 0)),
+    ('curso sexta às 8h', datetime.datetime(2026, 10, 23, 8, 0)),
+])
+def test_hours_written_with_h_or_minutes_are_24_hour(text, expected):
+    assert _start(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('reunião às 10', datetime.datetime(2026, 10, 17, 22, 0)),
+    ('reunião às 3 da tarde', datetime.datetime(2026, 10, 18, 15, 0)),
+    ('jantar às 8 da noite', datetime.datetime(2026, 10, 17, 20, 0)),
+])
+def test_bare_hour_or_period_of_day(text, expected):
+    assert _start(text) == expected
+
+
+def test_range_crossing_midnight():
+    _, when = split_schedule('festa das 22h às 1h', now=NOW)
+    assert (when.start, when.end) == (datetime.datetime(2026, 10, 17, 22, 0), datetime.datetime(2026, 10, 18, 1, 0))
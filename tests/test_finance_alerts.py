@@ -0,0 +1,117 @@
+import re
+import datetime
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+from utils.ledger_cache import LedgerCache
+from utils.finance_alerts import FinanceAlerts, Subscription, digest_offset
+
+TODAY = datetime.date.today()
+
+
+class FakeSheet:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.fetches = 0
+
+    def fetch(self, spreadsheet_id, range_name):
+        self.fetches += 1
+        first = int(re.search(r'!A(\d+)', range_name).group(1))
+        return self.rows[first - 2:]
+
+
+def _row(valor, categoria='Mercado', tipo='Despesa', day=None):
+    day = day or TODAY.replace(day=1)
+    return [f'{day:%d/%m/%Y} 10:00:00', 'compra', str(valor), tipo, categoria]
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet([_row(50)])
+
+
+@pytest.fixture
+def notified():
+    return []
+
+
+@pytest.fixture
+def alerts(tmp_path, sheet, notified):
+    ledger = LedgerCache(str(tmp_path / 'ledger.db'), fetch_func=sheet.fetch)
+    alerts = FinanceAlerts(ledger, str(tmp_path / 'alerts.db'), notify=lambda *args: notified.append(args),
+                           thresholds=(0.8, 1.0))
+    alerts.set_budget(1, 'A', 'Mercado', 100)
+    yield alerts
+    alerts.close()
+    ledger.close()
+
+
+def _write(alerts, sheet, *rows):
+    # Como em add_finance_entry: a linha chega à planilha e depois aos listeners
+    sheet.rows.extend(rows)
+    alerts.ledger.on_rows_written('A', list(rows))
+    return alerts.on_rows_written('A', list(rows))
+
+
+def test_each_threshold_is_announced_once(alerts, sheet, notified):
+    assert _write(alerts, sheet, _row(20)) == []
+    _write(alerts, sheet, _row(15))
+    assert notified == [(1, "Você passou 80% do orçamento de Mercado: R$85.00 de R$100.00 este mês.")]
+    _write(alerts, sheet, _row(5))
+    assert len(notified) == 1
+    _write(alerts, sheet, _row(10))
+    assert notified[-1] == (1, "Você estourou o orçamento de Mercado: R$100.00 de R$100.00 este mês.")
+    _write(alerts, sheet, _row(10))
+    assert len(notified) == 2
+
+
+def test_jumping_over_several_thresholds_sends_the_highest(alerts, sheet, notified):
+    _write(alerts, sheet, _row(70))
+    assert [text.startswith("Você estourou") for _, text in notified] == [True]
+
+
+def test_first_write_of_the_month_loads_the_ledger_without_counting_twice(alerts, sheet):
+    # A carga do mês já traz a linha gravada; ela não é somada de novo
+    _write(alerts, sheet, _row(10))
+    assert alerts.month('A', TODAY.year, TODAY.month).total('Despesa', 'Mercado') == 60.0
+    assert sheet.fetches == 1
+
+
+def test_rows_that_cannot_cross_a_budget_are_ignored(alerts, sheet, notified):
+    last_month = TODAY.replace(day=1) - datetime.timedelta(days=1)
+    _write(alerts, sheet, _row(500, tipo='Receita'), _row(500, categoria='Lazer'), _row(500, day=last_month))
+    assert notified == []
+    # Sem orçamento, o mês nem é carregado
+    assert sheet.fetches == 0
+
+
+def test_category_names_are_normalized(alerts, sheet, notified):
+    _write(alerts, sheet, _row(40, categoria='mercado '))
+    assert len(notified) == 1
+
+
+def test_budgets_written_by_another_process_are_seen(tmp_path, alerts, sheet, notified):
+    other = FinanceAlerts(alerts.ledger, str(tmp_path / 'alerts.db'))
+    other.set_budget(2, 'A', 'Lazer', 10)
+    other.close()
+    _write(alerts, sheet, _row(20, categoria='Lazer'))
+    assert notified == [(2, "Você estourou o orçamento de Lazer: R$20.00 de R$10.00 este mês.")]
+
+
+def test_weekly_digests_only_on_their_weekday(alerts):
+    alerts.subscribe(1, 'A', 'diario')
+    alerts.subscribe(2, 'A', 'semanal')
+    monday = datetime.date(2026, 10, 19)
+    assert {s.chat_id for s in alerts.due_subscriptions(monday)} == {1, 2}
+    assert {s.chat_id for s in alerts.due_subscriptions(monday + datetime.timedelta(days=1))} == {1}
+    assert digest_offset(1) == digest_offset(1) < 1800
+
+
+def test_daily_digest_text(alerts, sheet):
+    yesterday = TODAY - datetime.timedelta(days=1)
+    sheet.rows.append(_row(12.5, categoria='Padaria', day=yesterday))
+    text = alerts.digest(Subscription(1, 'A', 'diario', None), today=TODAY)
+    assert text.splitlines()[:3] == [f"Resumo de ontem ({yesterday:%d/%m}):",
+                                     "Despesas: R$12.50 | Receitas: R$0.00", "- Padaria: R$12.50"]
+    assert text.splitlines()[-1].startswith("Orçamento de Mercado: ")
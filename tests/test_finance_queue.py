@@ -0,0 +1,181 @@
+import pytest
+
+pytest.importorskip('googleapiclient')
+from utils.finance_queue import FinanceWriteQueue
+
+
+def _row(descricao, valor=10):
+    return ['17/10/2026 10:00:00', descricao, valor, 'Despesa', 'Outros']
+
+
+class FakeSheet:
+    """append_func/find_keys_func em memória: {planilha: [linhas]}"""
+
+    def __init__(self):
+        self.rows = {}
+        self.appends = 0
+
+    def append(self, spreadsheet_id, rows):
+        self.appends += 1
+        self.rows.setdefault(spreadsheet_id, []).extend(rows)
+
+    def find_keys(self, spreadsheet_id, keys):
+        return {row[5] for row in self.rows.get(spreadsheet_id, []) if len(row) > 5 and row[5] in keys}
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet()
+
+
+@pytest.fixture
+def make_queue(tmp_path, sheet):
+    queues = []
+
+    def make(**kwargs):
+        queue = FinanceWriteQueue(str(tmp_path / 'journal.db'), append_func=sheet.append,
+                                  find_keys_func=sheet.find_keys, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        try:
+            queue._db.close()
+        except Exception:
+            pass
+
+
+def test_rows_are_sent_in_one_append_per_sheet(make_queue, sheet):
+    queue = make_queue()
+    queue.enqueue('A', _row('café'), key='k1')
+    queue.enqueue('A', _row('pão'), key='k2')
+    queue.enqueue('B', _row('luz'), key='k3')
+    assert queue.flush() == 3
+    assert sheet.appends == 2
+    assert [row[1] for row in sheet.rows['A']] == ['café', 'pão']
+    assert [row[5] for row in sheet.rows['A']] == ['k1', 'k2']
+    assert queue.pending_count() == 0
+    assert queue.flush() == 0
+
+
+def test_large_batches_are_split(make_queue, sheet):
+    queue = make_queue(max_batch_rows=2)
+    for index in range(5):
+        queue.enqueue('A', _row(f'item {index}'))
+    assert queue.flush() == 5
+    assert sheet.appends == 3
+    assert [row[1] for row in sheet.rows['A']] == [f'item {index}' for index in range(5)]
+
+
+def test_rows_left_in_the_journal_are_sent_after_a_restart(make_queue, sheet):
+    queue = make_queue()
+    queue.enqueue('A', _row('café'), key='k1')
+    queue.enqueue('A', _row('pão'), key='k2')
+    # O processo caiu antes do envio: o diário continua no disco
+    queue._db.close()
+
+    restarted = make_queue()
+    assert restarted.pending_count() == 2
+    assert restarted.flush() == 2
+    assert [row[1] for row in sheet.rows['A']] == ['café', 'pão']
+
+
+def test_same_key_is_journaled_once(make_queue, sheet):
+    queue = make_queue()
+    first = queue.enqueue('A', _row('café'), key='k1')
+    assert queue.enqueue('A', _row('café'), key='k1') == first
+    queue.flush()
+    # Reenvio do Telegram depois de a linha chegar à planilha: nada é gravado
+    assert queue.enqueue('A', _row('café'), key='k1') is None
+    queue.flush()
+    assert len(sheet.rows['A']) == 1
+
+
+def test_sent_keys_survive_a_restart(make_queue, sheet):
+    queue = make_queue()
+    queue.enqueue('A', _row('café'), key='k1')
+    queue.flush()
+    queue._db.close()
+    assert make_queue().enqueue('A', _row('café'), key='k1') is None
+
+
+def test_unsent_row_can_be_cancelled(make_queue, sheet):
+    queue = make_queue()
+    row_id = queue.enqueue('A', _row('café'))
+    assert queue.cancel(row_id)
+    assert queue.flush() == 0
+    assert sheet.rows == {}
+    assert not queue.cancel(row_id)
+
+
+def test_pending_entries_are_parsed_rows(make_queue):
+    queue = make_queue()
+    queue.enqueue('A', _row('café', '12,50'), key='k1')
+    queue.enqueue('B', _row('luz'), key='k2')
+    [(key, (entry_date, descricao, valor, tipo, categoria))] = queue.pending_entries('A')
+    assert (key, descricao, valor, tipo) == ('k1', 'café', 12.5, 'Despesa')
+    assert entry_date.day == 17
+
+
+
+class LostResponse(Exception):
+    """O append chegou à planilha, mas a resposta se perdeu (timeout)"""
+
+
+def test_rows_that_arrived_without_confirmation_are_not_resent(make_queue, sheet):
+    queue = make_queue()
+    append = sheet.append
+
+    def append_then_fail(spreadsheet_id, rows):
+        append(spreadsheet_id, rows)
+        raise LostResponse()
+
+    queue.append_func = append_then_fail
+    row_id = queue.enqueue('A', _row('café'), key='k1')
+    assert queue.flush() == 0
+    # A linha com tentativa anterior não pode mais ser cancelada
+    queue._sending.clear()
+    assert not queue.cancel(row_id)
+    queue._db.close()
+
+    queue = make_queue()
+    assert queue.flush() == 0
+    assert sheet.appends == 1
+    assert queue.pending_count() == 0
+    assert queue.enqueue('A', _row('café'), key='k1') is None
+
+
+def test_rows_that_did_not_arrive_are_resent(make_queue, sheet):
+    queue = make_queue()
+    append = sheet.append
+
+    def fail(spreadsheet_id, rows):
+        raise LostResponse()
+
+    queue.append_func = fail
+    queue.enqueue('A', _row('café'), key='k1')
+    queue.flush()
+    queue._db.close()
+
+    queue = make_queue()
+    queue.append_func = append
+    assert queue.flush() == 1
+    assert [row[5] for row in sheet.rows['A']] == ['k1']
+
+
+def test_journal_of_a_removed_worker_is_adopted(tmp_path, make_queue, sheet):
+    old = FinanceWriteQueue(str(tmp_path / 'journal.worker1.db'), append_func=sheet.append,
+                            find_keys_func=sheet.find_keys)
+    old.enqueue('A', _row('café'), key='k1')
+    old.enqueue('A', _row('pão'), key='k2')
+    old.flush()
+    old.enqueue('A', _row('luz'), key='k3')
+    old._db.close()
+
+    queue = make_queue()
+    assert queue.adopt(str(tmp_path / 'journal.worker1.db')) == 1
+    assert not (tmp_path / 'journal.worker1.db').exists()
+    assert queue.enqueue('A', _row('café'), key='k1') is None
+    assert queue.flush() == 1
+    assert [row[5] for row in sheet.rows['A']] == ['k1', 'k2', 'k3']
@@ -0,0 +1,136 @@
+import pytest
+
+pytest.importorskip('googleapiclient')
+import httplib2
+from googleapiclient.errors import HttpError
+
+from utils import finance_storage
+from utils.finance_storage import SQLiteStorage, SheetsMirror, MIRROR_FAILED, MIRROR_SENDING
+
+
+def _row(day, valor, key=None, tipo='Despesa'):
+    row = [f'{day:02d}/10/2026 10:00:00', 'compra', str(valor), tipo, 'Mercado']
+    return row + [key] if key else row
+
+
+class FakeSheet:
+    """Planilha em memória: seed_func, append_func e find_keys_func"""
+
+    def __init__(self, rows=()):
+        self.rows = {'A': list(rows)}
+        self.reads = 0
+        self.appends = []
+        self.errors = []
+
+    def read(self, spreadsheet_id, range_name):
+        self.reads += 1
+        return list(self.rows.get(spreadsheet_id, []))
+
+    def append(self, spreadsheet_id, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.appends.append((spreadsheet_id, len(rows)))
+        self.rows.setdefault(spreadsheet_id, []).extend(rows)
+
+    def find_keys(self, spreadsheet_id, keys):
+        return {row[5] for row in self.rows.get(spreadsheet_id, []) if len(row) > 5} & set(keys)
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet([_row(1, 100), _row(2, 50)])
+
+
+@pytest.fixture
+def storage(tmp_path, sheet):
+    storage = SQLiteStorage(str(tmp_path / 'finance.db'), seed_func=sheet.read)
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def mirror(storage, sheet):
+    return SheetsMirror(storage, append_func=sheet.append, find_keys_func=sheet.find_keys, interval=1)
+
+
+def test_existing_sheet_is_seeded_once(tmp_path, storage, sheet):
+    assert storage.month_totals('A', 2026, 10) == {'Despesa': 150.0}
+    storage.append('A', [_row(3, 25)])
+    assert sheet.reads == 1
+    reopened = SQLiteStorage(str(tmp_path / 'finance.db'), seed_func=sheet.read)
+    assert reopened.month_totals('A', 2026, 10) == {'Despesa': 175.0}
+    assert sheet.reads == 1
+    reopened.close()
+
+
+def test_read_returns_rows_like_the_sheet(storage):
+    storage.append('A', [_row(3, 25, key='k1'), _row(4, 10, tipo='Receita')])
+    assert storage.read('A', 'Sheet1!A4:E') == [_row(3, 25), _row(4, 10, tipo='Receita')]
+    assert storage.read('A', 'Sheet1!A4:F') == [_row(3, 25, key='k1'), _row(4, 10, tipo='Receita') + ['']]
+    assert storage.month_totals('A', 2026, 10) == {'Despesa': 175.0, 'Receita': 10.0}
+
+
+def test_repeated_keys_are_written_once(storage):
+    _, written = storage.append('A', [_row(3, 25, key='k1')])
+    assert len(written) == 1
+    _, written = storage.append('A', [_row(3, 25, key='k1'), _row(4, 5, key='k2')])
+    assert written == [_row(4, 5, key='k2')]
+    assert storage.find_keys('A', ['k1', 'k2', 'k3']) == {'k1', 'k2'}
+    assert storage.month_totals('A', 2026, 10) == {'Despesa': 180.0}
+
+
+def test_listeners_only_see_rows_actually_written(storage, monkeypatch):
+    monkeypatch.setattr(finance_storage, '_storage', storage)
+    seen = []
+    listener = lambda spreadsheet_id, rows: seen.append(len(rows))
+    finance_storage.add_write_listener(listener)
+    try:
+        finance_storage.add_finance_entry('A', [_row(3, 25, key='k1')])
+        finance_storage.add_finance_entry('A', [_row(3, 25, key='k1')])
+    finally:
+        finance_storage.remove_write_listener(listener)
+    assert seen == [1]
+
+
+def test_mirror_copies_only_new_rows(storage, mirror, sheet):
+    storage.append('A', [_row(3, 25, key='k1'), _row(4, 10)])
+    storage.append('B', [_row(5, 5)])
+    assert mirror.run_once() == 3
+    # As linhas que vieram da planilha (seed) não voltam para ela
+    assert sorted(sheet.appends) == [('A', 2), ('B', 1)]
+    assert sheet.rows['A'][-2:] == [_row(3, 25, key='k1'), _row(4, 10, key='sqlite:5')]
+    assert mirror.run_once() == 0
+
+
+def test_failing_sheet_waits_without_holding_the_others(storage, mirror, sheet):
+    storage.append('A', [_row(3, 25)])
+    storage.append('B', [_row(4, 10)])
+    sheet.errors = [HttpError(httplib2.Response({'status': 503}), b'')]
+    mirror.run_once()
+    assert len(sheet.appends) == 1
+    assert 'A' in mirror._retry_at or 'B' in mirror._retry_at
+    # Enquanto espera, a planilha que falhou fica fora da cópia
+    assert mirror.run_once() == 0
+    mirror._retry_at.clear()
+    assert mirror.run_once() == 1
+
+
+def test_permanent_error_takes_rows_out_of_the_copy(storage, mirror, sheet):
+    storage.append('B', [_row(4, 10)])
+    sheet.errors = [HttpError(httplib2.Response({'status': 403}), b'')]
+    assert mirror.run_once() == 0
+    assert mirror._retry_at == {}
+    assert storage.unmirrored(10) == []
+    state = storage._db.execute("SELECT mirrored FROM finance_rows WHERE spreadsheet_id = 'B'").fetchone()[0]
+    assert state == MIRROR_FAILED
+
+
+def test_rows_sent_before_a_crash_are_not_copied_again(storage, mirror, sheet):
+    storage.append('A', [_row(3, 25, key='k1'), _row(4, 10, key='k2'), _row(5, 5)])
+    # O processo caiu no meio do append: k1 e a linha sem chave chegaram, k2 não
+    storage.mark_mirrored('A', [4, 5, 6], MIRROR_SENDING)
+    sheet.rows['A'] += [_row(3, 25, key='k1'), _row(5, 5, key='sqlite:6')]
+    assert mirror.run_once() == 1
+    assert sheet.appends == [('A', 1)]
+    assert sheet.rows['A'][-1] == _row(4, 10, key='k2')
+    assert storage.unmirrored(10) == []
@@ -0,0 +1,252 @@
+import time
+import threading
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+import httplib2
+from googleapiclient.errors import HttpError
+
+from utils.google_scheduler import (
+    TokenBucket, GoogleCallScheduler, background_calls, call_priority, permanent_error, PRIORITY_BACKGROUND
+)
+
+
+def http_error(status, retry_after=None):
+    headers = {'status': status}
+    if retry_after is not None:
+        headers['retry-after'] = str(retry_after)
+    return HttpError(httplib2.Response(headers), b'{}')
+
+
+class FakeRequest:
+    """HttpRequest falso: levanta os erros da lista, na ordem, e depois responde result"""
+
+    def __init__(self, method='GET', errors=(), result=None, uri='https://google/x', hold=None):
+        self.method = method
+        self.uri = uri
+        self.body = None
+        self.errors = list(errors)
+        self.result = result if result is not None else {'ok': True}
+        self.hold = hold
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.hold is not None:
+            self.hold.wait(5)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def scheduler(sleeps):
+    return GoogleCallScheduler(quotas={'sheets': (1000, 100)}, project_quotas={'sheets': (1000, 100)},
+                               sleep=sleeps.append)
+
+
+# --- TokenBucket ---
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=50, capacity=2)
+    assert bucket.acquire() < 0.005
+    assert bucket.acquire() < 0.005
+    assert bucket.acquire() >= 0.015
+
+
+def test_drain_makes_the_next_call_wait():
+    bucket = TokenBucket(rate=50, capacity=5)
+    bucket.drain()
+    assert bucket.acquire() >= 0.015
+
+
+def test_user_calls_go_before_background_ones():
+    bucket = TokenBucket(rate=20, capacity=1)
+    bucket.drain()
+    order = []
+
+    def take(name, priority):
+        bucket.acquire(priority)
+        order.append(name)
+
+    background = threading.Thread(target=take, args=('background', PRIORITY_BACKGROUND))
+    background.start()
+    time.sleep(0.01)
+    user = threading.Thread(target=take, args=('user', 0))
+    user.start()
+    background.join()
+    user.join()
+    assert order == ['user', 'background']
+
+
+# --- Repetições ---
+
+def test_reads_are_retried_on_server_errors(scheduler, sleeps):
+    request = FakeRequest(errors=[http_error(503), http_error(500)])
+    assert scheduler.execute(request, 'sheets.get') == {'ok': True}
+    assert request.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_after_is_honored(scheduler, sleeps):
+    request = FakeRequest(method='POST', errors=[http_error(429, retry_after=7)])
+    scheduler.execute(request, 'sheets.append')
+    assert sleeps == [7.0]
+
+
+def test_non_idempotent_writes_are_not_retried_on_server_errors(scheduler, sleeps):
+    request = FakeRequest(method='POST', errors=[http_error(503)])
+    with pytest.raises(HttpError):
+        scheduler.execute(request, 'sheets.append')
+    assert request.calls == 1
+    # Com id escolhido pelo bot o POST pode ser repetido
+    request = FakeRequest(method='POST', errors=[http_error(503)])
+    scheduler.execute(request, 'calendar.insert', idempotent=True)
+    assert request.calls == 2
+
+
+def test_client_errors_are_not_retried(scheduler):
+    request = FakeRequest(errors=[http_error(403)])
+    with pytest.raises(HttpError):
+        scheduler.execute(request, 'sheets.get')
+    assert request.calls == 1
+    assert permanent_error(http_error(403))
+    assert not permanent_error(http_error(429))
+    assert not permanent_error(http_error(503))
+
+
+def test_gives_up_after_max_attempts(sleeps):
+    scheduler = GoogleCallScheduler(quotas={}, project_quotas={}, max_attempts=3, sleep=sleeps.append)
+    request = FakeRequest(errors=[http_error(503)] * 5)
+    with pytest.raises(HttpError):
+        scheduler.execute(request, 'sheets.get')
+    assert request.calls == 3
+
+
+# --- Leituras iguais ao mesmo tempo ---
+
+def test_concurrent_identical_reads_are_coalesced(scheduler):
+    hold = threading.Event()
+    request = FakeRequest(result={'values': [[1]]}, hold=hold)
+    results = []
+
+    def read():
+        results.append(scheduler.execute(request, 'sheets.get', tenant=1))
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    hold.set()
+    for thread in threads:
+        thread.join()
+    assert request.calls == 1
+    assert results == [{'values': [[1]]}] * 3
+    # Cada um recebe sua cópia
+    assert len({id(result) for result in results}) == 3
+
+
+def test_reads_of_different_tenants_are_not_coalesced(scheduler):
+    hold = threading.Event()
+    request = FakeRequest(hold=hold)
+    threads = [threading.Thread(target=scheduler.execute, args=(request, 'sheets.get', tenant))
+               for tenant in (1, 2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    hold.set()
+    for thread in threads:
+        thread.join()
+    assert request.calls == 2
+
+
+# --- Cotas por usuário e do projeto ---
+
+def test_each_tenant_has_its_own_bucket():
+    scheduler = GoogleCallScheduler(quotas={'sheets': (20, 1)}, project_quotas={'sheets': (1000, 100)})
+    started = time.monotonic()
+    for tenant in range(5):
+        scheduler.execute(FakeRequest(method='POST'), 'sheets.append', tenant=tenant)
+    assert time.monotonic() - started < 0.04
+    # O mesmo usuário espera a própria cota
+    scheduler.execute(FakeRequest(method='POST'), 'sheets.append', tenant=0)
+    assert time.monotonic() - started >= 0.04
+
+
+def test_project_quota_caps_all_tenants():
+    scheduler = GoogleCallScheduler(quotas={'sheets': (1000, 100)}, project_quotas={'sheets': (20, 2)})
+    started = time.monotonic()
+    for tenant in range(3):
+        scheduler.execute(FakeRequest(method='POST'), 'sheets.append', tenant=tenant)
+    assert time.monotonic() - started >= 0.04
+
+
+def test_quota_share_splits_project_and_default_credentials_only():
+    scheduler = GoogleCallScheduler(quotas={'sheets': (10, 4)}, project_quotas={'sheets': (100, 40)})
+    scheduler.set_quota_share(2)
+    assert scheduler.project_buckets['sheets'].rate == 50
+    assert scheduler.bucket_for(None, 'sheets').rate == 5
+    assert scheduler.bucket_for(7, 'sheets').rate == 10
+    assert scheduler.bucket_for(7, 'drive') is None
+
+
+def test_tenant_buckets_are_bounded():
+    scheduler = GoogleCallScheduler(quotas={'sheets': (10, 4)}, max_tenant_buckets=2)
+    for tenant in range(5):
+        scheduler.bucket_for(tenant, 'sheets')
+    assert list(scheduler.buckets) == [(3, 'sheets'), (4, 'sheets')]
+
+
+def test_429_drains_only_that_tenant(scheduler, sleeps):
+    scheduler.execute(FakeRequest(method='POST', errors=[http_error(429)]), 'sheets.append', tenant=1)
+    assert scheduler.bucket_for(1, 'sheets').tokens <= 1
+    assert scheduler.bucket_for(2, 'sheets').tokens == 100
+
+
+# --- Lotes ---
+
+class FakeBatch:
+    def __init__(self, callback, responses):
+        self.callback = callback
+        self.responses = responses
+        self.items = []
+
+    def add(self, request, request_id):
+        self.items.append(request_id)
+
+    def execute(self):
+        for request_id in self.items:
+            outcome = self.responses[request_id].pop(0)
+            if isinstance(outcome, Exception):
+                self.callback(request_id, None, outcome)
+            else:
+                self.callback(request_id, outcome, None)
+
+
+def test_batch_retries_only_the_failed_items(scheduler, sleeps):
+    responses = {'a': [{'id': 'a'}], 'b': [http_error(429), {'id': 'b'}], 'c': [http_error(404)]}
+    batches = []
+
+    def new_batch(callback):
+        batches.append(FakeBatch(callback, responses))
+        return batches[-1]
+
+    requests = [(request_id, FakeRequest(method='POST')) for request_id in 'abc']
+    results = scheduler.execute_batch(new_batch, requests, 'sheets.insert', limit=2)
+    assert [batch.items for batch in batches] == [['a', 'b'], ['c'], ['b']]
+    assert results['a'] == ({'id': 'a'}, None)
+    assert results['b'] == ({'id': 'b'}, None)
+    assert results['c'][1].resp.status == 404
+    assert len(sleeps) == 1
+
+
+def test_background_calls_lower_the_priority():
+    with background_calls():
+        assert call_priority.get() == PRIORITY_BACKGROUND
+    assert call_priority.get() == 0
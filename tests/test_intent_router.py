@@ -0,0 +1,68 @@
+import pytest
+
+from utils.intent_router import IntentRouter
+
+
+def _router():
+    router = IntentRouter()
+    router.register('desfazer', r'desfazer(?:\s[uú]ltimo\sgasto)?', priority=10, whole_message=True)
+    router.register('excluir_numero', r'excluir (?P<number>\d{1,2})', priority=30, whole_message=True)
+    router.register('eventos', r'eventos(?:\s+(?P<periodo>.+))?')
+    return router
+
+
+@pytest.mark.parametrize('text', ['desfazer', 'desfazer último gasto', '  desfazer!'])
+def test_whole_message_intent_matches_the_command(text):
+    intent, _ = _router().match(text)
+    assert intent.name == 'desfazer'
+
+
+@pytest.mark.parametrize('text', ['quero desfazer isso', 'não é para desfazer', 'desfazer o que eu disse ontem'])
+def test_whole_message_intent_ignores_longer_sentences(text):
+    intent, _ = _router().match(text)
+    assert intent is None
+
+
+def test_whole_message_intent_does_not_hide_other_intents():
+    intent, groups = _router().match('lembra dos eventos de amanhã? excluir 2')
+    assert intent.name == 'eventos'
+    intent, groups = _router().match('excluir 2')
+    assert (intent.name, groups) == ('excluir_numero', {'number': '2'})
+
+
+# Os padrões de verdade, registrados em main.py (precisa das dependências do bot)
+@pytest.fixture(scope='module')
+def bot_router():
+    pytest.importorskip('telegram')
+    pytest.importorskip('googleapiclient')
+    from main import router
+    return router
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('desfazer', 'desfazer_lancamento'),
+    ('desfazer último gasto', 'desfazer_lancamento'),
+    ('excluir 2', 'excluir_evento_numero'),
+    ('excluir evento 3', 'excluir_evento_numero'),
+    ('excluir evento reunião de amanhã', 'excluir_evento'),
+    ('excluir eventos de amanhã', 'excluir_eventos_do_dia'),
+    ('remover orçamento de lazer', 'remover_orcamento'),
+])
+def test_destructive_commands(bot_router, text, expected):
+    intent, _ = bot_router.match(text)
+    assert intent.name == expected
+
+
+@pytest.mark.parametrize('text', [
+    'quero desfazer isso',
+    'acho que vou desfazer o último gasto depois',
+    'a reunião virou a de número excluir 2 da lista',
+    'não sei se devo excluir 2',
+    'eu ia excluir eventos de amanhã mas desisti',
+    'pensei em remover orçamento de lazer',
+])
+def test_near_miss_sentences_do_not_reach_destructive_intents(bot_router, text):
+    intent, _ = bot_router.match(text)
+    assert intent is None or intent.name not in {
+        'desfazer_lancamento', 'excluir_evento_numero', 'excluir_evento', 'excluir_eventos_do_dia', 'remover_orcamento'
+    }
@@ -0,0 +1,131 @@
+import re
+import datetime
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+from utils.ledger_cache import LedgerCache
+from utils.finance_queue import FinanceWriteQueue
+from utils.date_parser import Period
+
+
+class FakeSheet:
+    """fetch_func em memória: guarda os ranges pedidos"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.ranges = []
+
+    def fetch(self, spreadsheet_id, range_name):
+        self.ranges.append(range_name)
+        first = int(re.search(r'!A(\d+)', range_name).group(1))
+        return self.rows[first - 2:]
+
+
+def _row(day, valor, tipo='Despesa', categoria='Mercado', key=None):
+    row = [f'{day:02d}/10/2026 10:00:00', 'compra', str(valor), tipo, categoria]
+    return row + [key] if key else row
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet([_row(1, 100), _row(2, 50, categoria='Lazer'), _row(3, 1000, 'Receita', 'Salário')])
+
+
+@pytest.fixture
+def ledger(tmp_path, sheet):
+    ledger = LedgerCache(str(tmp_path / 'ledger.db'), fetch_func=sheet.fetch, sync_interval=60)
+    yield ledger
+    ledger.close()
+
+
+def test_sync_reads_only_new_rows(ledger, sheet):
+    assert ledger.sync('A') == 3
+    sheet.rows.append(_row(4, 20))
+    assert ledger.sync('A', force=True) == 1
+    assert sheet.ranges == ['Sheet1!A2:F', 'Sheet1!A5:F']
+    assert ledger.rows_synced('A') == 4
+
+
+def test_sync_waits_for_the_interval_unless_rows_were_written(ledger, sheet):
+    ledger.sync('A')
+    sheet.rows.append(_row(4, 20))
+    assert ledger.sync('A') == 0
+    ledger.on_rows_written('A', [sheet.rows[-1]])
+    assert ledger.sync('A') == 1
+
+
+def test_invalid_rows_keep_their_position(ledger, sheet):
+    sheet.rows.insert(1, ['', '', '', '', ''])
+    ledger.sync('A')
+    assert ledger.rows_synced('A') == 4
+    sheet.rows.append(_row(5, 7))
+    ledger.sync('A', force=True)
+    assert sheet.ranges[-1] == 'Sheet1!A6:F'
+    assert ledger.month_totals('A', 2026, 10) == {'Despesa': 157.0, 'Receita': 1000.0}
+
+
+def test_totals_are_kept_up_to_date(ledger, sheet):
+    assert ledger.synced_month_totals('A', 2026, 10) == {'Despesa': 150.0, 'Receita': 1000.0}
+    sheet.rows.append(_row(20, 30))
+    ledger.sync('A', force=True)
+    assert ledger.month_totals('A', 2026, 10) == {'Despesa': 180.0, 'Receita': 1000.0}
+    assert ledger.month_totals_by_category('A', 2026, 10) == [('Mercado', 130.0), ('Lazer', 50.0)]
+    assert ledger.period_totals('A', datetime.date(2026, 10, 2), datetime.date(2026, 10, 4)) == {
+        'Despesa': 50.0, 'Receita': 1000.0}
+    assert ledger.month_totals('B', 2026, 10) == {}
+
+
+def test_known_keys(ledger, sheet):
+    sheet.rows.append(_row(5, 10, key='k1'))
+    ledger.sync('A')
+    assert ledger.known_keys('A', ['k1', 'k2']) == {'k1'}
+    assert ledger.known_keys('B', ['k1']) == set()
+
+
+# period_totals (main.py): ledger + linhas que ainda estão na fila de envio
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = FinanceWriteQueue(str(tmp_path / 'journal.db'), append_func=lambda *args: None,
+                              find_keys_func=lambda *args: set())
+    yield queue
+    queue._db.close()
+
+
+@pytest.fixture
+def period_totals():
+    pytest.importorskip('telegram')
+    from main import period_totals
+    october = Period(datetime.date(2026, 10, 1), datetime.date(2026, 11, 1), 'outubro')
+    return lambda ledger, queue: period_totals(ledger, queue, 'A', october)[0]
+
+
+def test_unsent_rows_are_added_to_the_totals(ledger, queue, period_totals):
+    queue.enqueue('A', _row(10, 5), key='k1')
+    assert period_totals(ledger, queue) == {'Despesa': 155.0, 'Receita': 1000.0}
+
+
+def test_row_already_in_the_ledger_is_counted_once(ledger, sheet, queue, period_totals):
+    # Chegou à planilha (e ao ledger), mas o envio ainda não apagou a linha do diário
+    queue.enqueue('A', _row(10, 5), key='k1')
+    sheet.rows.append(_row(10, 5, key='k1'))
+    assert period_totals(ledger, queue) == {'Despesa': 155.0, 'Receita': 1000.0}
+
+
+def test_rows_without_a_key_get_one(ledger, sheet, queue, period_totals):
+    queue.enqueue('A', _row(10, 5))
+    [(key, _)] = queue.pending_entries('A')
+    assert key.startswith('q:')
+    sheet.rows.append(_row(10, 5, key=key))
+    assert period_totals(ledger, queue) == {'Despesa': 155.0, 'Receita': 1000.0}
+
+
+def test_old_keyless_row_being_sent_is_left_out(ledger, queue, period_totals):
+    # Diário antigo, de antes das chaves: a linha em envio pode já estar na planilha
+    queue._db.execute("INSERT INTO pending_rows (spreadsheet_id, row_json, created_at) VALUES ('A', ?, 0)",
+                      ('["10/10/2026 10:00:00", "compra", "5", "Despesa", "Mercado"]',))
+    [(row_id,)] = queue._db.execute("SELECT id FROM pending_rows").fetchall()
+    assert period_totals(ledger, queue) == {'Despesa': 155.0, 'Receita': 1000.0}
+    queue._sending = {row_id}
+    assert period_totals(ledger, queue) == {'Despesa': 150.0, 'Receita': 1000.0}
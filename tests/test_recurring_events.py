@@ -0,0 +1,97 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('googleapiclient')
+import main
+
+
+class FakeBot:
+    id = 1
+
+    def __init__(self):
+        self.texts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+
+@pytest.fixture
+def schedule(monkeypatch):
+    """Manda a mensagem para o roteador e devolve (inícios dos eventos criados, resposta)"""
+    created = []
+
+    async def create_events(bodies, timeout=None):
+        created.extend(bodies)
+        return [(body, None) for body in bodies]
+
+    monkeypatch.setattr(main, 'create_calendar_events_async', create_events)
+    monkeypatch.setattr(main, 'calendar_cache_for', lambda context: SimpleNamespace(apply=lambda event: None))
+
+    def run(text):
+        created.clear()
+        bot = FakeBot()
+        update = SimpleNamespace(update_id=1, effective_chat=SimpleNamespace(id=10), get_bot=lambda: bot)
+        context = SimpleNamespace(bot=bot)
+        assert asyncio.run(main.router.dispatch(text, update, context)) == 'agendar_repetido'
+        starts = [datetime.datetime.fromisoformat(body['start']['dateTime']) for body in created]
+        return starts, bot.texts[-1]
+
+    return run
+
+
+@pytest.mark.parametrize('count, unit, weekly, expected', [
+    (None, None, True, 4),
+    (None, None, False, 7),
+    (10, 'dias', True, 2),
+    (14, 'dias', True, 2),
+    (10, 'dias', False, 10),
+    (3, 'semanas', True, 3),
+    (2, 'semanas', False, 14),
+    (5, 'vezes', True, 5),
+])
+def test_recurrence_count_follows_the_unit(count, unit, weekly, expected):
+    assert main.recurrence_count(count, unit, weekly) == expected
+
+
+def test_weekly_for_ten_days_creates_two_events(schedule):
+    starts, text = schedule('agendar natação às 9 toda terça por 10 dias')
+    assert len(starts) == 2
+    assert starts[1] - starts[0] == datetime.timedelta(days=7)
+    assert all(start.weekday() == 1 and start.hour == 9 for start in starts)
+    assert text.startswith("2 evento(s) 'natação'")
+
+
+def test_daily_for_two_weeks_creates_fourteen_events(schedule):
+    starts, _ = schedule('agendar remédio às 8 todos os dias por 2 semanas')
+    assert len(starts) == 14
+    assert all(later - earlier == datetime.timedelta(days=1) for earlier, later in zip(starts, starts[1:]))
+
+
+@pytest.mark.parametrize('text, hour, minute', [
+    ('agendar academia às 7h30 todos os dias', 7, 30),
+    ('agendar academia 10:30 todos os dias', 10, 30),
+    ('agendar inglês às 3 da tarde toda quarta', 15, 0),
+    ('agendar natação às 9 toda terça', 9, 0),
+])
+def test_time_is_read_like_agendar(schedule, text, hour, minute):
+    starts, reply = schedule(text)
+    assert starts and all((start.hour, start.minute) == (hour, minute) for start in starts)
+    assert starts[0] > datetime.datetime.now()
+    assert f"às {hour:02d}h" in reply
+
+
+def test_duration_is_kept(schedule, monkeypatch):
+    bodies = []
+    original = main.event_body
+    monkeypatch.setattr(main, 'event_body', lambda *args: bodies.append(args) or original(*args))
+    schedule('agendar curso das 19h às 21h toda segunda por 2 semanas')
+    assert [args[2] for args in bodies] == [datetime.timedelta(hours=2)] * 2
+
+
+def test_missing_time_is_reported(schedule):
+    _, reply = schedule('agendar academia todos os dias')
+    assert reply.startswith('Não consegui entender a hora')
@@ -0,0 +1,157 @@
+import io
+import re
+import datetime
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+from utils.statement_import import (
+    iter_statement, categorize, entry_hash, import_statement, StatementError, Transaction
+)
+from utils.ledger_cache import LedgerCache
+
+CSV = """Banco Exemplo S.A.
+Agência 0001;Conta 12345-6
+Data;Histórico;Valor
+01/10/2026;SUPERMERCADO  CARREFOUR;-1.234,56
+02/10/2026;Salário outubro;5000,00
+data ruim;Uber;-20,00
+03/10/2026;Café;-8,50
+03/10/2026;Café;-8,50
+"""
+
+OFX = """OFXHEADER:100
+DATA:OFXSGML
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20261005120000[-3:BRT]
+<TRNAMT>-59.90
+<MEMO>NETFLIX.COM
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20261006
+<TRNAMT>150.00
+<NAME>PIX RECEBIDO
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+def _parse(content, filename='', encoding='utf-8'):
+    return list(iter_statement(io.BufferedReader(io.BytesIO(content.encode(encoding))), filename))
+
+
+def test_csv_with_preamble_and_brazilian_numbers():
+    transactions = _parse(CSV)
+    assert transactions[0] == Transaction(datetime.datetime(2026, 10, 1), 'SUPERMERCADO CARREFOUR', 1234.56, 'Despesa')
+    assert transactions[1] == Transaction(datetime.datetime(2026, 10, 2), 'Salário outubro', 5000.0, 'Receita')
+    assert transactions[2] is None
+    assert len(transactions) == 5
+
+
+def test_csv_without_header_and_latin1():
+    transactions = _parse("05/10/2026,Padaria São João,-12.00\n", encoding='latin-1')
+    assert transactions == [Transaction(datetime.datetime(2026, 10, 5), 'Padaria São João', 12.0, 'Despesa')]
+
+
+def test_csv_with_type_column():
+    transactions = _parse("date,description,amount,type\n2026-10-07,Aluguel,1500.00,D\n2026-10-08,Reembolso,30,C\n")
+    assert [(t.value, t.type) for t in transactions] == [(1500.0, 'Despesa'), (30.0, 'Receita')]
+
+
+def test_csv_without_date_and_value_columns_is_rejected():
+    with pytest.raises(StatementError):
+        _parse("nome,idade\nana,30\n")
+
+
+def test_ofx_sgml():
+    transactions = _parse(OFX, 'extrato.ofx')
+    assert transactions == [
+        Transaction(datetime.datetime(2026, 10, 5), 'NETFLIX.COM', 59.9, 'Despesa'),
+        Transaction(datetime.datetime(2026, 10, 6), 'PIX RECEBIDO', 150.0, 'Receita'),
+    ]
+
+
+def test_ofx_without_transactions_is_rejected():
+    with pytest.raises(StatementError):
+        _parse("OFXHEADER:100\n<OFX></OFX>\n", 'vazio.ofx')
+
+
+def test_categorize_prefers_the_history():
+    assert categorize('SUPERMERCADO CARREFOUR') == 'Mercado'
+    assert categorize('Uber *trip') == 'Transporte'
+    assert categorize('qualquer coisa') == 'Outros'
+    assert categorize('Uber *trip', {'uber *trip': 'Trabalho'}) == 'Trabalho'
+
+
+def test_entry_hash_ignores_case_spacing_and_sign():
+    day = datetime.datetime(2026, 10, 3)
+    assert entry_hash(day, 'Café  da Manhã', -8.5, 'Despesa') == entry_hash(day, 'cafe da manha', 8.5, 'Despesa')
+    assert entry_hash(day, 'Café', 8.5, 'Despesa') != entry_hash(day, 'Café', 8.5, 'Receita')
+    assert entry_hash(day, 'Café', 8.5, 'Despesa') != entry_hash(day + datetime.timedelta(days=1), 'Café', 8.5, 'Despesa')
+    assert len(entry_hash(day, 'Café', 8.5, 'Despesa')) == 12
+
+
+# --- Importação completa, contra uma planilha em memória ---
+
+class FakeSheet:
+    def __init__(self):
+        self.rows = []
+        self.appends = 0
+
+    def append(self, spreadsheet_id, rows):
+        self.appends += 1
+        self.rows.extend([str(cell) for cell in row] for row in rows)
+
+    def fetch(self, spreadsheet_id, range_name):
+        first = int(re.search(r'!A(\d+)', range_name).group(1))
+        return self.rows[first - 2:]
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet()
+
+
+@pytest.fixture
+def ledger(tmp_path, sheet):
+    ledger = LedgerCache(str(tmp_path / 'ledger.db'), fetch_func=sheet.fetch)
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def statement(tmp_path):
+    path = tmp_path / 'extrato.csv'
+    path.write_text(CSV, encoding='utf-8')
+    return str(path)
+
+
+def test_import_appends_in_chunks(statement, ledger, sheet):
+    progress = []
+    result = import_statement(statement, 'A', ledger, append_func=sheet.append, chunk_rows=2,
+                              progress=progress.append)
+    assert (result.imported, result.duplicates, result.invalid, result.appends) == (4, 0, 1, 2)
+    assert (result.expenses, result.income) == (1234.56 + 17.0, 5000.0)
+    assert progress == [2, 4]
+    assert sheet.rows[0] == ['01/10/2026 00:00:00', 'SUPERMERCADO CARREFOUR', '1234.56', 'Despesa', 'Mercado']
+
+
+def test_importing_the_same_statement_twice_adds_nothing(statement, ledger, sheet):
+    import_statement(statement, 'A', ledger, append_func=sheet.append)
+    result = import_statement(statement, 'A', ledger, append_func=sheet.append)
+    assert (result.imported, result.duplicates, result.appends) == (0, 4, 0)
+    assert len(sheet.rows) == 4
+
+
+def test_repeated_entries_are_counted_not_collapsed(tmp_path, ledger, sheet):
+    # Um dos dois cafés já estava na planilha: o outro ainda entra
+    sheet.rows.append(['03/10/2026 00:00:00', 'café', '8.50', 'Despesa', 'Alimentação'])
+    path = tmp_path / 'cafes.csv'
+    path.write_text("Data;Histórico;Valor\n03/10/2026;Café;-8,50\n03/10/2026;Café;-8,50\n", encoding='utf-8')
+    result = import_statement(str(path), 'A', ledger, append_func=sheet.append)
+    assert (result.imported, result.duplicates) == (1, 1)
+    # A categoria vem do histórico da planilha
+    assert sheet.rows[-1][4] == 'Alimentação'
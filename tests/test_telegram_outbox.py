@@ -0,0 +1,170 @@
+import time
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('telegram')
+from telegram.error import RetryAfter
+
+from utils.telegram_outbox import OutboundLimiter, ProgressMessage, _Pace, MERGE_SEPARATOR
+
+pytestmark = pytest.mark.filterwarnings('ignore::DeprecationWarning')
+
+
+class FakeApi:
+    """callback do rate limiter: guarda (momento, endpoint, dados) de cada chamada"""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self.started = time.monotonic()
+
+    async def __call__(self, endpoint, data, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.calls.append((time.monotonic() - self.started, endpoint, data))
+        await asyncio.sleep(0)
+        return {'ok': True, 'text': data.get('text')}
+
+
+def _send(limiter, api, chat_id, text, rate_limit_args=None):
+    return limiter.process_request(api, (), {}, 'sendMessage', {'chat_id': chat_id, 'text': text}, rate_limit_args)
+
+
+def test_pace_allows_a_burst_then_spaces_requests():
+    pace = _Pace(rate=2, burst=3)
+    assert [pace.reserve(10.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert pace.reserve(10.0) == pytest.approx(0.5)
+    assert pace.reserve(10.0) == pytest.approx(1.0)
+    assert not pace.idle(10.0)
+    assert pace.idle(20.0)
+
+
+def test_replies_queued_for_a_chat_are_merged():
+    api = FakeApi()
+
+    async def main():
+        limiter = OutboundLimiter(chat_rate=20, chat_burst=1)
+        return await asyncio.gather(*(_send(limiter, api, 1, text) for text in ('a', 'b', 'c')))
+
+    results = asyncio.run(main())
+    assert [data['text'] for _, _, data in api.calls] == [MERGE_SEPARATOR.join(['a', 'b', 'c'])]
+    # Todos recebem a resposta da chamada em que foram
+    assert results[0] == results[1] == results[2]
+
+
+def test_chat_rate_spaces_messages_that_cannot_be_merged():
+    api = FakeApi()
+
+    async def main():
+        limiter = OutboundLimiter(chat_rate=20, chat_burst=1)
+        await asyncio.gather(*(
+            _send(limiter, api, 1, text, {'merge': False})
+            for text in ('a', 'b', 'c')))
+
+    asyncio.run(main())
+    times = [moment for moment, _, _ in api.calls]
+    assert len(times) == 3
+    assert times[2] - times[0] >= 0.09
+
+
+def test_other_chats_are_not_held_by_a_slow_chat():
+    api = FakeApi()
+
+    async def main():
+        limiter = OutboundLimiter(chat_rate=5, chat_burst=1, global_rate=1000, global_burst=100)
+        first = asyncio.gather(*(
+            _send(limiter, api, 1, text, {'merge': False})
+            for text in ('a', 'b')))
+        await _send(limiter, api, 2, 'outro chat')
+        await first
+
+    asyncio.run(main())
+    sent = {data['text']: moment for moment, _, data in api.calls}
+    assert sent['outro chat'] < 0.1
+    assert sent['b'] >= 0.15
+
+
+def test_pending_edits_keep_only_the_last_one():
+    api = FakeApi()
+
+    async def main():
+        limiter = OutboundLimiter(chat_rate=20, chat_burst=1)
+        await asyncio.gather(
+            _send(limiter, api, 1, 'início'),
+            *(limiter.process_request(api, (), {}, 'editMessageText',
+                                      {'chat_id': 1, 'message_id': 5, 'text': f'{n}%'}, None)
+              for n in (10, 50, 90)))
+
+    asyncio.run(main())
+    assert [(endpoint, data['text']) for _, endpoint, data in api.calls] == [
+        ('sendMessage', 'início'), ('editMessageText', '90%')]
+
+
+def test_429_pauses_every_chat_and_retries():
+    api = FakeApi(errors=[RetryAfter(datetime.timedelta(milliseconds=100))])
+
+    async def main():
+        limiter = OutboundLimiter()
+        first = asyncio.create_task(_send(limiter, api, 1, 'a'))
+        await asyncio.sleep(0.02)
+        await _send(limiter, api, 2, 'b')
+        await first
+
+    asyncio.run(main())
+    assert sorted(data['text'] for _, _, data in api.calls) == ['a', 'b']
+    assert all(moment >= 0.09 for moment, _, _ in api.calls)
+
+
+def test_429_gives_up_after_max_retries():
+    api = FakeApi(errors=[RetryAfter(datetime.timedelta(milliseconds=1))] * 3)
+
+    async def main():
+        limiter = OutboundLimiter(max_retries=2)
+        await _send(limiter, api, 1, 'a')
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(main())
+
+
+def test_calls_without_chat_skip_the_queues():
+    api = FakeApi()
+
+    async def main():
+        limiter = OutboundLimiter()
+        await limiter.process_request(api, (), {}, 'getMe', {}, None)
+        return limiter
+
+    assert asyncio.run(main())._chats == {}
+    assert api.calls[0][1] == 'getMe'
+
+
+class FakeBot:
+    rate_limiter = None
+
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append(text)
+
+
+def test_progress_message_edits_at_most_once_per_interval():
+    bot = FakeBot()
+
+    async def main():
+        progress = ProgressMessage(bot, 1, interval=60)
+        await progress.update('0 de 100')
+        await progress.update('50 de 100')
+        await progress.finish('100 importados')
+
+    asyncio.run(main())
+    assert bot.sent == ['0 de 100']
+    assert bot.edits == ['100 importados']
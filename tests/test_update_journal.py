@@ -0,0 +1,133 @@
+import re
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('telegram')
+from telegram import Update
+
+from utils.update_journal import (
+    ChatOrderedUpdateProcessor, UpdateJournal, replay, idempotency_key, calendar_event_id
+)
+
+
+def _update(update_id, chat_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': 'oi'},
+    }, None)
+
+
+def _run_all(updates, delays):
+    """Entrega as atualizações como a Application faz (uma tarefa por atualização) e devolve
+    a ordem em que terminaram"""
+    finished = []
+
+    async def handle(update):
+        await asyncio.sleep(delays.get(update.update_id, 0))
+        finished.append(update.update_id)
+
+    async def main():
+        processor = ChatOrderedUpdateProcessor()
+        tasks = [asyncio.create_task(processor.process_update(update, handle(update))) for update in updates]
+        await asyncio.gather(*tasks)
+        return processor
+
+    processor = asyncio.run(main())
+    return finished, processor
+
+
+def test_same_chat_runs_in_arrival_order():
+    finished, processor = _run_all([_update(1, 10), _update(2, 10), _update(3, 10)], {1: 0.05, 2: 0.01})
+    assert finished == [1, 2, 3]
+    assert processor._tails == {}
+
+
+def test_other_chats_do_not_wait():
+    finished, _ = _run_all([_update(1, 10), _update(2, 20)], {1: 0.05})
+    assert finished == [2, 1]
+
+
+def test_failed_update_does_not_block_the_chat():
+    finished = []
+
+    async def fail():
+        raise RuntimeError('falhou')
+
+    async def ok():
+        finished.append('ok')
+
+    async def main():
+        processor = ChatOrderedUpdateProcessor()
+        first = asyncio.create_task(processor.process_update(_update(1, 10), fail()))
+        second = asyncio.create_task(processor.process_update(_update(2, 10), ok()))
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        assert isinstance(results[0], RuntimeError)
+
+    asyncio.run(main())
+    assert finished == ['ok']
+
+
+# --- Diário ---
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = UpdateJournal(str(tmp_path / 'updates.db'))
+    yield journal
+    journal.close()
+
+
+def test_finished_update_is_not_processed_again(journal):
+    update = _update(1, 10)
+    assert journal.begin(update)
+    # Reenvio enquanto ainda está em andamento
+    assert not journal.begin(update)
+    journal.finish(1)
+    assert not journal.begin(update)
+    assert journal.pending() == []
+
+
+def test_unfinished_updates_survive_a_restart(tmp_path, journal):
+    journal.begin(_update(1, 10))
+    journal.begin(_update(2, 10))
+    journal.finish(2)
+    journal.close()
+    reopened = UpdateJournal(str(tmp_path / 'updates.db'))
+    assert [data['update_id'] for data in reopened.pending()] == [1]
+    assert reopened.begin(_update(1, 10))
+    reopened.close()
+
+
+def test_recorded_update_can_be_forgotten(journal):
+    data = _update(1, 10).to_dict()
+    assert journal.record(data, 10)
+    assert not journal.record(data, 10)
+    journal.forget(1)
+    assert journal.pending() == []
+    assert journal.record(data, 10)
+
+
+def test_replay_keeps_each_chat_in_order(journal):
+    for update_id, chat_id in [(1, 10), (2, 20), (3, 10), (4, 20)]:
+        journal.record(_update(update_id, chat_id).to_dict(), chat_id)
+    processed = []
+
+    async def process_update(update):
+        # A primeira de cada chat demora: a seguinte do mesmo chat espera por ela
+        await asyncio.sleep(0.02 if update.update_id < 3 else 0)
+        processed.append(update.update_id)
+
+    application = SimpleNamespace(bot=None, process_update=process_update)
+    assert asyncio.run(replay(application, journal)) == 4
+    assert processed.index(1) < processed.index(3)
+    assert processed.index(2) < processed.index(4)
+
+
+def test_keys_and_event_ids_are_stable():
+    update = SimpleNamespace(update_id=7, get_bot=lambda: SimpleNamespace(id=99))
+    assert idempotency_key(update, 1) == '99:7:1'
+    event_id = calendar_event_id('99:7:1')
+    assert event_id == calendar_event_id('99:7:1') != calendar_event_id('99:7:2')
+    # Calendar: só letras de a a v e dígitos, de 5 a 1024 caracteres
+    assert re.fullmatch(r'[0-9a-v]{5,1024}', event_id)
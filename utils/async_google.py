@@ -0,0 +1,95 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.gcalendar_utils import (
+    create_calendar_event, list_calendar_events, delete_calendar_event, update_calendar_event,
+    create_calendar_events, delete_calendar_events, patch_calendar_events
+)
+
+# As bibliotecas do Google são síncronas. Para não travar o event loop do
+# python-telegram-bot, as chamadas rodam num pool de threads limitado.
+MAX_WORKERS = int(os.getenv("GOOGLE_MAX_WORKERS", "8"))
+
+# Quantas chamadas podem estar em andamento ao mesmo tempo (as demais esperam a vez)
+MAX_CONCURRENT_CALLS = int(os.getenv("GOOGLE_MAX_CONCURRENT_CALLS", str(MAX_WORKERS)))
+
+# Tempo máximo (em segundos) de cada chamada, contando a espera na fila
+DEFAULT_TIMEOUT = float(os.getenv("GOOGLE_CALL_TIMEOUT", "20"))
+
+# Tarefas longas (importação de extrato: vários appends, minutos) têm um pool próprio,
+# para não ocupar as threads das chamadas curtas de quem está conversando com o bot
+LONG_CALL_WORKERS = int(os.getenv("GOOGLE_LONG_CALL_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="google-api")
+_long_executor = ThreadPoolExecutor(max_workers=LONG_CALL_WORKERS, thread_name_prefix="google-long")
+_semaphore = None
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    return _semaphore
+
+
+async def _acquire_and_run(call):
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore():
+        return await loop.run_in_executor(_executor, call)
+
+
+async def run_google_call(func, *args, timeout=None, **kwargs):
+    """Executa uma função síncrona do Google sem bloquear o event loop.
+
+    Levanta asyncio.TimeoutError se passar do tempo limite. A thread continua
+    rodando até a API responder, mas o handler do Telegram é liberado.
+    """
+    # Copia o contexto (contextvars) para a thread do pool
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await asyncio.wait_for(_acquire_and_run(call), timeout or DEFAULT_TIMEOUT)
+
+
+async def run_long_call(func, *args, **kwargs):
+    """Como run_google_call, mas no pool das tarefas longas e sem tempo limite
+    (quem chama decide quanto esperar, com asyncio.shield para a tarefa seguir)"""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_long_executor, call)
+
+
+async def create_calendar_event_async(summary, start_time, duration=None, event_id=None, timeout=None):
+    return await run_google_call(create_calendar_event, summary, start_time, duration, event_id, timeout=timeout)
+
+
+async def list_calendar_events_async(query=None, time_min=None, time_max=None, timeout=None):
+    return await run_google_call(list_calendar_events, query=query, time_min=time_min, time_max=time_max, timeout=timeout)
+
+
+async def delete_calendar_event_async(event_id, timeout=None):
+    return await run_google_call(delete_calendar_event, event_id, timeout=timeout)
+
+
+async def update_calendar_event_async(event_id, new_body, timeout=None):
+    return await run_google_call(update_calendar_event, event_id, new_body, timeout=timeout)
+
+
+async def create_calendar_events_async(bodies, timeout=None):
+    return await run_google_call(create_calendar_events, bodies, timeout=timeout)
+
+
+async def delete_calendar_events_async(event_ids, timeout=None):
+    return await run_google_call(delete_calendar_events, event_ids, timeout=timeout)
+
+
+async def patch_calendar_events_async(changes, timeout=None):
+    return await run_google_call(patch_calendar_events, changes, timeout=timeout)
+
+
+def shutdown():
+    """Espera as chamadas em andamento terminarem e fecha os pools"""
+    _executor.shutdown(wait=True)
+    _long_executor.shutdown(wait=True)
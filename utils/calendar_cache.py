@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+import unicodedata
+from zoneinfo import ZoneInfo
+
+from utils.gcalendar_utils import TIMEZONE, SyncTokenExpired, list_calendar_changes
+
+# Intervalo mínimo (em segundos) entre duas sincronizações incrementais
+SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "15"))
+
+# Na carga completa, quantos dias para trás buscar (eventos recorrentes são expandidos)
+LOOKBACK_DAYS = int(os.getenv("CALENDAR_LOOKBACK_DAYS", "30"))
+
+LOCAL_TZ = ZoneInfo(TIMEZONE)
+
+
+def normalize(text):
+    """Minúsculas e sem acentos, para comparar títulos"""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _parse_datetime(value):
+    # Sem offset, o horário está no fuso do campo timeZone (o do bot)
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=LOCAL_TZ)
+
+
+def event_start(event):
+    """Início do evento como datetime com fuso (eventos de dia inteiro começam à meia-noite)"""
+    start = event.get('start', {})
+    if 'dateTime' in start:
+        return _parse_datetime(start['dateTime'])
+    return datetime.datetime.combine(datetime.date.fromisoformat(start['date']), datetime.time.min, LOCAL_TZ)
+
+
+def event_end(event):
+    end = event.get('end', {})
+    if 'dateTime' in end:
+        return _parse_datetime(end['dateTime'])
+    if 'date' in end:
+        return datetime.datetime.combine(datetime.date.fromisoformat(end['date']), datetime.time.min, LOCAL_TZ)
+    return event_start(event)
+
+
+def shifted_times(event, days):
+    """Campos start/end do evento deslocados em days dias (corpo de um patch)"""
+    delta = datetime.timedelta(days=days)
+    fields = {}
+    for key in ('start', 'end'):
+        value = dict(event.get(key, {}))
+        if 'dateTime' in value:
+            value['dateTime'] = (_parse_datetime(value['dateTime']) + delta).isoformat()
+        elif 'date' in value:
+            value['date'] = (datetime.date.fromisoformat(value['date']) + delta).isoformat()
+        fields[key] = value
+    return fields
+
+
+class CalendarCache:
+    """Cópia em memória da agenda, mantida em dia com syncToken.
+
+    A primeira sincronização baixa os eventos a partir de LOOKBACK_DAYS atrás;
+    as seguintes trazem só o que mudou. Listagens do dia e buscas por título
+    são respondidas localmente, sem q= na API.
+    """
+
+    def __init__(self, fetch_changes=list_calendar_changes, sync_interval=SYNC_INTERVAL):
+        self.fetch_changes = fetch_changes
+        self.sync_interval = sync_interval
+        self._events = {}
+        self._sync_token = None
+        self._last_sync = None
+        # _lock protege os eventos e só é segurado por instantes; _sync_lock deixa uma
+        # sincronização por vez, e a chamada ao Google acontece fora do _lock
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Sincroniza com o Google se a última sincronização tiver passado do intervalo.
+        Se outra thread já estiver sincronizando, responde com o que já está no cache
+        (só espera quando ainda não há nada carregado, ou com force)"""
+        if not force and self._last_sync is not None and time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=force or self._last_sync is None):
+            return
+        try:
+            if not force and self._last_sync is not None and time.monotonic() - self._last_sync < self.sync_interval:
+                return  # Outra thread acabou de sincronizar
+            if self._sync_token:
+                try:
+                    changes, sync_token = self.fetch_changes(sync_token=self._sync_token)
+                except SyncTokenExpired:
+                    logging.info("syncToken da agenda expirou; refazendo a sincronização completa")
+                    self._full_sync()
+                else:
+                    with self._lock:
+                        for event in changes:
+                            self._apply(event)
+                        self._sync_token = sync_token
+            else:
+                self._full_sync()
+            self._last_sync = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def _full_sync(self):
+        time_min = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=LOOKBACK_DAYS)).isoformat()
+        events, sync_token = self.fetch_changes(time_min=time_min)
+        with self._lock:
+            self._events = {}
+            for event in events:
+                self._apply(event)
+            self._sync_token = sync_token
+
+    def _apply(self, event):
+        if event.get('status') == 'cancelled':
+            self._events.pop(event['id'], None)
+        else:
+            self._events[event['id']] = event
+
+    def apply(self, event):
+        """Atualiza o cache depois de criar ou editar um evento pelo bot"""
+        with self._lock:
+            self._apply(event)
+
+    def remove(self, event_id):
+        """Tira o evento do cache depois de excluí-lo pelo bot"""
+        with self._lock:
+            self._events.pop(event_id, None)
+
+    def events_between(self, start, end):
+        """Eventos que começam entre start e end (datetimes; sem fuso = horário local)"""
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=LOCAL_TZ)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=LOCAL_TZ)
+        self.refresh()
+        with self._lock:
+            events = [event for event in self._events.values() if start <= event_start(event) < end]
+        return sorted(events, key=event_start)
+
+    def events_on(self, day):
+        start = datetime.datetime.combine(day, datetime.time.min)
+        return self.events_between(start, start + datetime.timedelta(days=1))
+
+    def search(self, title):
+        """Eventos cujo título contém o texto em palavras inteiras, sem diferenciar acentos
+        ("reunião" encontra "Reunião de equipe", mas "ana" não encontra "Banana").
+        O título não precisa caber no texto: "dentista" não casa com "cancelar dentista da ana".
+        Os próximos eventos vêm primeiro, depois os que já passaram"""
+        query = ' '.join(normalize(title).split())
+        if not query:
+            return []
+        pattern = re.compile(rf'(?<!\w){re.escape(query)}(?!\w)')
+        self.refresh()
+        now = datetime.datetime.now(LOCAL_TZ)
+        with self._lock:
+            found = [event for event in self._events.values()
+                     if pattern.search(' '.join(normalize(event.get('summary')).split()))]
+        upcoming = sorted((e for e in found if event_end(e) >= now), key=event_start)
+        past = sorted((e for e in found if event_end(e) < now), key=event_start, reverse=True)
+        return upcoming + past
+
+    def get(self, event_id):
+        with self._lock:
+            return self._events.get(event_id)
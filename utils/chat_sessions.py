@@ -0,0 +1,131 @@
+"""Memória curta de cada conversa, para comandos de continuação.
+
+Depois de "eventos de hoje" o bot lembra a lista mostrada, então "excluir 2"
+sabe qual evento é sem buscar de novo. Depois de "gasto 15 reais ..." lembra
+o lançamento, para "desfazer último gasto". Cada chat guarda só ids, títulos
+e horários (registros com __slots__), e a sessão some depois de SESSION_TTL
+segundos sem uso. No modo webhook cada chat cai sempre no mesmo processo,
+então a memória do processo basta.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Tempo (em segundos) sem mensagens até o bot esquecer a conversa
+SESSION_TTL = float(os.getenv("SESSION_TTL", "900"))
+
+# Máximo de conversas lembradas ao mesmo tempo (as mais antigas saem primeiro)
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+
+
+class ListedEvent:
+    """Evento mostrado numa listagem: só o necessário para agir sobre ele depois"""
+    __slots__ = ('id', 'summary', 'start')
+
+    def __init__(self, event_id, summary, start):
+        self.id = event_id
+        self.summary = summary
+        self.start = start
+
+
+class LastEntry:
+    """Último lançamento registrado no chat (id no diário da fila e a linha enviada)"""
+    __slots__ = ('journal_id', 'spreadsheet_id', 'row')
+
+    def __init__(self, journal_id, spreadsheet_id, row):
+        self.journal_id = journal_id
+        self.spreadsheet_id = spreadsheet_id
+        self.row = row
+
+
+class ChatSession:
+    __slots__ = ('listed_events', 'listed_label', 'last_entry', 'expires_at')
+
+    def __init__(self):
+        self.listed_events = ()
+        self.listed_label = None
+        self.last_entry = None
+        self.expires_at = 0.0
+
+    def listed_event(self, number):
+        """Evento de número `number` (como foi mostrado, a partir de 1) ou None"""
+        if 1 <= number <= len(self.listed_events):
+            return self.listed_events[number - 1]
+        return None
+
+
+class SessionStore:
+    """Sessões por chat com expiração.
+
+    O OrderedDict fica na ordem do último uso; como o TTL é o mesmo para
+    todos, as sessões vencidas estão sempre no começo e saem em O(1) cada.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, maxsize=MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if session.expires_at > now and len(self._sessions) <= self.maxsize:
+                return
+            del self._sessions[chat_id]
+
+    def get(self, chat_id):
+        """Sessão do chat (renovando o prazo) ou None se não houver ou tiver vencido"""
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                session.expires_at = now + self.ttl
+                self._sessions.move_to_end(chat_id)
+            return session
+
+    def session(self, chat_id):
+        """Sessão do chat, criando uma nova se preciso"""
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                session = self._sessions[chat_id] = ChatSession()
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(chat_id)
+            self._evict(now)
+            return session
+
+    def remember_events(self, chat_id, events, label):
+        """Guarda a lista de eventos que acabou de ser mostrada (na mesma ordem)"""
+        session = self.session(chat_id)
+        session.listed_events = tuple(
+            ListedEvent(event['id'], event.get('summary', ''), event.get('start', {}).get('dateTime')
+                        or event.get('start', {}).get('date'))
+            for event in events
+        )
+        session.listed_label = label
+
+    def forget_event(self, chat_id, event_id):
+        """Marca o evento como excluído na lista (os números dos outros não mudam)"""
+        session = self.get(chat_id)
+        if session is not None:
+            session.listed_events = tuple(None if listed is not None and listed.id == event_id else listed
+                                          for listed in session.listed_events)
+
+    def remember_entry(self, chat_id, entry):
+        self.session(chat_id).last_entry = entry
+
+    def pop_entry(self, chat_id):
+        """Tira e devolve o último lançamento do chat (None se não houver)"""
+        session = self.get(chat_id)
+        if session is None:
+            return None
+        entry, session.last_entry = session.last_entry, None
+        return entry
+
+    def __len__(self):
+        return len(self._sessions)
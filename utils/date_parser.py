@@ -0,0 +1,455 @@
+"""Datas e horários em português: "amanhã às 10h", "sexta 14:30 por 2 horas",
+"dia 25 das 9h às 12h", "25/12", "semana que vem", "de 01/10 a 15/10", "março".
+
+A gramática é um regex só, montado a partir de pedaços (dia, horário,
+duração, período) e compilado uma vez na importação. A análise de cada frase
+normalizada (minúsculas, sem acentos) fica num cache LRU como uma descrição
+relativa ("próxima sexta, 14h30"); só a conta final contra o dia de hoje é
+refeita a cada chamada, então uma frase repetida custa um lookup e algumas
+somas de datas.
+
+- split_schedule: separa "reunião com a ana amanhã às 10h" em título e horário (agendar).
+- parse_schedule: só o horário.
+- parse_period: intervalo de dias para listagens e totais ("eventos da semana", "total de março").
+"""
+import os
+import re
+import datetime
+import functools
+import unicodedata
+from collections import namedtuple
+
+# Quantas frases diferentes manter analisadas em memória
+CACHE_SIZE = int(os.getenv("DATE_PARSER_CACHE_SIZE", "4096"))
+
+# Horário de um evento: datetimes locais; end None = duração padrão. all_day quando só o dia foi dito
+Schedule = namedtuple('Schedule', 'start end all_day')
+
+# Intervalo de dias [start, end) e como mostrá-lo na resposta
+Period = namedtuple('Period', 'start end label')
+
+DIAS_SEMANA = ['segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado', 'domingo']
+MESES = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho', 'julho', 'agosto',
+         'setembro', 'outubro', 'novembro', 'dezembro']
+
+_WEEKDAYS = {'segunda': 0, 'terca': 1, 'quarta': 2, 'quinta': 3, 'sexta': 4, 'sabado': 5, 'domingo': 6}
+_MONTHS = {'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6, 'julho': 7,
+           'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12}
+_RELATIVE_DAYS = {'anteontem': -2, 'ontem': -1, 'hoje': 0, 'amanha': 1, 'depois de amanha': 2}
+_NUMBERS = {'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5, 'seis': 6,
+            'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10, 'onze': 11, 'doze': 12, 'quinze': 15, 'trinta': 30}
+
+# Palavras que sobram no fim do título ("reunião de | amanhã às 10h")
+_TITLE_TAIL = {'de', 'do', 'da', 'para', 'pra', 'na', 'no', 'em', 'as', 'a'}
+
+
+def _words(options):
+    # As mais longas primeiro: "depois de amanha" antes de "amanha"
+    return '|'.join(r'\s'.join(map(re.escape, word.split())) for word in sorted(options, key=len, reverse=True))
+
+
+_NUMBER = rf'\d{{1,3}}|{_words(_NUMBERS)}'
+
+
+def _day(p):
+    """Um dia: hoje, (próxima) sexta, dia 25, 25/12, 25 de dezembro, daqui a 3 dias"""
+    return rf'''(?:
+        (?P<{p}rel>{_words(_RELATIVE_DAYS)})
+      | (?:(?:n[ao]|nest[ae]|est[ae]|ess[ae])\s)?(?P<{p}next>proxim[ao]\s)?(?P<{p}wd>{_words(_WEEKDAYS)})
+        (?:[-\s]feira)?(?P<{p}later>\s(?:que\svem|da\ssemana\sque\svem))?
+      | (?:dia\s)?(?P<{p}d>\d{{1,2}})/(?P<{p}m>\d{{1,2}})(?:/(?P<{p}y>\d{{4}}|\d{{2}}))?
+      | (?:dia\s)?(?P<{p}dn>\d{{1,2}})\sde\s(?P<{p}mn>{_words(_MONTHS)})(?:\sde\s(?P<{p}yn>\d{{4}}))?
+      | dia\s(?P<{p}dom>\d{{1,2}})
+      | (?:daqui\sa|em)\s(?P<{p}in>{_NUMBER})\s(?P<{p}unit>dias?|semanas?)
+    )'''
+
+
+def _clock(p, strict):
+    """Um horário: 10h, 10:30, 10h30, 10 horas, 3 da tarde, meio-dia.
+    strict: sem "às" antes, o número sozinho não vale (exige h, :mm ou meio-dia)"""
+    return rf'''(?:
+        (?P<{p}noon>meio[-\s]dia|meia[-\s]noite)
+      | (?P<{p}h>\d{{1,2}})(?P<{p}mark>(?::|h)(?P<{p}min>\d{{2}})|\s?(?:h|hs|hrs?|horas?)\b){'' if strict else '?'}
+        (?:\s(?:da|de)\s(?P<{p}part>manha|tarde|noite|madrugada))?
+    )'''
+
+
+def _time(p):
+    """Horário com a preposição ("às 10h", "10h30") ou faixa ("das 9h às 12h")"""
+    return rf'''(?:
+        (?:das|de|entre)\s{_clock(p + 'f_', False)}\s(?:as|a|ate|e)\s{_clock(p + 't_', False)}
+      | (?:as|a|ao|pelas?)\s{_clock(p + 'c_', False)}
+      | {_clock(p + 's_', True)}
+    )'''
+
+
+_DURATION = rf'''(?:por|durante)\s(?:
+        (?P<dur_half>meia\shora)
+      | (?P<dur_hh>\d{{1,2}})h(?P<dur_mm>\d{{2}})
+      | (?P<dur_n>{_NUMBER})\s?(?P<dur_unit>h|hs|hrs?|horas?|min|minutos?)(?P<dur_and_half>\se\smeia)?
+    )'''
+
+# Dia e horário em qualquer ordem ("amanhã às 10h", "às 10h de amanhã"), e a duração no fim
+_SCHEDULE = rf'''(?:
+        (?P<day_first>{_day('a_')})(?:,?\s{_time('b_')})?
+      | {_time('c_')}(?:,?\s(?:de\s|do\s)?{_day('d_')})?
+    )(?:\s{_DURATION})?'''
+
+_PERIOD = rf'''(?:d[eoa]s?\s|n[ao]s?\s|em\s)?(?:
+        (?:(?:est[ae]|ess[ae]|nest[ae]|dest[ae]|d[ae])\s)?(?P<week>semana)(?:\s(?P<week_dir>que\svem|passada))?
+      | (?P<week_next>proxima)\ssemana
+      | (?:(?:este|esse|neste|deste)\s)?(?P<weekend>fim\sde\ssemana)
+      | (?:(?:este|esse|neste|deste|do)\s)?(?P<month>mes)(?:\s(?P<month_dir>passado|que\svem))?
+      | (?P<month_next>proximo)\smes
+      | (?P<mm>\d{{1,2}})/(?P<yyyy>\d{{4}})
+      | (?:mes\sde\s)?(?P<mname>{_words(_MONTHS)})(?:\s(?:de\s)?(?P<myear>\d{{4}}))?
+      | (?:(?:este|esse|neste|deste|do)\s)?(?P<year>ano)(?:\s(?P<year_dir>passado|que\svem))?
+      | (?P<year_of>(?:19|20)\d{{2}})
+      | (?P<span>ultimos|proximos)\s(?P<span_n>{_NUMBER})\sdias
+      | (?:entre\s)?{_day('f_')}\s(?:a|ate|e)\s(?:o\s|a\s)?{_day('t_')}
+      | {_day('s_')}
+    )'''
+
+_FLAGS = re.VERBOSE
+_SCHEDULE_RE = re.compile(rf'{_SCHEDULE}$', _FLAGS)
+# O título é o menor começo possível: o horário fica com o maior pedaço do fim
+_SPLIT_RE = re.compile(rf'(?P<title>.+?)\s(?P<when>{_SCHEDULE})$', _FLAGS)
+_PERIOD_RE = re.compile(rf'{_PERIOD}$', _FLAGS)
+
+_PUNCTUATION = re.compile(r'[.!?;,]+$')
+
+
+def normalize(text):
+    """Minúsculas, sem acentos, espaços simples e sem pontuação no fim"""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _PUNCTUATION.sub('', ' '.join(text.split()))
+
+
+def _number(text):
+    return int(text) if text.isdigit() else _NUMBERS[text]
+
+
+# --- Análise: match -> descrição relativa (tuplas, guardadas no cache) ---
+
+def _day_spec(groups, p):
+    if groups[p + 'rel']:
+        return ('offset', _RELATIVE_DAYS[' '.join(groups[p + 'rel'].split())])
+    if groups[p + 'wd']:
+        return ('weekday', _WEEKDAYS[groups[p + 'wd']], bool(groups[p + 'next'] or groups[p + 'later']))
+    if groups[p + 'd']:
+        year = groups[p + 'y']
+        if year and len(year) == 2:
+            year = '20' + year
+        return ('date', int(groups[p + 'd']), int(groups[p + 'm']), int(year) if year else None)
+    if groups[p + 'dn']:
+        year = groups[p + 'yn']
+        return ('date', int(groups[p + 'dn']), _MONTHS[groups[p + 'mn']], int(year) if year else None)
+    if groups[p + 'dom']:
+        return ('day_of_month', int(groups[p + 'dom']))
+    if groups[p + 'in']:
+        days = _number(groups[p + 'in']) * (7 if groups[p + 'unit'].startswith('semana') else 1)
+        return ('offset', days)
+    return None
+
+
+def _clock_spec(groups, p):
+    """(hora, minuto, ambígua). "10h", "10:30" e "10 horas" valem como escritos (24 horas);
+    ambíguo é só o número sozinho de 1 a 11 ("às 3"), sem "da manhã/tarde" e sem zero à esquerda"""
+    noon = groups.get(p + 'noon')
+    if noon:
+        return (12, 0, False) if noon.startswith('meio') else (0, 0, False)
+    text = groups.get(p + 'h')
+    if text is None:
+        return None
+    hour, minute = int(text), int(groups[p + 'min'] or 0)
+    part = groups[p + 'part']
+    if part in ('tarde', 'noite') and hour < 12:
+        hour += 12
+    elif part == 'noite' and hour == 12:
+        hour = 0
+    ambiguous = part is None and not groups[p + 'mark'] and 1 <= hour <= 11 and not text.startswith('0')
+    return (hour, minute, ambiguous)
+
+
+def _time_spec(groups, p):
+    """(início, fim) do horário; fim só nas faixas"""
+    start = _clock_spec(groups, p + 'f_')
+    if start is not None:
+        return start, _clock_spec(groups, p + 't_')
+    return _clock_spec(groups, p + 'c_') or _clock_spec(groups, p + 's_'), None
+
+
+def _duration(groups):
+    if groups['dur_half']:
+        return datetime.timedelta(minutes=30)
+    if groups['dur_hh']:
+        return datetime.timedelta(hours=int(groups['dur_hh']), minutes=int(groups['dur_mm']))
+    if groups['dur_n']:
+        amount = _number(groups['dur_n'])
+        if groups['dur_unit'].startswith('m'):
+            return datetime.timedelta(minutes=amount)
+        return datetime.timedelta(hours=amount, minutes=30 if groups['dur_and_half'] else 0)
+    return None
+
+
+def _schedule_from(groups):
+    if groups['day_first']:
+        day = _day_spec(groups, 'a_')
+        start, end = _time_spec(groups, 'b_')
+    else:
+        day = _day_spec(groups, 'd_')
+        start, end = _time_spec(groups, 'c_')
+    return (day, start, end, _duration(groups))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _schedule_spec(text):
+    found = _SCHEDULE_RE.match(text)
+    return _schedule_from(found.groupdict()) if found else None
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _split_spec(text):
+    """(palavras do título, descrição do horário) ou None"""
+    found = _SPLIT_RE.match(text)
+    if found is None:
+        return None
+    words = found.group('title').split()
+    # "reunião de | amanhã": a preposição que liga o título ao dia não faz parte do título
+    while len(words) > 1 and words[-1] in _TITLE_TAIL:
+        words.pop()
+    return len(words), _schedule_from(found.groupdict())
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _period_spec(text):
+    found = _PERIOD_RE.match(text)
+    if found is None:
+        return None
+    groups = found.groupdict()
+    if groups['week'] or groups['week_next']:
+        direction = groups['week_dir']
+        return ('week', -1 if direction == 'passada' else 1 if direction or groups['week_next'] else 0)
+    if groups['weekend']:
+        return ('weekend',)
+    if groups['month'] or groups['month_next']:
+        direction = groups['month_dir']
+        return ('month', -1 if direction == 'passado' else 1 if direction or groups['month_next'] else 0)
+    if groups['mm']:
+        return ('month_of', int(groups['mm']), int(groups['yyyy']))
+    if groups['mname']:
+        return ('month_of', _MONTHS[groups['mname']], int(groups['myear']) if groups['myear'] else None)
+    if groups['year']:
+        direction = groups['year_dir']
+        return ('year', -1 if direction == 'passado' else 1 if direction else 0)
+    if groups['year_of']:
+        return ('year_of', int(groups['year_of']))
+    if groups['span']:
+        return ('span', _number(groups['span_n']), groups['span'] == 'proximos')
+    first = _day_spec(groups, 'f_')
+    if first is not None:
+        return ('days', first, _day_spec(groups, 't_'))
+    return ('days', _day_spec(groups, 's_'), None)
+
+
+# --- Resolução: descrição relativa + hoje -> datas ---
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _resolve_day(spec, today, future):
+    """Data do dia descrito. future: dias sem ano/mês explícito caem no futuro (True, agenda),
+    no passado (False, totais) ou ficam no ano/mês corrente (None, pontas de uma faixa)"""
+    kind = spec[0]
+    if kind == 'offset':
+        return today + datetime.timedelta(days=spec[1])
+    if kind == 'weekday':
+        _, weekday, forward = spec
+        if forward or future is not False:
+            ahead = (weekday - today.weekday()) % 7
+            return today + datetime.timedelta(days=ahead or (7 if forward else 0))
+        return today - datetime.timedelta(days=(today.weekday() - weekday) % 7)
+    try:
+        if kind == 'date':
+            _, day, month, year = spec
+            if year is not None:
+                return datetime.date(year, month, day)
+            candidate = datetime.date(today.year, month, day)
+            if future is True and candidate < today:
+                return datetime.date(today.year + 1, month, day)
+            if future is False and candidate > today:
+                return datetime.date(today.year - 1, month, day)
+            return candidate
+        # Só o dia do mês: neste mês, ou no próximo/anterior
+        first = today.replace(day=1)
+        candidate = first.replace(day=spec[1])
+        if future is True and candidate < today:
+            return _add_months(first, 1).replace(day=spec[1])
+        if future is False and candidate > today:
+            return _add_months(first, -1).replace(day=spec[1])
+        return candidate
+    except ValueError:
+        return None  # 31/02, dia 31 em abril...
+
+
+def _at(day, clock):
+    hour, minute, _ = clock
+    if hour > 23 or minute > 59:
+        return None
+    return datetime.datetime.combine(day, datetime.time(hour, minute))
+
+
+def _resolve_schedule(spec, now):
+    day_spec, start_clock, end_clock, duration = spec
+    today = now.date()
+    day = _resolve_day(day_spec, today, future=True) if day_spec else today
+    if day is None:
+        return None
+    if start_clock is None:
+        start = datetime.datetime.combine(day, datetime.time.min)
+        return Schedule(start, start + datetime.timedelta(days=1), True)
+
+    start = _at(day, start_clock)
+    if start is None:
+        return None
+    if start <= now and day == today:
+        # "às 3" quando já passou das 3: 15h, se ainda não passou; sem dia dito, amanhã
+        if start_clock[2] and start + datetime.timedelta(hours=12) > now:
+            start += datetime.timedelta(hours=12)
+        elif day_spec is None:
+            start += datetime.timedelta(days=1)
+
+    end = None
+    if end_clock is not None:
+        end = _at(start.date(), end_clock)
+        if end is None:
+            return None
+        if end <= start and end_clock[2] and end + datetime.timedelta(hours=12) > start:
+            end += datetime.timedelta(hours=12)  # "das 10 às 2"
+        elif end <= start:
+            end += datetime.timedelta(days=1)  # "das 22h às 1h"
+    elif duration:
+        end = start + duration
+    return Schedule(start, end, False)
+
+
+def _resolve_period(spec, today, future):
+    kind = spec[0]
+    if kind in ('week', 'weekend'):
+        monday = today - datetime.timedelta(days=today.weekday())
+        if kind == 'weekend':
+            return monday + datetime.timedelta(days=5), monday + datetime.timedelta(days=7)
+        start = monday + datetime.timedelta(weeks=spec[1])
+        return start, start + datetime.timedelta(days=7)
+    if kind == 'month':
+        start = _add_months(today.replace(day=1), spec[1])
+        return start, _add_months(start, 1)
+    if kind == 'month_of':
+        _, month, year = spec
+        if not 1 <= month <= 12:
+            return None
+        if year is None:
+            year = today.year
+            if future and month < today.month:
+                year += 1
+            elif not future and month > today.month:
+                year -= 1
+        start = datetime.date(year, month, 1)
+        return start, _add_months(start, 1)
+    if kind in ('year', 'year_of'):
+        year = today.year + spec[1] if kind == 'year' else spec[1]
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    if kind == 'span':
+        _, days, ahead = spec
+        if ahead:
+            return today, today + datetime.timedelta(days=days)
+        return today - datetime.timedelta(days=days - 1), today + datetime.timedelta(days=1)
+
+    _, first, last = spec
+    if last is None:
+        start = end = _resolve_day(first, today, future)
+    else:
+        # "01/10 a 15/10": as duas pontas no mesmo ano, sem empurrar cada uma para um lado
+        start = _resolve_day(first, today, None)
+        if last[0] == 'weekday' and start is not None:
+            end = start + datetime.timedelta(days=(last[1] - start.weekday()) % 7)  # "sexta a domingo"
+        else:
+            end = _resolve_day(last, today, None)
+    if start is None or end is None:
+        return None
+    if end < start and last[0] == 'date' and last[3] is None:
+        end = _resolve_day(('date', last[1], last[2], today.year + 1), today, None)  # "20/12 a 05/01"
+        if end is None:
+            return None
+    if end < start:
+        start, end = end, start
+    return start, end + datetime.timedelta(days=1)
+
+
+def period_label(start, end, today=None):
+    """Como mostrar o intervalo: "hoje", "sexta, 24/10", "outubro de 2026", "20/10 a 26/10" """
+    today = today or datetime.date.today()
+    if end - start == datetime.timedelta(days=1):
+        names = {-1: 'ontem', 0: 'hoje', 1: 'amanhã'}
+        offset = (start - today).days
+        return names.get(offset) or f"{DIAS_SEMANA[start.weekday()]}, {start:%d/%m}"
+    if start.day == 1 and end == _add_months(start, 1):
+        return f"{MESES[start.month - 1]} de {start.year}"
+    if start.day == 1 and start.month == 1 and end == datetime.date(start.year + 1, 1, 1):
+        return str(start.year)
+    last = end - datetime.timedelta(days=1)
+    return f"{start:%d/%m} a {last:%d/%m}"
+
+
+def month_of(period):
+    """(ano, mês) se o período for exatamente um mês do calendário, senão None"""
+    if period.start.day == 1 and period.end == _add_months(period.start, 1):
+        return period.start.year, period.start.month
+    return None
+
+
+# --- API ---
+
+def parse_schedule(text, now=None):
+    """Horário de um evento descrito só por data/hora ("amanhã às 10h") ou None"""
+    spec = _schedule_spec(normalize(text))
+    if spec is None:
+        return None
+    return _resolve_schedule(spec, now or datetime.datetime.now())
+
+
+def split_schedule(text, now=None):
+    """Separa o título do horário no fim da frase: (título, Schedule).
+    Sem horário reconhecível (ou com data/hora impossível) devolve (texto, None)"""
+    normalized = normalize(text)
+    spec = _split_spec(normalized)
+    if spec is None:
+        return text.strip(), None
+    title_words, schedule = spec
+    # Normalizar não muda as palavras de lugar: o título original são as primeiras palavras
+    title = ' '.join(text.split()[:title_words])
+    return title, _resolve_schedule(schedule, now or datetime.datetime.now())
+
+
+def parse_period(text, today=None, future=True):
+    """Intervalo de dias descrito no texto ou None.
+    future=True (agenda): "sexta", "dia 5" e "março" sem ano são os próximos;
+    future=False (totais): os mais recentes"""
+    spec = _period_spec(normalize(text))
+    if spec is None:
+        return None
+    today = today or datetime.date.today()
+    resolved = _resolve_period(spec, today, future)
+    if resolved is None:
+        return None
+    start, end = resolved
+    return Period(start, end, period_label(start, end, today))
+
+
+def cache_info():
+    """Acertos e erros dos caches de análise (para o benchmark)"""
+    return {'schedule': _schedule_spec.cache_info(), 'split': _split_spec.cache_info(),
+            'period': _period_spec.cache_info()}
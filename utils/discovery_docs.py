@@ -0,0 +1,100 @@
+"""Documentos de descoberta das APIs do Google, reduzidos ao que o bot usa.
+
+O googleapiclient monta os clientes a partir do documento de descoberta de
+cada API e, ao criar cada recurso, gera as docstrings formatando todos os
+esquemas envolvidos. Para o Sheets isso leva de 100 a 250 ms por cliente (e
+cada thread do pool monta o seu). Os documentos em utils/discovery/ têm só
+os métodos usados, os esquemas que eles referenciam e nenhuma descrição.
+
+Para gerar de novo (ex.: depois de usar um método novo), a partir dos
+documentos que acompanham o googleapiclient:
+    python -m utils.discovery_docs
+"""
+import os
+import sys
+import json
+import functools
+
+DISCOVERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'discovery')
+
+# Métodos mantidos em cada API: {(api, versão): {caminho do recurso: [métodos]}}
+USED_METHODS = {
+    ('sheets', 'v4'): {'spreadsheets.values': ['get', 'append']},
+    ('calendar', 'v3'): {'events': ['list', 'get', 'insert', 'update', 'patch', 'delete']},
+}
+
+
+def _refs(node, found):
+    if isinstance(node, dict):
+        if '$ref' in node:
+            found.add(node['$ref'])
+        for value in node.values():
+            _refs(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _refs(value, found)
+
+
+def _strip_descriptions(node):
+    # Só remove textos: uma propriedade chamada "description" (ex.: do Event) é um dict e fica
+    if isinstance(node, dict):
+        return {key: _strip_descriptions(value) for key, value in node.items()
+                if not (key == 'description' and isinstance(value, str))}
+    if isinstance(node, list):
+        return [_strip_descriptions(value) for value in node]
+    return node
+
+
+def trim(document, used_methods):
+    """Cópia do documento só com os métodos pedidos e os esquemas que eles usam"""
+    trimmed = {key: value for key, value in document.items() if key not in ('resources', 'schemas', 'methods')}
+    trimmed['resources'] = {}
+    methods = []
+    for path, names in used_methods.items():
+        source, target = document, trimmed
+        for part in path.split('.'):
+            source = source['resources'][part]
+            target = target.setdefault('resources', {}).setdefault(part, {})
+        target['methods'] = {name: source['methods'][name] for name in names}
+        methods.extend(target['methods'].values())
+
+    # Esquemas referenciados pelos métodos, e os referenciados por eles
+    schemas = document.get('schemas', {})
+    pending, kept = set(), set()
+    _refs(methods, pending)
+    while pending:
+        name = pending.pop()
+        if name in kept or name not in schemas:
+            continue
+        kept.add(name)
+        _refs(schemas[name], pending)
+    trimmed['schemas'] = {name: schemas[name] for name in sorted(kept)}
+    return _strip_descriptions(trimmed)
+
+
+@functools.lru_cache(maxsize=None)
+def load_document(api, version):
+    """Texto do documento de descoberta: o reduzido daqui ou, se não houver, o do googleapiclient"""
+    path = os.path.join(DISCOVERY_DIR, f'{api}.{version}.json')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    from googleapiclient.discovery_cache import get_static_doc
+    return get_static_doc(api, version)
+
+
+def main():
+    from googleapiclient.discovery_cache import get_static_doc
+    os.makedirs(DISCOVERY_DIR, exist_ok=True)
+    for (api, version), used_methods in USED_METHODS.items():
+        document = json.loads(get_static_doc(api, version))
+        trimmed = trim(document, used_methods)
+        path = os.path.join(DISCOVERY_DIR, f'{api}.{version}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trimmed, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.write('\n')
+        print(f"{path}: {len(trimmed['schemas'])} esquemas (revisão {trimmed.get('revision')})")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""Alertas de orçamento e resumos diários/semanais das finanças.
+
+Os totais de cada (planilha, mês) são carregados uma vez do ledger local e
+depois só recebem as linhas gravadas (add_write_listener): conferir os
+orçamentos custa uma consulta a dicionário por lançamento, sem ler a planilha.
+Os resumos usam os mesmos contadores e saem espalhados por DIGEST_WINDOW
+segundos (cada chat sempre no mesmo ponto da janela), não todos de uma vez.
+
+Orçamentos e assinaturas ficam num SQLite (ALERTS_PATH) compartilhado pelos
+processos. No modo webhook cada processo soma só o que ele mesmo grava; por
+isso os contadores são recarregados do ledger todo dia, antes dos resumos.
+"""
+import os
+import zlib
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+
+from utils.finance_storage import parse_row
+from utils.calendar_cache import normalize
+from utils.google_scheduler import background_calls
+
+ALERTS_PATH = os.getenv("ALERTS_PATH", "alerts.db")
+
+# Percentuais do orçamento que geram aviso (cada um uma vez, quando é ultrapassado)
+ALERT_THRESHOLDS = tuple(int(p) / 100 for p in os.getenv("BUDGET_ALERT_THRESHOLDS", "80,100").split(",") if p.strip())
+
+# Hora (no fuso do bot) em que os resumos começam a sair, e por quantos segundos se espalham
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "8"))
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "1800"))
+# Dia do resumo semanal (0 = segunda)
+DIGEST_WEEKDAY = 0
+
+DESPESA = 'Despesa'
+RECEITA = 'Receita'
+FREQUENCIES = ('diario', 'semanal')
+
+Budget = namedtuple('Budget', 'chat_id spreadsheet_id category label amount tenant_id')
+Subscription = namedtuple('Subscription', 'chat_id spreadsheet_id frequency tenant_id')
+
+
+def category_key(category):
+    return normalize(category).strip()
+
+
+def digest_offset(chat_id, window=DIGEST_WINDOW):
+    """Segundos depois do início da janela em que sai o resumo do chat (sempre o mesmo para o chat)"""
+    return zlib.crc32(str(chat_id).encode()) % max(window, 1)
+
+
+class MonthCounters:
+    """Totais de um mês: por (tipo, categoria) e por dia"""
+    __slots__ = ('totals', 'days', 'labels')
+
+    def __init__(self):
+        self.totals = {}
+        self.days = {}
+        # Categoria normalizada -> nome como apareceu na planilha
+        self.labels = {}
+
+    def add(self, day, tipo, category, value):
+        key = (tipo, category_key(category))
+        self.labels.setdefault(key[1], category)
+        self.totals[key] = self.totals.get(key, 0.0) + value
+        day_totals = self.days.setdefault(day, {})
+        day_totals[key] = day_totals.get(key, 0.0) + value
+
+    def total(self, tipo, category=None):
+        if category is not None:
+            return self.totals.get((tipo, category_key(category)), 0.0)
+        return sum(value for (kind, _), value in self.totals.items() if kind == tipo)
+
+
+class FinanceAlerts:
+    """Contadores incrementais, orçamentos por chat e assinaturas de resumo.
+
+    notify(chat_id, texto) é chamada na thread que gravou as linhas quando um
+    orçamento passa de um dos percentuais de ALERT_THRESHOLDS."""
+
+    def __init__(self, ledger, path=ALERTS_PATH, notify=None, thresholds=ALERT_THRESHOLDS):
+        self.ledger = ledger
+        self.notify = notify
+        self.thresholds = sorted(thresholds)
+        self._months = {}
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS budgets (
+                chat_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                label TEXT NOT NULL,
+                spreadsheet_id TEXT NOT NULL,
+                amount REAL NOT NULL,
+                tenant_id INTEGER,
+                PRIMARY KEY (chat_id, category)
+            );
+            CREATE TABLE IF NOT EXISTS digests (
+                chat_id INTEGER PRIMARY KEY,
+                spreadsheet_id TEXT NOT NULL,
+                frequency TEXT NOT NULL,
+                tenant_id INTEGER
+            );
+        """)
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        # planilha -> {categoria normalizada: [Budget]}
+        self._budgets = {}
+        self._data_version = None
+        self._refresh_budgets(force=True)
+
+    # --- Orçamentos ---
+    def _refresh_budgets(self, force=False):
+        """Recarrega o índice dos orçamentos se outro processo mudou o banco"""
+        with self._db_lock:
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if not force and version == self._data_version:
+                return
+            self._data_version = version
+            rows = self._db.execute(
+                "SELECT chat_id, spreadsheet_id, category, label, amount, tenant_id FROM budgets"
+            ).fetchall()
+        index = {}
+        for row in rows:
+            budget = Budget(*row)
+            index.setdefault(budget.spreadsheet_id, {}).setdefault(budget.category, []).append(budget)
+        self._budgets = index
+
+    def set_budget(self, chat_id, spreadsheet_id, category, amount, tenant_id=None):
+        with self._db_lock:
+            self._db.execute("""
+                INSERT INTO budgets VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, category) DO UPDATE SET
+                    label = excluded.label, spreadsheet_id = excluded.spreadsheet_id,
+                    amount = excluded.amount, tenant_id = excluded.tenant_id
+            """, (chat_id, category_key(category), category, spreadsheet_id, amount, tenant_id))
+            self._db.commit()
+        # O data_version só muda com gravações de outras conexões
+        self._refresh_budgets(force=True)
+
+    def remove_budget(self, chat_id, category):
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM budgets WHERE chat_id = ? AND category = ?",
+                                       (chat_id, category_key(category))).rowcount
+            self._db.commit()
+        self._refresh_budgets(force=True)
+        return bool(deleted)
+
+    def budgets_for(self, chat_id):
+        with self._db_lock:
+            rows = self._db.execute("""
+                SELECT chat_id, spreadsheet_id, category, label, amount, tenant_id FROM budgets
+                WHERE chat_id = ? ORDER BY label
+            """, (chat_id,)).fetchall()
+        return [Budget(*row) for row in rows]
+
+    def budget_status(self, chat_id, today=None):
+        """[(orçamento, gasto no mês)] do chat. Pode sincronizar o ledger (rode fora do event loop)"""
+        today = today or datetime.date.today()
+        return [(budget, self.month(budget.spreadsheet_id, today.year, today.month).total(DESPESA, budget.category))
+                for budget in self.budgets_for(chat_id)]
+
+    # --- Contadores ---
+    def _seed(self, spreadsheet_id, year, month):
+        with background_calls():
+            self.ledger.sync(spreadsheet_id, force=True)
+        counters = MonthCounters()
+        for day, tipo, category, total in self.ledger.day_totals(spreadsheet_id, year, month):
+            counters.add(datetime.date.fromisoformat(day), tipo, category or '', total)
+        return counters
+
+    def month(self, spreadsheet_id, year, month):
+        """Contadores do mês (carregados do ledger na primeira vez)"""
+        key = (spreadsheet_id, year, month)
+        with self._lock:
+            counters = self._months.get(key)
+        if counters is None:
+            # A carga lê a planilha: fora do lock, para não segurar os outros usuários
+            seeded = self._seed(spreadsheet_id, year, month)
+            with self._lock:
+                counters = self._months.setdefault(key, seeded)
+        return counters
+
+    def reset_counters(self):
+        """Esquece os contadores (voltam do ledger quando forem usados de novo)"""
+        with self._lock:
+            self._months = {}
+        self._refresh_budgets(force=True)
+
+    def on_rows_written(self, spreadsheet_id, rows):
+        """Soma as linhas gravadas e avisa os orçamentos que passaram de um limite"""
+        self._refresh_budgets()
+        budgets = self._budgets.get(spreadsheet_id, {})
+        today = datetime.date.today()
+        entries = []
+        for row in rows:
+            parsed = parse_row(row)
+            if parsed is not None:
+                entry_date, _, value, tipo, category = parsed
+                key = (spreadsheet_id, entry_date.year, entry_date.month)
+                current = tipo == DESPESA and key[1:] == (today.year, today.month) and category_key(category) in budgets
+                entries.append((key, entry_date, value, tipo, category, current))
+
+        # Mês fora da memória: só vale carregar se houver orçamento para conferir. A carga
+        # lê a planilha, então fica fora do lock; os meses carregados agora já trazem estas linhas
+        with self._lock:
+            missing = {entry[0] for entry in entries if entry[5] and entry[0] not in self._months}
+        loaded = {key: self._seed(*key) for key in missing}
+
+        spent = {}
+        with self._lock:
+            seeded = set()
+            for key, counters in loaded.items():
+                if key not in self._months:
+                    self._months[key] = counters
+                # Outra thread instalou o mês enquanto carregávamos: a carga dela é desta mesma
+                # janela, depois da gravação; se faltar algo, os contadores voltam do ledger no resumo diário
+                seeded.add(key)
+            for key, entry_date, value, tipo, category, current in entries:
+                counters = self._months.get(key)
+                if counters is None:
+                    continue
+                if key not in seeded:
+                    counters.add(entry_date.date(), tipo, category, value)
+                if current:
+                    entry = spent.setdefault(category_key(category), [counters, 0.0])
+                    entry[1] += value
+
+            alerts = []
+            for category, (counters, delta) in spent.items():
+                after = counters.total(DESPESA, category)
+                before = after - delta
+                for budget in budgets[category]:
+                    crossed = [t for t in self.thresholds if before < budget.amount * t <= after]
+                    if crossed:
+                        alerts.append((budget.chat_id, self._alert_text(budget, max(crossed), after)))
+        if self.notify:
+            for chat_id, text in alerts:
+                self.notify(chat_id, text)
+        return alerts
+
+    @staticmethod
+    def _alert_text(budget, threshold, spent):
+        if threshold >= 1:
+            return f"Você estourou o orçamento de {budget.label}: R${spent:.2f} de R${budget.amount:.2f} este mês."
+        return (f"Você passou {threshold:.0%} do orçamento de {budget.label}: "
+                f"R${spent:.2f} de R${budget.amount:.2f} este mês.")
+
+    # --- Resumos ---
+    def subscribe(self, chat_id, spreadsheet_id, frequency, tenant_id=None):
+        with self._db_lock:
+            self._db.execute("""
+                INSERT INTO digests VALUES (?, ?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    spreadsheet_id = excluded.spreadsheet_id, frequency = excluded.frequency,
+                    tenant_id = excluded.tenant_id
+            """, (chat_id, spreadsheet_id, frequency, tenant_id))
+            self._db.commit()
+
+    def unsubscribe(self, chat_id):
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM digests WHERE chat_id = ?", (chat_id,)).rowcount
+            self._db.commit()
+        return bool(deleted)
+
+    def due_subscriptions(self, day):
+        """Assinaturas que recebem resumo no dia (os semanais só em DIGEST_WEEKDAY)"""
+        frequencies = FREQUENCIES if day.weekday() == DIGEST_WEEKDAY else ('diario',)
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT chat_id, spreadsheet_id, frequency, tenant_id FROM digests "
+                f"WHERE frequency IN ({', '.join('?' * len(frequencies))})", frequencies
+            ).fetchall()
+        return [Subscription(*row) for row in rows]
+
+    def digest(self, subscription, today=None):
+        """Texto do resumo: o dia (ou a semana) anterior, o mês até agora e os orçamentos"""
+        today = today or datetime.date.today()
+        days = [today - datetime.timedelta(days=n) for n in range(7 if subscription.frequency == 'semanal' else 1, 0, -1)]
+        if subscription.frequency == 'semanal':
+            title = f"Resumo da semana ({days[0]:%d/%m} a {days[-1]:%d/%m})"
+        else:
+            title = f"Resumo de ontem ({days[0]:%d/%m})"
+
+        period, labels = {}, {}
+        for day in days:
+            counters = self.month(subscription.spreadsheet_id, day.year, day.month)
+            labels.update(counters.labels)
+            for key, value in counters.days.get(day, {}).items():
+                period[key] = period.get(key, 0.0) + value
+
+        lines = [title + ":"]
+        expenses = sum(value for (tipo, _), value in period.items() if tipo == DESPESA)
+        income = sum(value for (tipo, _), value in period.items() if tipo == RECEITA)
+        if not period:
+            lines.append("Nenhum lançamento no período.")
+        else:
+            lines.append(f"Despesas: R${expenses:.2f} | Receitas: R${income:.2f}")
+            by_category = sorted(((value, category) for (tipo, category), value in period.items() if tipo == DESPESA),
+                                 reverse=True)
+            lines.extend(f"- {labels.get(category) or category or 'Sem categoria'}: R${value:.2f}"
+                         for value, category in by_category)
+
+        month = self.month(subscription.spreadsheet_id, today.year, today.month)
+        lines.append("")
+        lines.append(f"No mês: Despesas R${month.total(DESPESA):.2f} | Receitas R${month.total(RECEITA):.2f}")
+        for budget in self.budgets_for(subscription.chat_id):
+            used = month.total(DESPESA, budget.category)
+            lines.append(f"Orçamento de {budget.label}: {used / budget.amount:.0%} (R${used:.2f} de R${budget.amount:.2f})")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
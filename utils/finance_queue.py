@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+
+from utils.finance_storage import add_finance_entry, find_entry_keys, parse_row
+from utils.google_auth import current_tenant
+from utils.google_scheduler import background_calls, permanent_error
+from utils.metrics import increment
+
+# Arquivo local onde as linhas ficam guardadas até chegarem na planilha
+JOURNAL_PATH = os.getenv("FINANCE_JOURNAL_PATH", "finance_journal.db")
+
+# Envia as linhas acumuladas a cada N milissegundos ou quando juntar M linhas
+FLUSH_INTERVAL_MS = int(os.getenv("FINANCE_FLUSH_INTERVAL_MS", "2000"))
+MAX_BATCH_ROWS = int(os.getenv("FINANCE_MAX_BATCH_ROWS", "50"))
+
+# Espera (em segundos) antes de tentar de novo quando a planilha falha; dobra a cada
+# falha seguida do mesmo lote (usuário + planilha), até RETRY_MAX_DELAY
+RETRY_DELAY = 5
+RETRY_MAX_DELAY = 600
+
+# Por quanto tempo as chaves dos lançamentos enviados são lembradas (reenvios do Telegram,
+# replays do diário de atualizações)
+KEY_RETENTION = float(os.getenv("FINANCE_KEY_RETENTION_HOURS", "72")) * 3600
+
+
+class FinanceWriteQueue:
+    """Fila write-behind para os lançamentos financeiros.
+
+    Cada lançamento é gravado primeiro no diário local (SQLite) e o usuário
+    recebe a resposta na hora. Uma thread em segundo plano junta as linhas e
+    faz um único append por planilha. Se o processo cair, as linhas que ainda
+    estão no diário são enviadas quando o bot subir de novo.
+
+    Lançamentos com chave (idempotency key) entram uma vez só: a chave vai na
+    sexta coluna da planilha e fica lembrada depois do envio. Um envio que
+    falhou no meio (ou caiu antes de apagar as linhas do diário) não é repetido
+    às cegas: antes a fila procura as chaves no armazenamento (find_keys_func).
+
+    Cada lote (usuário + planilha) falha sozinho: um token revogado ou uma
+    planilha apagada não seguram as linhas dos outros. Erros temporários
+    esperam mais a cada falha; os permanentes (4xx) levam as linhas para a
+    tabela dead_rows, de onde só saem à mão.
+    """
+
+    def __init__(self, journal_path=JOURNAL_PATH, flush_interval_ms=FLUSH_INTERVAL_MS,
+                 max_batch_rows=MAX_BATCH_ROWS, append_func=add_finance_entry, find_keys_func=find_entry_keys):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_rows = max_batch_rows
+        self.append_func = append_func
+        self.find_keys_func = find_keys_func
+
+        self._db = sqlite3.connect(journal_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pending_rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spreadsheet_id TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                tenant_id INTEGER
+            )
+        """)
+        # Diários criados antes do cadastro de usuários (ou das chaves) não têm essas colunas
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(pending_rows)")]
+        if 'tenant_id' not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN tenant_id INTEGER")
+        if 'entry_key' not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN entry_key TEXT")
+            # Quantas vezes o append foi tentado: depois da primeira, a linha pode já estar na planilha
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._db.executescript("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_pending_key ON pending_rows (entry_key) WHERE entry_key IS NOT NULL;
+
+            -- Chaves dos lançamentos que já chegaram à planilha
+            CREATE TABLE IF NOT EXISTS sent_keys (
+                entry_key TEXT PRIMARY KEY,
+                sent_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sent_keys_time ON sent_keys (sent_at);
+
+            -- Linhas que a planilha recusou de vez (sem permissão, planilha apagada, token revogado)
+            CREATE TABLE IF NOT EXISTS dead_rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spreadsheet_id TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                tenant_id INTEGER,
+                entry_key TEXT,
+                failed_at REAL NOT NULL,
+                error TEXT
+            );
+        """)
+        self._db.execute("DELETE FROM sent_keys WHERE sent_at < ?", (time.time() - KEY_RETENTION,))
+        self._db.commit()
+
+        self._db_lock = threading.Lock()
+        # Só uma thread envia para a planilha por vez
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._pending = self._count_pending()
+        # Linhas lidas pelo envio em andamento: não podem mais ser canceladas
+        self._sending = set()
+        # (usuário, planilha) -> (quando tentar de novo, falhas seguidas)
+        self._retry_at = {}
+        self._stopping = False
+        self._thread = None
+
+    def _count_pending(self):
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM pending_rows").fetchone()[0]
+
+    def start(self):
+        """Inicia a thread que envia as linhas (e reenvia o que sobrou no diário)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="finance-flusher", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, spreadsheet_id, row, key=None):
+        """Grava uma linha no diário e devolve o id dela, sem esperar a planilha.
+        O usuário atual (current_tenant) é guardado junto, para enviar com as credenciais dele.
+
+        Se a chave já passou por aqui, nada é gravado: devolve o id da linha que
+        ainda está no diário, ou None se ela já foi enviada. Sem chave, a linha
+        ganha uma, para os totais e o reenvio reconhecerem quando ela chegar à planilha"""
+        with self._db_lock:
+            if key is None:
+                key = f"q:{uuid.uuid4().hex}"
+            else:
+                found = self._db.execute("SELECT id FROM pending_rows WHERE entry_key = ?", (key,)).fetchone()
+                if found is None and self._db.execute(
+                        "SELECT 1 FROM sent_keys WHERE entry_key = ?", (key,)).fetchone() is not None:
+                    found = (None,)
+                if found is not None:
+                    increment('finance.duplicate')
+                    return found[0]
+            cursor = self._db.execute(
+                "INSERT INTO pending_rows (spreadsheet_id, row_json, created_at, tenant_id, entry_key) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (spreadsheet_id, json.dumps(row), time.time(), current_tenant.get(), key)
+            )
+            self._db.commit()
+        with self._wakeup:
+            self._pending += 1
+            if self._pending >= self.max_batch_rows:
+                self._wakeup.notify()
+        return cursor.lastrowid
+
+    def adopt(self, path):
+        """Traz para este diário as linhas (e as chaves enviadas) de outro e apaga o arquivo dele.
+        Usado com os diários de workers que não existem mais. Retorna quantas linhas vieram"""
+        # Abrir pela própria classe atualiza o esquema de diários antigos
+        other = FinanceWriteQueue(journal_path=path, append_func=None, find_keys_func=None)
+        with other._db_lock:
+            rows = other._db.execute(
+                "SELECT spreadsheet_id, row_json, created_at, tenant_id, entry_key, attempts FROM pending_rows ORDER BY id"
+            ).fetchall()
+            sent = other._db.execute("SELECT entry_key, sent_at FROM sent_keys").fetchall()
+            dead = other._db.execute(
+                "SELECT spreadsheet_id, row_json, created_at, tenant_id, entry_key, failed_at, error FROM dead_rows"
+            ).fetchall()
+            other._db.close()
+        with self._db_lock:
+            # Chave repetida já está aqui (uma adoção interrompida antes de apagar o arquivo)
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pending_rows (spreadsheet_id, row_json, created_at, tenant_id, entry_key, attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.executemany("INSERT OR IGNORE INTO sent_keys VALUES (?, ?)", sent)
+            self._db.executemany(
+                "INSERT INTO dead_rows (spreadsheet_id, row_json, created_at, tenant_id, entry_key, failed_at, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", dead
+            )
+            self._db.commit()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        with self._wakeup:
+            self._pending = self._count_pending()
+            self._wakeup.notify()
+        return len(rows)
+
+    def pending_count(self):
+        return self._pending
+
+    def dead_count(self):
+        """Linhas que a planilha recusou de vez (tabela dead_rows)"""
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM dead_rows").fetchone()[0]
+
+    def pending_entries(self, spreadsheet_id):
+        """Linhas da planilha que ainda estão no diário (esperando ou em envio): [(chave, linha lida)].
+        Os totais somam estas para o usuário ver o próprio lançamento antes de ele chegar à planilha.
+        Uma linha sem chave (de um diário antigo) em envio fica de fora: ela pode já estar
+        na planilha, e sem a chave não há como saber"""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, entry_key, row_json FROM pending_rows WHERE spreadsheet_id = ? ORDER BY id",
+                (spreadsheet_id,)
+            ).fetchall()
+            sending = set(self._sending)
+        entries = []
+        for row_id, key, row_json in rows:
+            if key is None and row_id in sending:
+                continue
+            parsed = parse_row(json.loads(row_json))
+            if parsed is not None:
+                entries.append((key, parsed))
+        return entries
+
+    def cancel(self, row_id):
+        """Tira do diário uma linha que ainda não foi enviada.
+        Retorna False se ela já foi (ou pode estar indo) para a planilha"""
+        with self._db_lock:
+            if row_id in self._sending:
+                return False
+            # Uma linha com tentativa anterior pode ter chegado à planilha sem a confirmação
+            deleted = self._db.execute("DELETE FROM pending_rows WHERE id = ? AND attempts = 0", (row_id,)).rowcount
+            self._db.commit()
+        if deleted:
+            with self._wakeup:
+                self._pending -= deleted
+        return bool(deleted)
+
+    def flush(self):
+        """Envia o que está no diário (menos os lotes esperando nova tentativa).
+        Retorna quantas linhas foram gravadas"""
+        written = 0
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT id, tenant_id, spreadsheet_id, row_json, entry_key, attempts FROM pending_rows ORDER BY id"
+                ).fetchall()
+                rows = [row for row in rows if self._retry_at.get((row[1], row[2]), (0,))[0] <= now]
+                # Se um envio falhar, as linhas dele seguem bloqueadas até a próxima leitura
+                # (a planilha pode ter recebido o append mesmo sem responder)
+                self._sending = {row[0] for row in rows}
+
+            # Agrupa por usuário e planilha mantendo a ordem de chegada
+            batches = {}
+            for row_id, tenant_id, spreadsheet_id, row_json, key, attempts in rows:
+                batches.setdefault((tenant_id, spreadsheet_id), []).append(
+                    (row_id, json.loads(row_json), key, attempts))
+
+            for batch_key, batch in batches.items():
+                try:
+                    written += self._send_batch(*batch_key, batch)
+                except Exception as e:
+                    self._batch_failed(batch_key, batch, e)
+                else:
+                    self._retry_at.pop(batch_key, None)
+        return written
+
+    def _send_batch(self, tenant_id, spreadsheet_id, batch):
+        written = 0
+        token = current_tenant.set(tenant_id)
+        try:
+            # O usuário já teve resposta: o envio cede a vez na cota às chamadas dele
+            with background_calls():
+                batch = self._skip_arrived(spreadsheet_id, batch)
+                for start in range(0, len(batch), self.max_batch_rows):
+                    chunk = batch[start:start + self.max_batch_rows]
+                    with self._db_lock:
+                        self._db.executemany("UPDATE pending_rows SET attempts = attempts + 1 WHERE id = ?",
+                                             [(item[0],) for item in chunk])
+                        self._db.commit()
+                    self.append_func(spreadsheet_id, [values + [key] if key else values
+                                                      for _, values, key, _ in chunk])
+                    self._complete(chunk)
+                    written += len(chunk)
+        finally:
+            current_tenant.reset(token)
+        return written
+
+    def _batch_failed(self, batch_key, batch, error):
+        """Só este lote espera (ou sai da fila, se o erro for permanente); os outros seguem"""
+        tenant_id, spreadsheet_id = batch_key
+        if permanent_error(error):
+            moved = self._move_to_dead(batch, error)
+            self._retry_at.pop(batch_key, None)
+            logging.error(f"A planilha {spreadsheet_id} (usuário {tenant_id}) recusou {moved} lançamento(s), "
+                          f"guardados em dead_rows: {error}")
+            return
+        failures = self._retry_at.get(batch_key, (0, 0))[1] + 1
+        delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (failures - 1))
+        self._retry_at[batch_key] = (time.monotonic() + delay, failures)
+        increment('finance.retry')
+        logging.error(f"Erro ao enviar lançamentos para a planilha {spreadsheet_id} (usuário {tenant_id}), "
+                      f"tentando de novo em {delay:.0f}s: {error}")
+
+    def _move_to_dead(self, batch, error):
+        ids = [(item[0],) for item in batch]
+        with self._db_lock:
+            self._db.executemany("""
+                INSERT INTO dead_rows (spreadsheet_id, row_json, created_at, tenant_id, entry_key, failed_at, error)
+                SELECT spreadsheet_id, row_json, created_at, tenant_id, entry_key, ?, ?
+                FROM pending_rows WHERE id = ?
+            """, [(time.time(), str(error), row_id) for (row_id,) in ids])
+            moved = self._db.executemany("DELETE FROM pending_rows WHERE id = ?", ids).rowcount
+            self._db.commit()
+            self._sending.difference_update(row_id for (row_id,) in ids)
+        with self._wakeup:
+            self._pending -= moved
+        increment('finance.dead_letter', moved)
+        return moved
+
+    def _skip_arrived(self, spreadsheet_id, batch):
+        """Tira do lote as linhas de um envio anterior que chegaram à planilha sem a confirmação"""
+        uncertain = {key for _, _, key, attempts in batch if key and attempts}
+        if not uncertain:
+            return batch
+        arrived = self.find_keys_func(spreadsheet_id, uncertain)
+        if arrived:
+            logging.info(f"{len(arrived)} lançamento(s) já estavam na planilha; não serão reenviados")
+            increment('finance.already_sent', len(arrived))
+            self._complete([item for item in batch if item[2] in arrived])
+        return [item for item in batch if item[2] not in arrived]
+
+    def _complete(self, chunk):
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany("DELETE FROM pending_rows WHERE id = ?", [(item[0],) for item in chunk])
+            self._db.executemany("INSERT OR REPLACE INTO sent_keys VALUES (?, ?)",
+                                 [(item[2], now) for item in chunk if item[2]])
+            self._db.execute("DELETE FROM sent_keys WHERE sent_at < ?", (now - KEY_RETENTION,))
+            self._db.commit()
+            self._sending.difference_update(item[0] for item in chunk)
+        with self._wakeup:
+            self._pending -= len(chunk)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                # Com lotes esperando nova tentativa o diário pode seguir cheio: espera do mesmo jeito
+                if not self._stopping and (self._pending < self.max_batch_rows or self._retry_at):
+                    self._wakeup.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # Erro fora de um lote (ex.: leitura do diário)
+                logging.error(f"Erro ao enviar lançamentos para a planilha: {e}")
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(RETRY_DELAY)
+
+    def close(self):
+        """Para a thread e faz um último envio (chamado no desligamento do bot)"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            # As linhas continuam no diário e serão enviadas na próxima inicialização
+            logging.error(f"Erro ao enviar lançamentos no desligamento: {e}")
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,228 @@
+import datetime
+import threading
+
+import numpy as np
+
+from utils.tenant_registry import LRUCache, TENANT_CACHE_SIZE
+
+# Relatórios financeiros calculados em lote sobre arrays colunares (NumPy),
+# em vez de percorrer as linhas da planilha uma a uma.
+
+DESPESA = 0
+RECEITA = 1
+OUTRO = -1
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+# 01/01/1970 foi uma quinta-feira; somando 3 a semana começa na segunda
+_WEEK_OFFSET = 3
+
+
+class FinanceColumns:
+    """Colunas do livro-caixa: data, valor, tipo e categoria.
+
+    Os tipos e as categorias são guardados como códigos inteiros, assim os
+    agrupamentos viram np.bincount em vez de dicionários em Python.
+    """
+
+    def __init__(self, timestamps, values, types, categories, category_names):
+        self.timestamps = timestamps          # int64, segundos desde 1970
+        self.values = values                  # float64
+        self.types = types                    # int8 (DESPESA, RECEITA ou OUTRO)
+        self.categories = categories          # int32, índice em category_names
+        self.category_names = category_names  # list[str]
+        self._years_months = None
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int8),
+                   np.empty(0, np.int32), [])
+
+    def __len__(self):
+        return len(self.values)
+
+    def extend(self, rows):
+        """Acrescenta linhas (timestamp, valor, tipo, categoria) às colunas"""
+        if not rows:
+            return self
+        category_index = {name: i for i, name in enumerate(self.category_names)}
+        timestamps = np.fromiter((row[0] for row in rows), np.int64, len(rows))
+        values = np.fromiter((row[1] for row in rows), np.float64, len(rows))
+        types = np.fromiter(
+            (DESPESA if row[2] == 'Despesa' else RECEITA if row[2] == 'Receita' else OUTRO for row in rows),
+            np.int8, len(rows)
+        )
+        categories = np.fromiter(
+            (category_index.setdefault(row[3] or '', len(category_index)) for row in rows),
+            np.int32, len(rows)
+        )
+        self.category_names = list(category_index)
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+        self.values = np.concatenate([self.values, values])
+        self.types = np.concatenate([self.types, types])
+        self.categories = np.concatenate([self.categories, categories])
+        self._years_months = None
+        return self
+
+    def days(self):
+        return self.timestamps // 86400
+
+    def years_months(self):
+        # A conversão para datetime64 é a parte cara; guarda até a próxima carga
+        if self._years_months is None:
+            months = self.timestamps.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+            self._years_months = (months // 12 + 1970, months % 12 + 1)
+        return self._years_months
+
+    def period_mask(self, start=None, end=None, tipo=None):
+        """Máscara das linhas com start <= data < end (datas do tipo datetime.date)"""
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.timestamps >= _to_timestamp(start)
+        if end is not None:
+            mask &= self.timestamps < _to_timestamp(end)
+        if tipo is not None:
+            mask &= self.types == tipo
+        return mask
+
+
+def _to_timestamp(day):
+    return int((np.datetime64(day, 'D') - _EPOCH).astype(np.int64)) * 86400
+
+
+def totals_by_category(columns, start=None, end=None, tipo=DESPESA):
+    """Lista (categoria, total) do período, do maior para o menor"""
+    mask = columns.period_mask(start, end, tipo)
+    totals = np.bincount(columns.categories[mask], weights=columns.values[mask],
+                         minlength=len(columns.category_names))
+    order = np.argsort(totals)[::-1]
+    return [(columns.category_names[i], float(totals[i])) for i in order if totals[i] > 0]
+
+
+def weekly_totals(columns, start, end, tipo=DESPESA):
+    """Totais por semana (segunda a domingo) entre start e end.
+    Retorna lista (início da semana, total)"""
+    mask = columns.period_mask(start, end, tipo)
+    weeks = (columns.days()[mask] + _WEEK_OFFSET) // 7
+    first_week = (int((np.datetime64(start, 'D') - _EPOCH).astype(np.int64)) + _WEEK_OFFSET) // 7
+    totals = np.bincount(weeks - first_week, weights=columns.values[mask])
+    return [
+        ((_EPOCH + np.timedelta64((first_week + i) * 7 - _WEEK_OFFSET, 'D')).astype(datetime.date), float(total))
+        for i, total in enumerate(totals)
+    ]
+
+
+def monthly_totals(columns, year):
+    """Arrays de 12 posições com o total de despesas e de receitas de cada mês do ano"""
+    years, months = columns.years_months()
+    in_year = years == year
+    result = []
+    for tipo in (DESPESA, RECEITA):
+        mask = in_year & (columns.types == tipo)
+        result.append(np.bincount(months[mask] - 1, weights=columns.values[mask], minlength=12))
+    return result[0], result[1]
+
+
+def rolling_mean(series, window):
+    """Média móvel simples (a janela cresce até atingir o tamanho pedido)"""
+    series = np.asarray(series, dtype=np.float64)
+    cumsum = np.cumsum(series)
+    result = cumsum.copy()
+    result[window:] = cumsum[window:] - cumsum[:-window]
+    counts = np.minimum(np.arange(1, len(series) + 1), window)
+    return result / counts
+
+
+def trend(series):
+    """Inclinação da reta que melhor se ajusta à série (variação média por período)"""
+    series = np.asarray(series, dtype=np.float64)
+    if len(series) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(series)), series, 1)[0])
+
+
+def year_summary(columns, year, until_month=12):
+    """Resumo do ano: totais, média mensal, tendência e maiores categorias"""
+    despesas, receitas = monthly_totals(columns, year)
+    despesas = despesas[:until_month]
+    receitas = receitas[:until_month]
+    start = datetime.date(year, 1, 1)
+    end = datetime.date(year + 1, 1, 1)
+    return {
+        'year': year,
+        'despesas': float(despesas.sum()),
+        'receitas': float(receitas.sum()),
+        'saldo': float(receitas.sum() - despesas.sum()),
+        'despesas_por_mes': despesas,
+        'receitas_por_mes': receitas,
+        'media_mensal_despesas': float(despesas.mean()) if len(despesas) else 0.0,
+        'media_movel_despesas': rolling_mean(despesas, 3),
+        'tendencia_despesas': trend(despesas),
+        'top_categorias': totals_by_category(columns, start, end, DESPESA)[:5],
+    }
+
+
+class ReportEngine:
+    """Mantém as colunas de cada planilha em memória e só acrescenta as linhas novas do ledger.
+    Só as planilhas usadas mais recentemente ficam em memória; as outras são relidas do ledger"""
+
+    def __init__(self, ledger, cache_size=TENANT_CACHE_SIZE):
+        self.ledger = ledger
+        # planilha -> (colunas, última linha do ledger já lida)
+        self._columns = LRUCache(cache_size)
+        self._lock = threading.Lock()
+
+    def columns(self, spreadsheet_id):
+        """Sincroniza o ledger (só linhas novas) e devolve as colunas atualizadas"""
+        self.ledger.sync(spreadsheet_id)
+        with self._lock:
+            columns, last_row = self._columns.get(spreadsheet_id) or (FinanceColumns.empty(), 0)
+            rows = self.ledger.fetch_columns(spreadsheet_id, last_row)
+            if rows:
+                columns.extend([row[1:] for row in rows])
+                last_row = rows[-1][0]
+            self._columns.put(spreadsheet_id, (columns, last_row))
+            return columns
+
+    def category_report(self, spreadsheet_id, start, end):
+        """Despesas por categoria entre as datas start (incluída) e end (excluída)"""
+        return totals_by_category(self.columns(spreadsheet_id), start, end, DESPESA)
+
+    def year_report(self, spreadsheet_id, year, until_month=12):
+        return year_summary(self.columns(spreadsheet_id), year, until_month)
+
+
+MESES = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+
+def format_category_report(totals, label):
+    if not totals:
+        return f"Nenhuma despesa encontrada em {label}."
+    text = f"*Gastos por categoria ({label}):*\n"
+    for categoria, total in totals:
+        text += f"- {categoria or 'Sem categoria'}: R${total:.2f}\n"
+    return text
+
+
+def format_year_summary(summary):
+    text = (
+        f"*Resumo de {summary['year']}:*\n"
+        f"Total de Despesas: R${summary['despesas']:.2f}\n"
+        f"Total de Receitas: R${summary['receitas']:.2f}\n"
+        f"Saldo: R${summary['saldo']:.2f}\n"
+        f"Média mensal de despesas: R${summary['media_mensal_despesas']:.2f}\n"
+    )
+    tendencia = summary['tendencia_despesas']
+    if tendencia > 0:
+        text += f"Tendência: despesas subindo R${tendencia:.2f} por mês\n"
+    elif tendencia < 0:
+        text += f"Tendência: despesas caindo R${-tendencia:.2f} por mês\n"
+
+    text += "\n*Despesas por mês:*\n"
+    for i, total in enumerate(summary['despesas_por_mes']):
+        text += f"{MESES[i]}: R${total:.2f}\n"
+
+    if summary['top_categorias']:
+        text += "\n*Maiores categorias:*\n"
+        for categoria, total in summary['top_categorias']:
+            text += f"- {categoria or 'Sem categoria'}: R${total:.2f}\n"
+    return text
@@ -0,0 +1,447 @@
+"""Onde ficam os lançamentos financeiros.
+
+add_finance_entry/list_finance_data daqui escolhem o armazenamento pela
+variável FINANCE_STORAGE:
+
+- "sheets" (padrão): a planilha do Google é o banco de dados;
+- "sqlite": um SQLite local (WAL) com consultas indexadas. A planilha vira
+  uma cópia, atualizada em lote por SheetsMirror em segundo plano.
+
+Os dois devolvem as linhas no mesmo formato da planilha (data, descrição,
+valor, tipo, categoria), então o resto do bot não muda. Uma sexta coluna
+opcional leva a chave de idempotência do lançamento: é por ela que a fila
+descobre se um envio que falhou no meio chegou ou não (find_entry_keys).
+"""
+import os
+import re
+import logging
+import time
+import sqlite3
+import datetime
+import threading
+
+from utils import gdrive_utils
+from utils.google_auth import current_tenant, get_sheets_service, execute
+from utils.google_scheduler import background_calls, permanent_error
+
+FINANCE_STORAGE = os.getenv("FINANCE_STORAGE", "sheets")
+# Um arquivo só para todos os processos (o WAL permite vários leitores e um escritor por vez)
+FINANCE_STORAGE_PATH = os.getenv("FINANCE_STORAGE_PATH", "finance.db")
+
+# Cópia para a planilha: de quanto em quanto tempo e quantas linhas por append
+MIRROR_ENABLED = os.getenv("FINANCE_MIRROR", "1") == "1"
+MIRROR_INTERVAL = float(os.getenv("FINANCE_MIRROR_INTERVAL", "30"))
+MIRROR_BATCH_ROWS = int(os.getenv("FINANCE_MIRROR_BATCH_ROWS", "5000"))
+# Espera máxima (em segundos) de uma planilha que segue falhando
+MIRROR_MAX_DELAY = 3600
+
+# Estado da cópia de cada linha (coluna mirrored): 0 falta copiar, 1 copiada,
+# 2 enviada sem confirmação (pode ter chegado: a chave é conferida antes de reenviar)
+# e -1 recusada de vez pela planilha (fica só no SQLite)
+MIRROR_SENDING = 2
+MIRROR_FAILED = -1
+
+# Aba e colunas da planilha (data, descrição, valor, tipo, categoria e a chave do lançamento)
+SHEET_NAME = 'Sheet1'
+KEY_COLUMN = 'F'
+FIRST_DATA_ROW = 2
+DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+_FIRST_ROW = re.compile(r'![A-Z]+(\d+)')
+
+
+def parse_value(raw):
+    """Converte o valor da planilha para float (aceita '15', '15.5' e '15,50')"""
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    raw = str(raw).strip().replace('R$', '').strip()
+    if ',' in raw:
+        raw = raw.replace('.', '').replace(',', '.')
+    return float(raw)
+
+
+def parse_row(row):
+    """Retorna (data, descrição, valor, tipo, categoria) ou None se a linha for inválida"""
+    try:
+        entry_date = datetime.datetime.strptime(row[0], DATE_FORMAT)
+        valor = parse_value(row[2])
+        tipo = row[3]
+    except (ValueError, IndexError, TypeError):
+        return None
+    descricao = row[1] if len(row) > 1 else ''
+    categoria = row[4] if len(row) > 4 else ''
+    return entry_date, descricao, valor, tipo, categoria
+
+
+def read_sheet(spreadsheet_id, range_name):
+    """Lê o intervalo da planilha sem esconder erros (list_finance_data devolve [] se falhar)"""
+    result = execute(get_sheets_service().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=range_name), 'sheets.get')
+    return result.get('values', [])
+
+
+class SheetsStorage:
+    """A própria planilha do Google.
+
+    append devolve (resposta, linhas gravadas) nos dois armazenamentos: só as
+    gravadas de fato vão para os listeners (o SQLite pula as chaves repetidas)"""
+
+    def append(self, spreadsheet_id, rows):
+        return gdrive_utils.add_finance_entry(spreadsheet_id, rows), rows
+
+    def read(self, spreadsheet_id, range_name):
+        return gdrive_utils.list_finance_data(spreadsheet_id, range_name)
+
+    def find_keys(self, spreadsheet_id, keys):
+        # Sem esconder erros: na dúvida a fila não pode concluir que a linha não chegou
+        column = read_sheet(spreadsheet_id, f'{SHEET_NAME}!{KEY_COLUMN}{FIRST_DATA_ROW}:{KEY_COLUMN}')
+        return set(keys) & {row[0] for row in column if row}
+
+
+class SQLiteStorage:
+    """Lançamentos num SQLite local.
+
+    As células ficam como texto (igual a planilha devolve) e, ao lado, as
+    colunas já convertidas (ano, mês, tipo, valor) com índice para os totais.
+    As consultas são strings fixas com parâmetros, então o sqlite3 reaproveita
+    os comandos já compilados (cached_statements).
+    """
+
+    def __init__(self, path=FINANCE_STORAGE_PATH, seed_func=read_sheet):
+        self.seed_func = seed_func
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, cached_statements=256)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS finance_rows (
+                spreadsheet_id TEXT NOT NULL,
+                row_number INTEGER NOT NULL,
+                entry_date TEXT,
+                description TEXT,
+                value TEXT,
+                type TEXT,
+                category TEXT,
+                year INTEGER,
+                month INTEGER,
+                amount REAL,
+                tenant_id INTEGER,
+                mirrored INTEGER NOT NULL DEFAULT 0,
+                entry_key TEXT,
+                PRIMARY KEY (spreadsheet_id, row_number)
+            );
+            CREATE INDEX IF NOT EXISTS idx_finance_period
+                ON finance_rows (spreadsheet_id, year, month, type, category, amount);
+            CREATE INDEX IF NOT EXISTS idx_finance_mirror
+                ON finance_rows (mirrored, spreadsheet_id, row_number);
+
+            -- Planilhas já copiadas para cá (na primeira vez que aparecem)
+            CREATE TABLE IF NOT EXISTS seeded_sheets (
+                spreadsheet_id TEXT PRIMARY KEY
+            );
+        """)
+        # Bancos criados antes das chaves de idempotência não têm a coluna entry_key
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(finance_rows)")]
+        if 'entry_key' not in columns:
+            self._db.execute("ALTER TABLE finance_rows ADD COLUMN entry_key TEXT")
+        self._db.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_finance_key
+                ON finance_rows (spreadsheet_id, entry_key) WHERE entry_key IS NOT NULL
+        """)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._seeded = set()
+
+    def _ensure_seeded(self, spreadsheet_id):
+        """Na primeira vez que a planilha aparece, traz as linhas que ela já tem"""
+        if spreadsheet_id in self._seeded or self.seed_func is None:
+            return
+        with self._lock:
+            done = self._db.execute(
+                "SELECT 1 FROM seeded_sheets WHERE spreadsheet_id = ?", (spreadsheet_id,)
+            ).fetchone()
+        if not done:
+            rows = self.seed_func(spreadsheet_id, f'{SHEET_NAME}!A{FIRST_DATA_ROW}:E')
+            self._insert(spreadsheet_id, rows, mirrored=1, seed=True)
+        self._seeded.add(spreadsheet_id)
+
+    def _insert(self, spreadsheet_id, rows, mirrored=0, seed=False):
+        tenant_id = current_tenant.get()
+        with self._lock:
+            # IMMEDIATE: outro processo não pega o mesmo número de linha no meio
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if seed and self._db.execute(
+                        "SELECT 1 FROM seeded_sheets WHERE spreadsheet_id = ?", (spreadsheet_id,)).fetchone():
+                    self._db.rollback()
+                    return []
+                last = self._db.execute(
+                    "SELECT COALESCE(MAX(row_number), ?) FROM finance_rows WHERE spreadsheet_id = ?",
+                    (FIRST_DATA_ROW - 1, spreadsheet_id)
+                ).fetchone()[0]
+                # Linhas com chave já gravada (envio repetido) ficam de fora
+                existing = self._existing_keys(spreadsheet_id, [row[5] for row in rows if len(row) > 5 and row[5]])
+                records = []
+                written = []
+                for row in rows:
+                    cells = [str(cell) for cell in row] + [''] * (6 - len(row))
+                    if cells[5] in existing:
+                        continue
+                    if cells[5]:
+                        existing.add(cells[5])
+                    written.append(row)
+                    parsed = parse_row(cells)
+                    year = month = amount = None
+                    if parsed is not None:
+                        year, month, amount = parsed[0].year, parsed[0].month, parsed[2]
+                    records.append((spreadsheet_id, last + len(records) + 1, *cells[:5], year, month, amount,
+                                    tenant_id, mirrored, cells[5] or None))
+                self._db.executemany(
+                    "INSERT INTO finance_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records
+                )
+                if seed:
+                    self._db.execute("INSERT INTO seeded_sheets VALUES (?)", (spreadsheet_id,))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return written
+
+    def _existing_keys(self, spreadsheet_id, keys):
+        if not keys:
+            return set()
+        return {key for (key,) in self._db.execute(
+            f"SELECT entry_key FROM finance_rows WHERE spreadsheet_id = ? AND entry_key IN ({', '.join('?' * len(keys))})",
+            (spreadsheet_id, *map(str, keys))
+        )}
+
+    def append(self, spreadsheet_id, rows):
+        self._ensure_seeded(spreadsheet_id)
+        written = self._insert(spreadsheet_id, rows)
+        return {'updates': {'spreadsheetId': spreadsheet_id, 'updatedRows': len(written)}}, written
+
+    def find_keys(self, spreadsheet_id, keys):
+        with self._lock:
+            return self._existing_keys(spreadsheet_id, list(keys))
+
+    def read(self, spreadsheet_id, range_name):
+        """Linhas a partir da linha do intervalo (ex.: 'Sheet1!A120:E'), como a planilha devolveria"""
+        self._ensure_seeded(spreadsheet_id)
+        match = _FIRST_ROW.search(range_name)
+        first_row = int(match.group(1)) if match else FIRST_DATA_ROW
+        with self._lock:
+            rows = [list(row) for row in self._db.execute("""
+                SELECT entry_date, description, value, type, category, COALESCE(entry_key, '') FROM finance_rows
+                WHERE spreadsheet_id = ? AND row_number >= ?
+                ORDER BY row_number
+            """, (spreadsheet_id, first_row))]
+        # A coluna da chave só vem quando o intervalo chega até ela (ex.: 'Sheet1!A2:F')
+        if not range_name.endswith(f':{KEY_COLUMN}'):
+            rows = [row[:5] for row in rows]
+        return rows
+
+    def month_totals(self, spreadsheet_id, year, month):
+        """Totais do mês por tipo, direto do índice"""
+        self._ensure_seeded(spreadsheet_id)
+        with self._lock:
+            return dict(self._db.execute("""
+                SELECT type, SUM(amount) FROM finance_rows
+                WHERE spreadsheet_id = ? AND year = ? AND month = ?
+                GROUP BY type
+            """, (spreadsheet_id, year, month)).fetchall())
+
+    # --- Cópia para a planilha ---
+    def unmirrored(self, limit, skip=()):
+        """Linhas ainda não copiadas, menos as das planilhas em skip:
+        (planilha, linha, usuário, células, se um envio anterior ficou sem resposta).
+        A sexta célula é a chave do lançamento; quem não tem (ex.: extrato importado)
+        recebe uma fixa, derivada do número da linha"""
+        skip = list(skip)
+        with self._lock:
+            return [(row[0], row[1], row[2], list(row[4:]), row[3] == MIRROR_SENDING) for row in self._db.execute(f"""
+                SELECT spreadsheet_id, row_number, tenant_id, mirrored,
+                       entry_date, description, value, type, category, COALESCE(entry_key, 'sqlite:' || row_number)
+                FROM finance_rows WHERE mirrored IN (0, {MIRROR_SENDING})
+                    AND spreadsheet_id NOT IN ({', '.join('?' * len(skip))})
+                ORDER BY spreadsheet_id, row_number LIMIT ?
+            """, (*skip, limit))]
+
+    def mark_mirrored(self, spreadsheet_id, row_numbers, state=1):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE finance_rows SET mirrored = ? WHERE spreadsheet_id = ? AND row_number = ?",
+                [(state, spreadsheet_id, row_number) for row_number in row_numbers]
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SheetsMirror:
+    """Copia para a planilha, em appends grandes, as linhas gravadas no SQLite.
+
+    Cada linha vai com a chave na sexta coluna e fica marcada MIRROR_SENDING
+    durante o append: se o processo cair antes da confirmação, a próxima cópia
+    procura as chaves na planilha (find_keys_func) e não manda de novo as que chegaram.
+
+    Uma planilha que falha não segura as outras: ela espera mais a cada falha
+    seguida e, se o erro for permanente (4xx, token revogado), as linhas dela
+    ficam marcadas com MIRROR_FAILED e saem da cópia"""
+
+    def __init__(self, storage, append_func=gdrive_utils.add_finance_entry, interval=MIRROR_INTERVAL,
+                 batch_rows=MIRROR_BATCH_ROWS, find_keys_func=SheetsStorage().find_keys):
+        self.storage = storage
+        self.append_func = append_func
+        self.find_keys_func = find_keys_func
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self._stop = threading.Event()
+        self._thread = None
+        # planilha -> (quando tentar de novo, falhas seguidas)
+        self._retry_at = {}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="finance-mirror", daemon=True)
+            self._thread.start()
+
+    def run_once(self):
+        """Copia tudo o que falta (menos as planilhas esperando nova tentativa).
+        Retorna quantas linhas foram enviadas"""
+        sent = 0
+        while True:
+            now = time.monotonic()
+            waiting = [spreadsheet_id for spreadsheet_id, (when, _) in self._retry_at.items() if when > now]
+            rows = self.storage.unmirrored(self.batch_rows, skip=waiting)
+            if not rows:
+                return sent
+            # Agrupa por planilha e usuário mantendo a ordem das linhas
+            batches = {}
+            for spreadsheet_id, row_number, tenant_id, cells, uncertain in rows:
+                batches.setdefault((spreadsheet_id, tenant_id), []).append((row_number, cells, uncertain))
+            for (spreadsheet_id, tenant_id), batch in batches.items():
+                if spreadsheet_id in waiting:
+                    # Falhou antes, nesta mesma cópia
+                    continue
+                token = current_tenant.set(tenant_id)
+                try:
+                    with background_calls():
+                        batch = self._skip_arrived(spreadsheet_id, batch)
+                        if batch:
+                            self.storage.mark_mirrored(spreadsheet_id, [item[0] for item in batch], MIRROR_SENDING)
+                            self.append_func(spreadsheet_id, [cells for _, cells, _ in batch])
+                except Exception as e:
+                    self._batch_failed(spreadsheet_id, batch, e)
+                    waiting.append(spreadsheet_id)
+                    continue
+                finally:
+                    current_tenant.reset(token)
+                self._retry_at.pop(spreadsheet_id, None)
+                self.storage.mark_mirrored(spreadsheet_id, [item[0] for item in batch])
+                sent += len(batch)
+            if len(rows) < self.batch_rows:
+                return sent
+
+    def _skip_arrived(self, spreadsheet_id, batch):
+        """Tira do lote (e marca como copiadas) as linhas de um envio anterior que chegaram sem a confirmação"""
+        uncertain = {cells[5] for _, cells, pending in batch if pending}
+        if not uncertain:
+            return batch
+        arrived = self.find_keys_func(spreadsheet_id, uncertain)
+        if arrived:
+            logging.info(f"{len(arrived)} lançamento(s) já estavam na planilha {spreadsheet_id}; não serão copiados de novo")
+            self.storage.mark_mirrored(spreadsheet_id, [item[0] for item in batch if item[1][5] in arrived])
+        return [item for item in batch if item[1][5] not in arrived]
+
+    def _batch_failed(self, spreadsheet_id, batch, error):
+        if permanent_error(error):
+            self.storage.mark_mirrored(spreadsheet_id, [item[0] for item in batch], MIRROR_FAILED)
+            self._retry_at.pop(spreadsheet_id, None)
+            logging.error(f"A planilha {spreadsheet_id} recusou a cópia de {len(batch)} lançamento(s), "
+                          f"que ficam só no SQLite: {error}")
+            return
+        failures = self._retry_at.get(spreadsheet_id, (0, 0))[1] + 1
+        delay = min(MIRROR_MAX_DELAY, self.interval * 2 ** (failures - 1))
+        self._retry_at[spreadsheet_id] = (time.monotonic() + delay, failures)
+        logging.error(f"Erro ao copiar lançamentos para a planilha {spreadsheet_id}, "
+                      f"tentando de novo em {delay:.0f}s: {error}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Erro ao copiar lançamentos para a planilha: {e}")
+
+    def close(self):
+        """Para a thread e faz uma última cópia"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.run_once()
+        except Exception as e:
+            logging.error(f"Erro ao copiar lançamentos no desligamento: {e}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Armazenamento escolhido em FINANCE_STORAGE (criado na primeira chamada)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if FINANCE_STORAGE == 'sqlite':
+                    _storage = SQLiteStorage()
+                elif FINANCE_STORAGE == 'sheets':
+                    _storage = SheetsStorage()
+                else:
+                    raise ValueError(f"FINANCE_STORAGE inválido: {FINANCE_STORAGE!r} (use 'sheets' ou 'sqlite')")
+    return _storage
+
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
+
+
+_write_listeners = []
+
+
+def add_write_listener(func):
+    """func(spreadsheet_id, linhas) é chamada depois de cada gravação bem-sucedida
+    (na thread que gravou; ex.: contadores dos alertas de orçamento)"""
+    _write_listeners.append(func)
+
+
+def remove_write_listener(func):
+    if func in _write_listeners:
+        _write_listeners.remove(func)
+
+
+def add_finance_entry(spreadsheet_id, values):
+    """Adiciona as linhas (data, descrição, valor, tipo, categoria) no armazenamento configurado"""
+    result, written = get_storage().append(spreadsheet_id, values)
+    # Linhas repetidas (chave já gravada) não contam de novo nos orçamentos
+    for listener in list(_write_listeners) if written else ():
+        try:
+            listener(spreadsheet_id, written)
+        except Exception as e:
+            # As linhas já foram gravadas: um erro aqui não pode fazer a fila reenviar
+            logging.error(f"Erro ao avisar sobre lançamentos gravados: {e}")
+    return result
+
+
+def find_entry_keys(spreadsheet_id, keys):
+    """Quais das chaves de idempotência já estão gravadas no armazenamento configurado"""
+    return get_storage().find_keys(spreadsheet_id, keys)
+
+
+def list_finance_data(spreadsheet_id, range_name='Sheet1!A2:E'):
+    """Linhas do intervalo, no formato da planilha"""
+    return get_storage().read(spreadsheet_id, range_name)
@@ -1,98 +1,194 @@
-import os.path
+import logging
 import datetime
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-# A função get_google_creds precisa ser importada ou definida aqui.
-# Como ela está no seu main.py, é melhor importá-la.
-# Se preferir, pode copiar e colar a função get_google_creds() aqui.
-# Vamos assumir que ela será importada.
-
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
-
-# Se você não quiser mover a função get_google_creds do seu main.py
-# para cá, você pode importá-la.
-# from main import get_google_creds
-
-# Ou, a melhor prática: copie a função para este arquivo
-def get_google_creds():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(os.getenv("GOOGLE_CREDENTIALS_JSON"), SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    return creds
+# As credenciais e os serviços ficam em cache no utils.google_auth,
+# compartilhados com o main.py e o gdrive_utils.
+from utils.google_auth import get_calendar_service, get_calendar_id, execute, execute_batch
+
+# Fuso horário usado nos eventos criados pelo bot
+TIMEZONE = 'America/Sao_Paulo'
+
+# Quantos eventos a API devolve por página (máximo permitido: 2500)
+PAGE_SIZE = 250
+
+# Duração dos eventos agendados sem horário de término
+DEFAULT_DURATION = datetime.timedelta(hours=1)
 
 def update_calendar_event(event_id, new_body):
     """Atualiza um evento existente no Google Calendar."""
-    creds = get_google_creds()
-    service = build("calendar", "v3", credentials=creds)
+    service = get_calendar_service()
     
     try:
-        updated_event = service.events().update(
-            calendarId='primary',
+        updated_event = execute(service.events().update(
+            calendarId=get_calendar_id(),
             eventId=event_id,
             body=new_body
-        ).execute()
+        ), 'calendar.update')
         return updated_event
     except HttpError as error:
-        print(f"Ocorreu um erro ao atualizar o evento: {error}")
+        logging.error(f"Ocorreu um erro ao atualizar o evento: {error}")
         return None
     
-def create_calendar_event(summary, start_time, duration):
-    """Cria um novo evento no Google Calendar"""
-    creds = get_google_creds()
-    service = build('calendar', 'v3', credentials=creds)
-
-    event = {
+def event_body(summary, start_time, duration=None):
+    """Corpo de um evento começando em start_time (ISO), de 1 hora se duration não for dada.
+    Só a data (AAAA-MM-DD) cria um evento de dia inteiro"""
+    start = datetime.datetime.fromisoformat(start_time)
+    if len(start_time) == 10:
+        days = max(duration.days, 1) if duration else 1
+        return {
+            'summary': summary,
+            'start': {'date': start_time},
+            'end': {'date': (start.date() + datetime.timedelta(days=days)).isoformat()},
+        }
+    return {
         'summary': summary,
         'start': {
             'dateTime': start_time,
-            'timeZone': 'America/Sao_Paulo',
+            'timeZone': TIMEZONE,
         },
         'end': {
-            'dateTime': (datetime.datetime.fromisoformat(start_time) + datetime.timedelta(hours=1)).isoformat(),
-            'timeZone': 'America/Sao_Paulo',
+            'dateTime': (start + (duration or DEFAULT_DURATION)).isoformat(),
+            'timeZone': TIMEZONE,
         },
     }
 
-    event = service.events().insert(calendarId='primary', body=event).execute()
-    return event
+def create_calendar_event(summary, start_time, duration=None, event_id=None):
+    """Cria um novo evento no Google Calendar (duration: timedelta; padrão de 1 hora).
+    Com event_id (chave de idempotência) repetir a criação devolve o evento que já existe"""
+    service = get_calendar_service()
+
+    event = event_body(summary, start_time, duration)
+    if event_id:
+        event['id'] = event_id
+
+    try:
+        event = execute(service.events().insert(calendarId=get_calendar_id(), body=event), 'calendar.insert',
+                        idempotent=bool(event_id))
+        return event
+    except HttpError as error:
+        if event_id and error.resp.status == 409:
+            return _existing_event(service, get_calendar_id(), event_id)
+        logging.error(f"Ocorreu um erro ao criar o evento: {error}")
+        return None
+
+def _existing_event(service, calendar_id, event_id):
+    """Evento criado antes com o mesmo id (a criação anterior chegou ao Google)"""
+    try:
+        return execute(service.events().get(calendarId=calendar_id, eventId=event_id), 'calendar.get')
+    except HttpError as error:
+        logging.error(f"Ocorreu um erro ao buscar o evento: {error}")
+        return None
+
+def _gone(error):
+    # Já excluído (por outra tentativa ou pelo próprio usuário)
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
 
 def delete_calendar_event(event_id):
     """Exclui um evento do Google Calendar pelo ID"""
-    creds = get_google_creds()
-    service = build("calendar", "v3", credentials=creds)
+    service = get_calendar_service()
     try:
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        execute(service.events().delete(calendarId=get_calendar_id(), eventId=event_id), 'calendar.delete')
         return True
     except HttpError as error:
-        print(f"Ocorreu um erro ao excluir o evento: {error}")
+        if _gone(error):
+            return True
+        logging.error(f"Ocorreu um erro ao excluir o evento: {error}")
         return False
 
-def list_calendar_events(query=None, time_min=None, time_max=None):
-    """Lista eventos do Google Calendar com base em uma consulta ou período de tempo"""
-    creds = get_google_creds()
-    service = build('calendar', 'v3', credentials=creds)
-
-    # Adiciona a consulta (query) para encontrar eventos por nome
-    events_result = service.events().list(
-        calendarId='primary',
-        q=query,
-        timeMin=time_min,
-        timeMax=time_max,
-        maxResults=10,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    events = events_result.get('items', [])
-    return events
\ No newline at end of file
+def create_calendar_events(bodies):
+    """Cria vários eventos em lotes HTTP. Retorna [(evento, erro)] na mesma ordem.
+    Corpos com 'id' são idempotentes: o evento que já existe volta como criado"""
+    service = get_calendar_service()
+    calendar_id = get_calendar_id()
+    requests = [(str(index), service.events().insert(calendarId=calendar_id, body=body))
+                for index, body in enumerate(bodies)]
+    results = execute_batch(service, requests, 'calendar.batch_insert',
+                            idempotent=all('id' in body for body in bodies))
+    created = []
+    for (request_id, _), body in zip(requests, bodies):
+        event, error = results[request_id]
+        if isinstance(error, HttpError) and error.resp.status == 409 and 'id' in body:
+            existing = _existing_event(service, calendar_id, body['id'])
+            if existing is not None:
+                event, error = existing, None
+        created.append((event, error))
+    return created
+
+def delete_calendar_events(event_ids):
+    """Exclui vários eventos em lotes HTTP. Retorna {id: erro} (None quando excluiu)"""
+    service = get_calendar_service()
+    calendar_id = get_calendar_id()
+    requests = [(event_id, service.events().delete(calendarId=calendar_id, eventId=event_id))
+                for event_id in event_ids]
+    results = execute_batch(service, requests, 'calendar.batch_delete')
+    return {event_id: None if _gone(error) else error for event_id, (_, error) in results.items()}
+
+def patch_calendar_events(changes):
+    """Altera campos de vários eventos em lotes HTTP. changes: {id: campos}.
+    Retorna {id: (evento atualizado, erro)}"""
+    service = get_calendar_service()
+    calendar_id = get_calendar_id()
+    requests = [(event_id, service.events().patch(calendarId=calendar_id, eventId=event_id, body=fields))
+                for event_id, fields in changes.items()]
+    return execute_batch(service, requests, 'calendar.batch_patch')
+
+def list_calendar_events(query=None, time_min=None, time_max=None, max_results=None):
+    """Lista eventos do Google Calendar com base em uma consulta ou período de tempo
+    Percorre todas as páginas (ou até max_results eventos)"""
+    service = get_calendar_service()
+
+    events = []
+    page_token = None
+    while True:
+        # Adiciona a consulta (query) para encontrar eventos por nome
+        events_result = execute(service.events().list(
+            calendarId=get_calendar_id(),
+            q=query,
+            timeMin=time_min,
+            timeMax=time_max,
+            maxResults=PAGE_SIZE,
+            singleEvents=True,
+            orderBy='startTime',
+            pageToken=page_token
+        ), 'calendar.list')
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token or (max_results and len(events) >= max_results):
+            break
+    return events[:max_results] if max_results else events
+
+class SyncTokenExpired(Exception):
+    """O syncToken não vale mais (HTTP 410): é preciso fazer uma sincronização completa"""
+
+def list_calendar_changes(sync_token=None, time_min=None):
+    """Sincronização incremental do Google Calendar.
+
+    Sem sync_token faz a carga completa (a partir de time_min); com sync_token
+    traz só o que mudou desde então, incluindo eventos cancelados.
+    Retorna (eventos, próximo sync_token)."""
+    service = get_calendar_service()
+
+    events = []
+    page_token = None
+    while True:
+        params = {
+            'calendarId': get_calendar_id(),
+            'singleEvents': True,
+            'maxResults': PAGE_SIZE,
+            'pageToken': page_token,
+        }
+        if sync_token:
+            params['syncToken'] = sync_token
+        else:
+            params['timeMin'] = time_min
+        try:
+            events_result = execute(service.events().list(**params), 'calendar.sync')
+        except HttpError as error:
+            if error.resp.status == 410:
+                raise SyncTokenExpired() from error
+            raise
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events, events_result.get('nextSyncToken')
@@ -1,74 +1,36 @@
-import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.discovery import build
+import logging
+
 from googleapiclient.errors import HttpError
 
-# Se a modificação dessas APIs for feita, as credenciais de autenticação
-# devem ser deletadas e criadas novamente.
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
-          'https://www.googleapis.com/auth/calendar']
+# As credenciais e os serviços ficam em cache no utils.google_auth
+from utils.google_auth import get_sheets_service, get_calendar_service, execute
 
 def list_finance_data(spreadsheet_id, range_name='Sheet1!A2:E'):
     """
     Retorna os dados da planilha.
     """
-    creds = get_google_creds()
-    service = build('sheets', 'v4', credentials=creds)
+    service = get_google_sheets_service()
 
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id, range=range_name).execute()
+        result = execute(service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=range_name), 'sheets.get')
         rows = result.get('values', [])
         return rows
     except HttpError as error:
-        print(f"Ocorreu um erro ao listar os dados: {error}")
+        logging.error(f"Ocorreu um erro ao listar os dados: {error}")
         return []
 
 def get_google_sheets_service():
-    """Mostra como usar o Google Sheets API
-    A função pega o token e cria uma sessão autorizada
+    """Retorna o serviço do Google Sheets já autorizado
+    O token é carregado uma vez só e o serviço fica em cache
     """
-    creds = None
-    # O arquivo token.json armazena o token de acesso e
-    # as credenciais de refresh, e é criado automaticamente
-    # quando a autenticação é concluída pela primeira vez.
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # Se não há credenciais válidas, permite que o usuário faça o login.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                os.getenv("GOOGLE_CREDENTIALS_JSON"), SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Salva as credenciais para as próximas execuções.
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-
-    return build('sheets', 'v4', credentials=creds)
+    return get_sheets_service()
 
 def get_google_calendar_service():
-    """Mostra como usar o Google Calendar API
-    A função pega o token e cria uma sessão autorizada
+    """Retorna o serviço do Google Calendar já autorizado
+    O token é carregado uma vez só e o serviço fica em cache
     """
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                os.getenv("GOOGLE_CREDENTIALS_JSON"), SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-
-    return build('calendar', 'v3', credentials=creds)
+    return get_calendar_service()
 
 def add_finance_entry(spreadsheet_id, values):
     """Adiciona uma nova linha com os dados financeiros na planilha"""
@@ -76,12 +38,12 @@ def add_finance_entry(spreadsheet_id, values):
     body = {
         'values': values
     }
-    result = service.spreadsheets().values().append(
+    result = execute(service.spreadsheets().values().append(
         spreadsheetId=spreadsheet_id, 
         range='A1', 
         valueInputOption='RAW', 
         body=body
-    ).execute()
+    ), 'sheets.append')
     return result
 
 def add_calendar_event(calendar_id, summary, description, start_time, end_time):
@@ -99,5 +61,5 @@ def add_calendar_event(calendar_id, summary, description, start_time, end_time):
             'timeZone': 'America/Sao_Paulo',
         },
     }
-    result = service.events().insert(calendarId=calendar_id, body=event).execute()
+    result = execute(service.events().insert(calendarId=calendar_id, body=event), 'calendar.insert')
     return result
\ No newline at end of file
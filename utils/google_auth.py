@@ -0,0 +1,235 @@
+import os.path
+import logging
+import datetime
+import threading
+import contextvars
+
+from utils.google_scheduler import scheduler
+from utils.discovery_docs import load_document
+
+# As bibliotecas de autenticação e de cliente do Google (requests, httplib2,
+# oauthlib, discovery) só são importadas na primeira chamada: o bot começa a
+# atender sem esperar por elas, e warm_up() as carrega em segundo plano.
+
+# Escopos usados pelo bot inteiro (planilha + agenda). Se mudar, apague o token.json.
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/calendar"]
+
+TOKEN_FILE = os.getenv("GOOGLE_TOKEN_FILE", "token.json")
+
+# Renova o token alguns minutos antes de expirar, para nenhuma mensagem pagar o refresh.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Timeout das conexões HTTP reaproveitadas (em segundos)
+HTTP_TIMEOUT = 30
+
+# Aponta as APIs do Google para um servidor local (ex.: teste de carga), sem OAuth
+API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+_lock = threading.RLock()
+_creds = None
+_creds_generation = 0
+_refresh_timer = None
+
+# Usuário (id do Telegram) dono da chamada atual, quando o bot atende vários usuários.
+# Sem usuário definido valem o token.json e a planilha/agenda padrão; um usuário
+# definido que não está cadastrado nunca cai nelas (TenantNotRegistered).
+current_tenant = contextvars.ContextVar('current_tenant', default=None)
+_tenant_registry = None
+
+# Cada thread guarda seus próprios serviços: o httplib2 não é thread-safe,
+# mas assim cada thread reaproveita a mesma conexão HTTP entre as chamadas.
+_local = threading.local()
+
+
+class TenantNotRegistered(PermissionError):
+    """O usuário da chamada não está no cadastro (utils.tenant_registry)"""
+
+
+def _save_creds(creds):
+    with open(TOKEN_FILE, 'w') as token:
+        token.write(creds.to_json())
+
+
+def _auth_request():
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+def needs_authorization():
+    """True se ainda não há token salvo (o primeiro acesso precisa do fluxo OAuth interativo)"""
+    return not API_ENDPOINT and not os.path.exists(TOKEN_FILE)
+
+
+def _load_creds():
+    """Carrega o token do disco (uma única vez) ou faz o fluxo OAuth interativo"""
+    if API_ENDPOINT:
+        from google.auth.credentials import AnonymousCredentials
+        return AnonymousCredentials()
+    from google.oauth2.credentials import Credentials
+    creds = None
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(_auth_request())
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(os.getenv("GOOGLE_CREDENTIALS_JSON"), SCOPES)
+            creds = flow.run_local_server(port=0)
+        _save_creds(creds)
+    return creds
+
+
+def _schedule_refresh(creds):
+    """Agenda a renovação do token em segundo plano, antes do vencimento"""
+    global _refresh_timer
+    if _refresh_timer is not None:
+        _refresh_timer.cancel()
+        _refresh_timer = None
+    if not getattr(creds, 'expiry', None) or not getattr(creds, 'refresh_token', None):
+        return
+
+    # creds.expiry é um datetime UTC "naive"
+    delay = (creds.expiry - REFRESH_MARGIN - datetime.datetime.utcnow()).total_seconds()
+    _refresh_timer = threading.Timer(max(delay, 0), _background_refresh)
+    _refresh_timer.daemon = True
+    _refresh_timer.start()
+
+
+def _background_refresh():
+    with _lock:
+        creds = _creds
+        if creds is None:
+            return
+        try:
+            # O refresh altera o próprio objeto, então os AuthorizedHttp já criados continuam válidos
+            creds.refresh(_auth_request())
+            _save_creds(creds)
+        except Exception as e:
+            logging.error(f"Erro ao renovar o token do Google em segundo plano: {e}")
+        _schedule_refresh(creds)
+
+
+def get_google_creds():
+    """Retorna as credenciais compartilhadas pelo processo inteiro"""
+    global _creds, _creds_generation
+    with _lock:
+        if _creds is None:
+            _creds = _load_creds()
+            _creds_generation += 1
+            _schedule_refresh(_creds)
+        elif not _creds.valid:
+            # O refresh em segundo plano falhou ou ainda não rodou
+            _creds.refresh(_auth_request())
+            _save_creds(_creds)
+            _schedule_refresh(_creds)
+        return _creds
+
+
+def set_tenant_registry(registry):
+    """Liga o registro de usuários (utils.tenant_registry) às chamadas ao Google"""
+    global _tenant_registry
+    _tenant_registry = registry
+
+
+def _current_tenant():
+    user_id = current_tenant.get()
+    if user_id is None or _tenant_registry is None:
+        return None
+    tenant = _tenant_registry.get(user_id)
+    if tenant is None:
+        # Sem isso um estranho usaria o token.json e a planilha do dono do bot
+        raise TenantNotRegistered(f"Usuário {user_id} não cadastrado")
+    return tenant
+
+
+def get_spreadsheet_id(default=None):
+    """Planilha do usuário atual (ou a padrão)"""
+    tenant = _current_tenant()
+    return tenant.spreadsheet_id if tenant else default
+
+
+def get_calendar_id():
+    """Agenda do usuário atual (ou a 'primary' do token.json)"""
+    tenant = _current_tenant()
+    return tenant.calendar_id if tenant else 'primary'
+
+
+def _get_service(api, version):
+    tenant = _current_tenant()
+    if tenant is not None:
+        return _tenant_registry.get_service(tenant, api, version)
+
+    creds = get_google_creds()
+    services = getattr(_local, 'services', None)
+    if services is None or _local.generation != _creds_generation:
+        services = _local.services = {}
+        _local.generation = _creds_generation
+    service = services.get((api, version))
+    if service is None:
+        service = build_service(api, version, creds)
+        services[(api, version)] = service
+    return service
+
+
+def build_service(api, version, creds):
+    """Cria o cliente da API com uma conexão HTTP persistente, a partir do
+    documento de descoberta local (utils/discovery_docs.py)"""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    client_options = {'api_endpoint': API_ENDPOINT} if API_ENDPOINT else None
+    return build_from_document(load_document(api, version), http=http, client_options=client_options)
+
+
+def get_sheets_service():
+    """Serviço do Google Sheets em cache (um por thread)"""
+    return _get_service('sheets', 'v4')
+
+
+def get_calendar_service():
+    """Serviço do Google Calendar em cache (um por thread)"""
+    return _get_service('calendar', 'v3')
+
+
+def reset():
+    """Descarta credenciais e serviços em cache (ex.: depois de trocar o token.json)"""
+    global _creds, _creds_generation, _refresh_timer
+    with _lock:
+        if _refresh_timer is not None:
+            _refresh_timer.cancel()
+            _refresh_timer = None
+        _creds = None
+        _creds_generation += 1
+
+
+def execute(request, operation, idempotent=False):
+    """Executa a requisição pelo agendador (cota, prioridade e repetições), medindo
+    o tempo na métrica google.<operation>"""
+    return scheduler.execute(request, operation, tenant=current_tenant.get(), idempotent=idempotent)
+
+
+# Caminho do endpoint de lotes de cada API (relativo à raiz da API)
+BATCH_PATHS = {'calendar': 'batch/calendar/v3', 'sheets': 'batch'}
+
+
+def execute_batch(service, requests, operation, idempotent=False):
+    """Envia várias requisições da mesma API em lotes HTTP. requests: [(id, request)].
+    Retorna {id: (resposta, erro)}; erro é None quando a chamada deu certo"""
+    def new_batch(callback):
+        from googleapiclient.http import BatchHttpRequest
+        if API_ENDPOINT:
+            # O lote não segue o api_endpoint do cliente: aponta para o mesmo servidor
+            batch_uri = API_ENDPOINT.rstrip('/') + '/' + BATCH_PATHS[operation.split('.', 1)[0]]
+            return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+        return service.new_batch_http_request(callback=callback)
+    return scheduler.execute_batch(new_batch, requests, operation, idempotent=idempotent, tenant=current_tenant.get())
+
+
+def warm_up():
+    """Carrega credenciais, bibliotecas e os clientes da thread atual antes da primeira mensagem"""
+    get_google_creds()
+    get_sheets_service()
+    get_calendar_service()
@@ -0,0 +1,339 @@
+"""Agendador central das chamadas às APIs do Google.
+
+Toda chamada passa por aqui (via utils.google_auth.execute):
+
+- cada usuário tem, por API (Sheets, Calendar), um balde de fichas com a cota
+  por segundo, porque o Google conta a cota por usuário; por cima há um balde
+  do projeto inteiro (a cota do projeto, somando todos os usuários). Quem está
+  esperando ficha é atendido por prioridade (mensagens do usuário antes das
+  tarefas em segundo plano, como o envio da fila de lançamentos);
+- respostas 429/5xx e falhas de conexão são repetidas com espera exponencial
+  e jitter (ou o Retry-After do Google, quando vier);
+- leituras idênticas em andamento (mesmo usuário, mesma URL) são feitas uma
+  vez só e o resultado é entregue a todos que pediram.
+
+As cotas valem por processo. No modo webhook a do projeto e a do usuário
+padrão (token.json, usado por todos os processos) são divididas entre os
+workers (set_quota_share); a de cada usuário cadastrado não, pois o chat
+dele sempre cai no mesmo worker.
+"""
+import os
+import copy
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from googleapiclient.errors import HttpError
+
+from utils.metrics import timed, observe, increment
+
+# Cota de cada API por usuário: chamadas por segundo e quantas podem sair de uma vez.
+# Os padrões ficam abaixo das cotas por usuário (Sheets: 60/min, Calendar: 600/min)
+SHEETS_RATE = float(os.getenv("GOOGLE_SHEETS_RATE", "0.9"))
+SHEETS_BURST = int(os.getenv("GOOGLE_SHEETS_BURST", "5"))
+CALENDAR_RATE = float(os.getenv("GOOGLE_CALENDAR_RATE", "9"))
+CALENDAR_BURST = int(os.getenv("GOOGLE_CALENDAR_BURST", "20"))
+
+# Cota do projeto (todos os usuários juntos). Os padrões ficam abaixo das cotas
+# padrão do projeto (Sheets: 300/min, Calendar: 10.000/min)
+SHEETS_PROJECT_RATE = float(os.getenv("GOOGLE_SHEETS_PROJECT_RATE", "4.5"))
+SHEETS_PROJECT_BURST = int(os.getenv("GOOGLE_SHEETS_PROJECT_BURST", "25"))
+CALENDAR_PROJECT_RATE = float(os.getenv("GOOGLE_CALENDAR_PROJECT_RATE", "150"))
+CALENDAR_PROJECT_BURST = int(os.getenv("GOOGLE_CALENDAR_PROJECT_BURST", "300"))
+
+# Quantos baldes de usuários manter em memória (o usado há mais tempo sai primeiro)
+MAX_TENANT_BUCKETS = int(os.getenv("GOOGLE_MAX_TENANT_BUCKETS", "4096"))
+
+# Tentativas por chamada e limites da espera entre elas (em segundos)
+MAX_ATTEMPTS = int(os.getenv("GOOGLE_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = float(os.getenv("GOOGLE_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("GOOGLE_BACKOFF_MAX", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Só métodos idempotentes são repetidos em erro 5xx: um POST (append, insert)
+# pode ter sido aplicado mesmo com a resposta de erro. 429 é sempre seguro.
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'PATCH', 'DELETE'}
+
+# Máximo de chamadas num lote HTTP (limite da API do Calendar)
+BATCH_LIMIT = 50
+
+# Prioridades (menor sai primeiro)
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 10
+
+call_priority = contextvars.ContextVar('call_priority', default=PRIORITY_USER)
+
+
+class TokenBucket:
+    """Balde de fichas: rate por segundo, até capacity acumuladas.
+    Quem espera entra numa fila de prioridade; só o primeiro da fila consome"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=PRIORITY_USER, count=1):
+        """Bloqueia até conseguir count fichas. Retorna quanto tempo esperou.
+        Um lote maior que o balde espera o balde encher e deixa o saldo negativo"""
+        needed = min(count, self.capacity)
+        started = time.monotonic()
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] == entry:
+                        self._refill()
+                        if self.tokens >= needed:
+                            break
+                        self._condition.wait((needed - self.tokens) / self.rate)
+                    else:
+                        self._condition.wait()
+                self.tokens -= count
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+        return time.monotonic() - started
+
+    def drain(self):
+        """Zera o saldo (o Google respondeu 429: a cota real está menor que a nossa)"""
+        with self._condition:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+    def set_rate(self, rate, capacity):
+        with self._condition:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = min(self.tokens, capacity)
+            self._condition.notify_all()
+
+
+def _retryable(status, idempotent):
+    return status == 429 or (status in RETRY_STATUSES and idempotent)
+
+
+def permanent_error(error):
+    """Erro que não passa repetindo: 4xx (sem permissão, planilha apagada...), token
+    revogado ou usuário fora do cadastro. Quem envia em segundo plano tira essas linhas da fila"""
+    if isinstance(error, HttpError):
+        return 400 <= error.resp.status < 500 and error.resp.status not in (408, 429)
+    if isinstance(error, PermissionError):
+        return True
+    from google.auth.exceptions import RefreshError
+    return isinstance(error, RefreshError) and not getattr(error, 'retryable', False)
+
+
+def _retry_after(error):
+    value = error.resp.get('retry-after') if error.resp is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class GoogleCallScheduler:
+    def __init__(self, quotas=None, project_quotas=None, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, sleep=time.sleep, max_tenant_buckets=MAX_TENANT_BUCKETS):
+        if quotas is None:
+            quotas = {'sheets': (SHEETS_RATE, SHEETS_BURST), 'calendar': (CALENDAR_RATE, CALENDAR_BURST)}
+        if project_quotas is None:
+            project_quotas = {'sheets': (SHEETS_PROJECT_RATE, SHEETS_PROJECT_BURST),
+                              'calendar': (CALENDAR_PROJECT_RATE, CALENDAR_PROJECT_BURST)}
+        self.quotas = dict(quotas)
+        self.project_quotas = dict(project_quotas)
+        self.project_buckets = {api: TokenBucket(rate, burst) for api, (rate, burst) in self.project_quotas.items()}
+        # (usuário, api) -> balde; usuário None é o token.json padrão
+        self.buckets = OrderedDict()
+        self.max_tenant_buckets = max_tenant_buckets
+        self.share = 1
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def set_quota_share(self, share):
+        """Divide por share (ex.: número de processos dividindo a mesma conta) a cota do
+        projeto e a do usuário padrão, que todos os processos usam"""
+        self.share = share
+        for api, (rate, burst) in self.project_quotas.items():
+            self.project_buckets[api].set_rate(rate / share, max(1, burst // share))
+        with self._lock:
+            for (tenant, api), bucket in self.buckets.items():
+                if tenant is None:
+                    rate, burst = self.quotas[api]
+                    bucket.set_rate(rate / share, max(1, burst // share))
+
+    def bucket_for(self, tenant, api):
+        """Balde do usuário para a API (criado na primeira chamada), ou None se a API não tiver cota"""
+        if api not in self.quotas:
+            return None
+        key = (tenant, api)
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                rate, burst = self.quotas[api]
+                if tenant is None:
+                    rate, burst = rate / self.share, max(1, burst // self.share)
+                bucket = self.buckets[key] = TokenBucket(rate, burst)
+                # Um balde descartado com alguém esperando continua valendo para quem já o pegou
+                while len(self.buckets) > self.max_tenant_buckets:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket
+
+    def _acquire(self, tenant, api, operation, priority, count=1):
+        """Fichas do usuário e do projeto. Retorna o balde do usuário (o que esvazia num 429)"""
+        bucket = self.bucket_for(tenant, api)
+        waited = 0.0
+        if bucket is not None:
+            waited += bucket.acquire(priority, count)
+        project_bucket = self.project_buckets.get(api)
+        if project_bucket is not None:
+            waited += project_bucket.acquire(priority, count)
+        if waited > 0.001:
+            observe(f'google.quota_wait.{operation}', waited)
+        return bucket
+
+    def backoff(self, attempt):
+        """Espera exponencial com jitter completo"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def execute(self, request, operation, tenant=None, idempotent=False):
+        """Executa request (HttpRequest do googleapiclient) respeitando cota, prioridade e repetições.
+        operation é '<api>.<operação>', ex.: 'sheets.append'. idempotent=True libera repetir
+        um POST que não pode duplicar nada (ex.: insert de evento com id escolhido pelo bot)"""
+        method = getattr(request, 'method', 'GET')
+        idempotent = idempotent or method in IDEMPOTENT_METHODS
+        if method != 'GET':
+            return self._execute(request, operation, tenant, idempotent)
+
+        key = (tenant, request.uri, request.body)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            increment('google.coalesced')
+            # Cada um recebe sua cópia: quem chamou pode alterar o resultado
+            return copy.deepcopy(future.result())
+
+        try:
+            result = self._execute(request, operation, tenant, idempotent)
+            future.set_result(result)
+            return result
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _execute(self, request, operation, tenant, idempotent):
+        api = operation.split('.', 1)[0]
+        priority = call_priority.get()
+        for attempt in range(self.max_attempts):
+            bucket = self._acquire(tenant, api, operation, priority)
+            try:
+                with timed(f'google.{operation}'):
+                    return request.execute()
+            except HttpError as error:
+                status = error.resp.status
+                if not _retryable(status, idempotent) or attempt + 1 >= self.max_attempts:
+                    raise
+                if status == 429 and bucket is not None:
+                    bucket.drain()
+                delay = _retry_after(error) or self.backoff(attempt)
+                reason = f"HTTP {status}"
+            except (TimeoutError, ConnectionError) as error:
+                if not idempotent or attempt + 1 >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt)
+                reason = type(error).__name__
+            increment('google.retries')
+            logging.warning(f"google.{operation}: {reason}, tentando de novo em {delay:.1f}s "
+                            f"({attempt + 1}/{self.max_attempts})")
+            self.sleep(delay)
+
+    def execute_batch(self, new_batch, requests, operation, limit=BATCH_LIMIT, idempotent=False, tenant=None):
+        """Envia [(id, request)] em lotes HTTP de até limit chamadas (uma ida e volta por lote).
+
+        new_batch(callback) cria o BatchHttpRequest. Cada chamada do lote conta na cota.
+        Itens que voltarem com 429/5xx são reenviados num novo lote, com espera.
+        Retorna {id: (resposta, erro)}"""
+        api = operation.split('.', 1)[0]
+        bucket = None
+        priority = call_priority.get()
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        pending = list(requests)
+        for attempt in range(self.max_attempts):
+            for start in range(0, len(pending), limit):
+                chunk = pending[start:start + limit]
+                batch = new_batch(callback)
+                for request_id, request in chunk:
+                    batch.add(request, request_id=request_id)
+                bucket = self._acquire(tenant, api, operation, priority, len(chunk))
+                with timed(f'google.{operation}'):
+                    batch.execute()
+
+            retry = [
+                (request_id, request) for request_id, request in pending
+                if isinstance(results[request_id][1], HttpError)
+                and _retryable(results[request_id][1].resp.status, idempotent or request.method in IDEMPOTENT_METHODS)
+            ]
+            if not retry or attempt + 1 >= self.max_attempts:
+                break
+            if bucket is not None and any(results[request_id][1].resp.status == 429 for request_id, _ in retry):
+                bucket.drain()
+            delay = self.backoff(attempt)
+            increment('google.retries', len(retry))
+            logging.warning(f"google.{operation}: {len(retry)} item(ns) do lote falharam, tentando de novo "
+                            f"em {delay:.1f}s ({attempt + 1}/{self.max_attempts})")
+            self.sleep(delay)
+            pending = retry
+        return results
+
+
+class background_calls:
+    """Chamadas feitas dentro do bloco ficam atrás das do usuário na fila da cota"""
+
+    def __enter__(self):
+        self._token = call_priority.set(PRIORITY_BACKGROUND)
+        return self
+
+    def __exit__(self, *exc):
+        call_priority.reset(self._token)
+        return False
+
+
+scheduler = GoogleCallScheduler()
+
+
+def set_quota_share(share):
+    scheduler.set_quota_share(share)
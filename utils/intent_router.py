@@ -0,0 +1,100 @@
+import re
+import time
+
+from utils.metrics import observe, timed
+
+# Grupos nomeados dentro dos padrões de cada intenção: (?P<nome>...)
+_NAMED_GROUP = re.compile(r'\(\?P<(\w+)>')
+
+
+class Intent:
+    def __init__(self, name, pattern, handler, priority, whole_message=False):
+        self.name = name
+        self.pattern = pattern
+        self.handler = handler
+        self.priority = priority
+        self.whole_message = whole_message
+        self.key = None
+        self.groups = {}
+
+
+class IntentRouter:
+    """Registro de intenções com um único regex combinado.
+
+    Cada intenção declara um padrão (com grupos nomeados). Os padrões são
+    juntados numa alternância só, compilada uma vez: cada mensagem passa por
+    um único re.search, que devolve a intenção e os grupos capturados.
+
+    Vence a intenção que casar mais à esquerda na mensagem; na mesma posição,
+    vence a de maior prioridade (e, empatando, a registrada primeiro).
+    Por isso "excluir evento x" não cai mais em "eventos".
+
+    Intenções com whole_message=True (as que apagam ou desfazem algo) só casam
+    com a mensagem inteira: "quero desfazer isso" não desfaz o último lançamento.
+    """
+
+    def __init__(self, flags=0):
+        self.flags = flags
+        self._intents = []
+        self._combined = None
+        self._by_key = {}
+
+    def register(self, name, pattern, handler=None, priority=0, whole_message=False):
+        # Confere o padrão isolado para o erro apontar a intenção certa
+        re.compile(pattern, self.flags)
+        self._intents.append(Intent(name, pattern, handler, priority, whole_message))
+        self._combined = None
+
+    def intent(self, name, pattern, priority=0, whole_message=False):
+        """Decorador: @router.intent('gasto', r'gasto (?P<valor>\\d+)')"""
+        def decorator(handler):
+            self.register(name, pattern, handler, priority, whole_message)
+            return handler
+        return decorator
+
+    def intents(self):
+        return [intent.name for intent in self._ordered()]
+
+    def _ordered(self):
+        # sorted é estável: empates mantêm a ordem de registro
+        return sorted(self._intents, key=lambda intent: -intent.priority)
+
+    def compile(self):
+        alternatives = []
+        self._by_key = {}
+        for index, intent in enumerate(self._ordered()):
+            intent.key = f'i{index}'
+            # Prefixa os grupos internos para não repetir nomes entre intenções
+            intent.groups = {
+                f'{intent.key}_{group}': group for group in _NAMED_GROUP.findall(intent.pattern)
+            }
+            pattern = _NAMED_GROUP.sub(lambda m: f'(?P<{intent.key}_{m.group(1)}>', intent.pattern)
+            if intent.whole_message:
+                # \A e \Z valem só nas pontas da mensagem (mesmo com re.MULTILINE)
+                pattern = rf'\A\s*(?:{pattern})[\s.!]*\Z'
+            alternatives.append(f'(?P<{intent.key}>{pattern})')
+            self._by_key[intent.key] = intent
+        self._combined = re.compile('|'.join(alternatives), self.flags)
+        return self._combined
+
+    def match(self, text):
+        """Retorna (intenção, grupos) ou (None, None) se nada casar"""
+        combined = self._combined or self.compile()
+        found = combined.search(text)
+        if found is None:
+            return None, None
+        # O grupo externo da alternativa é o último a fechar
+        intent = self._by_key[found.lastgroup]
+        groups = {name: found.group(key) for key, name in intent.groups.items()}
+        return intent, groups
+
+    async def dispatch(self, text, *args):
+        """Chama o handler da intenção com (*args, grupos). Retorna o nome da intenção ou None"""
+        started = time.perf_counter()
+        intent, groups = self.match(text)
+        observe('router.match', time.perf_counter() - started)
+        if intent is None:
+            return None
+        with timed(f'intent.{intent.name}'):
+            await intent.handler(*args, groups)
+        return intent.name
@@ -0,0 +1,240 @@
+import os
+import time
+import sqlite3
+import threading
+
+from utils.finance_storage import (
+    list_finance_data, parse_row, SHEET_NAME, FIRST_DATA_ROW, KEY_COLUMN
+)
+
+# Cópia local da planilha financeira, usada para responder os totais sem baixar tudo de novo
+LEDGER_PATH = os.getenv("LEDGER_PATH", "ledger.db")
+
+# Intervalo mínimo (em segundos) entre duas sincronizações com a planilha
+SYNC_INTERVAL = float(os.getenv("LEDGER_SYNC_INTERVAL", "30"))
+
+
+class LedgerCache:
+    """Espelho local e incremental da planilha financeira.
+
+    A planilha só cresce por append, então guardamos quantas linhas já foram
+    lidas e buscamos apenas as novas. Os totais ficam pré-calculados por
+    (ano, mês, tipo, categoria), e o total do mês vira uma consulta indexada.
+    """
+
+    def __init__(self, db_path=LEDGER_PATH, fetch_func=list_finance_data, sync_interval=SYNC_INTERVAL):
+        self.fetch_func = fetch_func
+        self.sync_interval = sync_interval
+        self._last_sync = {}
+        self._lock = threading.RLock()
+        # Uma sincronização por planilha de cada vez; a busca na rede fica fora do _lock,
+        # então uma planilha lenta (ou em espera por 429) não segura as outras
+        self._sync_locks = {}
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                spreadsheet_id TEXT NOT NULL,
+                row_number INTEGER NOT NULL,
+                entry_date TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                description TEXT,
+                value REAL NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT,
+                entry_key TEXT,
+                PRIMARY KEY (spreadsheet_id, row_number)
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_period
+                ON entries (spreadsheet_id, year, month, type, category);
+            CREATE INDEX IF NOT EXISTS idx_entries_date
+                ON entries (spreadsheet_id, entry_date);
+
+            CREATE TABLE IF NOT EXISTS aggregates (
+                spreadsheet_id TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (spreadsheet_id, year, month, type, category)
+            );
+
+            CREATE TABLE IF NOT EXISTS sync_state (
+                spreadsheet_id TEXT PRIMARY KEY,
+                rows_synced INTEGER NOT NULL
+            );
+        """)
+        # Ledgers criados antes das chaves de idempotência não têm a coluna entry_key
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(entries)")]
+        if 'entry_key' not in columns:
+            self._db.execute("ALTER TABLE entries ADD COLUMN entry_key TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_key ON entries (spreadsheet_id, entry_key)")
+        self._db.commit()
+
+    def rows_synced(self, spreadsheet_id):
+        with self._lock:
+            result = self._db.execute(
+                "SELECT rows_synced FROM sync_state WHERE spreadsheet_id = ?", (spreadsheet_id,)
+            ).fetchone()
+        return result[0] if result else 0
+
+    def sync(self, spreadsheet_id, force=False):
+        """Busca só as linhas adicionadas desde a última sincronização.
+        Retorna quantas linhas novas foram lidas"""
+        with self._lock:
+            sync_lock = self._sync_locks.setdefault(spreadsheet_id, threading.Lock())
+        with sync_lock:
+            last = self._last_sync.get(spreadsheet_id)
+            if not force and last is not None and time.monotonic() - last < self.sync_interval:
+                return 0
+
+            synced = self.rows_synced(spreadsheet_id)
+            first_row = FIRST_DATA_ROW + synced
+            rows = self.fetch_func(spreadsheet_id, f'{SHEET_NAME}!A{first_row}:{KEY_COLUMN}')
+            self._last_sync[spreadsheet_id] = time.monotonic()
+            if rows:
+                self.add_rows(spreadsheet_id, rows, first_row)
+            return len(rows)
+
+    def on_rows_written(self, spreadsheet_id, rows):
+        """Listener das gravações (add_write_listener): a próxima consulta busca as linhas novas
+        sem esperar o SYNC_INTERVAL, então quem gravou vê o próprio lançamento"""
+        self._last_sync.pop(spreadsheet_id, None)
+
+    def known_keys(self, spreadsheet_id, keys):
+        """Quais das chaves de idempotência já vieram da planilha"""
+        keys = list(keys)
+        if not keys:
+            return set()
+        with self._lock:
+            return {key for (key,) in self._db.execute(
+                f"SELECT entry_key FROM entries WHERE spreadsheet_id = ? AND entry_key IN ({', '.join('?' * len(keys))})",
+                (spreadsheet_id, *keys)
+            )}
+
+    def add_rows(self, spreadsheet_id, rows, first_row):
+        """Grava as linhas lidas da planilha e atualiza os totais acumulados"""
+        entries = []
+        aggregates = {}
+        for offset, row in enumerate(rows):
+            parsed = parse_row(row)
+            if parsed is None:
+                # Linhas vazias ou inválidas também contam, para manter a posição na planilha
+                continue
+            entry_date, descricao, valor, tipo, categoria = parsed
+            entries.append((spreadsheet_id, first_row + offset, entry_date.isoformat(),
+                            entry_date.year, entry_date.month, descricao, valor, tipo, categoria,
+                            row[5] if len(row) > 5 and row[5] else None))
+            key = (entry_date.year, entry_date.month, tipo, categoria)
+            total, count = aggregates.get(key, (0.0, 0))
+            aggregates[key] = (total + valor, count + 1)
+
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entries
+                )
+                self._db.executemany("""
+                    INSERT INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (spreadsheet_id, year, month, type, category)
+                    DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+                """, [(spreadsheet_id, *key, total, count) for key, (total, count) in aggregates.items()])
+                self._db.execute("""
+                    INSERT INTO sync_state VALUES (?, ?)
+                    ON CONFLICT (spreadsheet_id) DO UPDATE SET rows_synced = excluded.rows_synced
+                """, (spreadsheet_id, first_row - FIRST_DATA_ROW + len(rows)))
+
+    def month_totals(self, spreadsheet_id, year, month):
+        """Totais do mês por tipo, ex.: {'Despesa': 120.0, 'Receita': 500.0}"""
+        with self._lock:
+            result = self._db.execute("""
+                SELECT type, SUM(total) FROM aggregates
+                WHERE spreadsheet_id = ? AND year = ? AND month = ?
+                GROUP BY type
+            """, (spreadsheet_id, year, month)).fetchall()
+        return dict(result)
+
+    def month_totals_by_category(self, spreadsheet_id, year, month, tipo='Despesa'):
+        """Totais do mês por categoria para um tipo, do maior para o menor"""
+        with self._lock:
+            return self._db.execute("""
+                SELECT category, total FROM aggregates
+                WHERE spreadsheet_id = ? AND year = ? AND month = ? AND type = ?
+                ORDER BY total DESC
+            """, (spreadsheet_id, year, month, tipo)).fetchall()
+
+    def day_totals(self, spreadsheet_id, year, month):
+        """Totais do mês por (dia, tipo, categoria): [('2024-05-03', 'Despesa', 'Mercado', 120.0), ...]"""
+        with self._lock:
+            return self._db.execute("""
+                SELECT substr(entry_date, 1, 10), type, category, SUM(value) FROM entries
+                WHERE spreadsheet_id = ? AND year = ? AND month = ?
+                GROUP BY 1, 2, 3
+            """, (spreadsheet_id, year, month)).fetchall()
+
+    def period_totals(self, spreadsheet_id, start, end):
+        """Totais por tipo dos lançamentos entre as datas start (incluída) e end (excluída)"""
+        with self._lock:
+            result = self._db.execute("""
+                SELECT type, SUM(value) FROM entries
+                WHERE spreadsheet_id = ? AND entry_date >= ? AND entry_date < ?
+                GROUP BY type
+            """, (spreadsheet_id, start.isoformat(), end.isoformat())).fetchall()
+        return dict(result)
+
+    def fetch_columns(self, spreadsheet_id, after_row=0):
+        """Linhas (número da linha, timestamp, valor, tipo, categoria) depois de after_row,
+        na ordem da planilha. Usado pelos relatórios para montar os arrays"""
+        with self._lock:
+            return self._db.execute("""
+                SELECT row_number, CAST(strftime('%s', entry_date) AS INTEGER), value, type, category
+                FROM entries
+                WHERE spreadsheet_id = ? AND row_number > ?
+                ORDER BY row_number
+            """, (spreadsheet_id, after_row)).fetchall()
+
+    def iter_entries(self, spreadsheet_id, page_size=5000):
+        """Percorre (data, descrição, valor, tipo, categoria) de todas as linhas, em páginas"""
+        after_row = 0
+        while True:
+            with self._lock:
+                page = self._db.execute("""
+                    SELECT row_number, entry_date, description, value, type, category
+                    FROM entries
+                    WHERE spreadsheet_id = ? AND row_number > ?
+                    ORDER BY row_number LIMIT ?
+                """, (spreadsheet_id, after_row, page_size)).fetchall()
+            for row in page:
+                yield row[1:]
+            if len(page) < page_size:
+                return
+            after_row = page[-1][0]
+
+    def category_by_description(self, spreadsheet_id):
+        """Categoria mais usada para cada descrição já lançada (em minúsculas)"""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT lower(description), category, COUNT(*) AS uses FROM entries
+                WHERE spreadsheet_id = ? AND description != '' AND category != ''
+                GROUP BY 1, 2 ORDER BY uses
+            """, (spreadsheet_id,)).fetchall()
+        # Em ordem crescente de uso: a mais usada sobrescreve as outras
+        return {description: category for description, category, _ in rows}
+
+    def synced_month_totals(self, spreadsheet_id, year, month):
+        """Sincroniza (se preciso) e retorna os totais do mês"""
+        self.sync(spreadsheet_id)
+        return self.month_totals(spreadsheet_id, year, month)
+
+    def synced_period_totals(self, spreadsheet_id, start, end):
+        """Sincroniza (se preciso) e retorna os totais do período"""
+        self.sync(spreadsheet_id)
+        return self.period_totals(spreadsheet_id, start, end)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
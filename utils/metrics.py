@@ -0,0 +1,212 @@
+"""Métricas de latência e contadores do bot.
+
+Cada operação (intenção, chamada ao Google, chamada ao Telegram) registra o
+tempo gasto num histograma com faixas fixas; daí saem p50/p95/p99 sem guardar
+as amostras. Registrar custa uma leitura do relógio, um bisect e um lock.
+"""
+import os
+import time
+import bisect
+import inspect
+import logging
+import threading
+import functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Limites superiores das faixas, em segundos (0,25 ms até 60 s)
+BUCKETS = (
+    0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Porta do endpoint de métricas no formato do Prometheus (desligado se vazio)
+METRICS_PORT = os.getenv("METRICS_PORT")
+# O endpoint não tem autenticação: por padrão só aceita conexões locais.
+# Use 0.0.0.0 para o Prometheus coletar de outra máquina
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'errors', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if error:
+                self.errors += 1
+
+    def percentile(self, p):
+        """Estimativa do percentil (limite superior da faixa onde ele cai)"""
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if not count:
+            return 0.0
+        target = count * p / 100
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def _histogram(name):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def observe(name, seconds, error=False):
+    _histogram(name).observe(seconds, error)
+
+
+def increment(name, amount=1):
+    """Soma num contador (ex.: 'google.retries', 'google.sheets.append.errors')"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+class timed:
+    """Mede o bloco: `with timed('google.sheets.append'): ...`
+    Também serve de decorador (funções normais e async). Exceções contam como erro"""
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started, error=exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        name = self.name
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def snapshot():
+    """Cópia dos dados: {nome: (contagem, erros, soma, p50, p95, p99)} e os contadores"""
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+    stats = {}
+    for name, histogram in sorted(histograms.items()):
+        stats[name] = (histogram.count, histogram.errors, histogram.total,
+                       histogram.percentile(50), histogram.percentile(95), histogram.percentile(99))
+    return stats, counters
+
+
+def _ms(seconds):
+    return "∞" if seconds == float('inf') else f"{seconds * 1000:.1f}"
+
+
+def render_text():
+    """Resumo legível para o comando /stats"""
+    stats, counters = snapshot()
+    if not stats and not counters:
+        return "Nenhuma métrica registrada ainda."
+    lines = ["Operação: chamadas (erros) p50/p95/p99 ms"]
+    for name, (count, errors, _, p50, p95, p99) in stats.items():
+        lines.append(f"{name}: {count} ({errors}) {_ms(p50)}/{_ms(p95)}/{_ms(p99)}")
+    if counters:
+        lines.append("")
+        lines.append("Contadores:")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def render_prometheus():
+    """Métricas no formato de texto do Prometheus"""
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+    lines = [
+        "# HELP bot_operation_seconds Duração das operações do bot",
+        "# TYPE bot_operation_seconds histogram",
+    ]
+    for name, histogram in sorted(histograms.items()):
+        with histogram.lock:
+            counts = list(histogram.counts)
+            count = histogram.count
+            total = histogram.total
+        cumulative = 0
+        for bucket, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'bot_operation_seconds_bucket{{operation="{name}",le="{bucket}"}} {cumulative}')
+        lines.append(f'bot_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {count}')
+        lines.append(f'bot_operation_seconds_sum{{operation="{name}"}} {total}')
+        lines.append(f'bot_operation_seconds_count{{operation="{name}"}} {count}')
+    lines.append("# HELP bot_operation_errors_total Operações que terminaram com erro")
+    lines.append("# TYPE bot_operation_errors_total counter")
+    for name, histogram in sorted(histograms.items()):
+        lines.append(f'bot_operation_errors_total{{operation="{name}"}} {histogram.errors}')
+    lines.append("# HELP bot_events_total Contadores do bot")
+    lines.append("# TYPE bot_events_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'bot_events_total{{event="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host=METRICS_HOST):
+    """Sobe o endpoint /metrics numa thread em segundo plano"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Métricas em http://{host}:{port}/metrics")
+    return server
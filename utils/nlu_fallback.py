@@ -0,0 +1,231 @@
+"""Interpretação de mensagens livres por um modelo de linguagem, só quando o regex não entende.
+
+O caminho rápido não muda: o roteador de intenções atende tudo que casa com
+os padrões. Só as mensagens que não casam com nada (ou caem numa intenção de
+formato inválido) chegam aqui, e o modelo as reescreve num dos comandos que o
+bot já entende ("quanto gastei esse mês?" -> "total do mês"). O comando volta
+para o roteador, então o modelo nunca aciona nada por conta própria.
+
+- Cache LRU pelo texto normalizado, inclusive das mensagens que o modelo não entendeu.
+- Mensagens que chegam juntas (dentro de NLU_BATCH_WINDOW_MS) vão numa chamada só.
+- Cada mensagem espera no máximo NLU_LATENCY_BUDGET segundos; depois disso o
+  bot segue como se o modelo não tivesse entendido (a resposta que chega
+  atrasada ainda vai para o cache).
+
+NLU_BACKEND escolhe o cliente: "gemini" (google-generativeai), "stub" (regras
+locais, sem rede, para testes e benchmarks) ou vazio (desligado).
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+
+from utils.date_parser import normalize
+from utils.metrics import increment, observe
+from utils.tenant_registry import LRUCache
+
+# "gemini", "stub" ou vazio (sem fallback)
+NLU_BACKEND = os.getenv("NLU_BACKEND", "")
+
+NLU_MODEL = os.getenv("NLU_MODEL", "gemini-1.5-flash")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Quanto (em segundos) uma mensagem pode esperar pelo modelo antes de o bot desistir dele
+LATENCY_BUDGET = float(os.getenv("NLU_LATENCY_BUDGET", "2.5"))
+# Limite de uma chamada ao modelo (a resposta atrasada ainda alimenta o cache)
+MODEL_TIMEOUT = float(os.getenv("NLU_MODEL_TIMEOUT", "15"))
+
+# Janela para juntar mensagens numa chamada só, e o máximo por chamada
+BATCH_WINDOW = float(os.getenv("NLU_BATCH_WINDOW_MS", "30")) / 1000
+MAX_BATCH = int(os.getenv("NLU_MAX_BATCH", "16"))
+
+# Frases lembradas (normalizadas), com ou sem comando
+CACHE_SIZE = int(os.getenv("NLU_CACHE_SIZE", "5000"))
+
+# Mensagens muito longas ou curtas demais não vão para o modelo
+MIN_TEXT_LENGTH = 4
+MAX_TEXT_LENGTH = 300
+
+PROMPT = """Você traduz mensagens de um bot de finanças e agenda em português para um dos comandos abaixo.
+Responda só com uma lista JSON, com um item por mensagem, na mesma ordem: o comando (texto) ou null
+se a mensagem não pedir nada disso. Mantenha datas e horários como o usuário escreveu ("amanhã", "sexta").
+
+Comandos:
+- gasto <valor inteiro> reais <descrição>
+- ganhei <valor inteiro> reais <descrição>
+- desfazer último gasto
+- total de <período>            (ex.: total do mês, total da semana, total de março)
+- gastos por categoria de <período>
+- resumo do ano
+- orçamento <categoria> <valor>
+- orçamentos
+- agendar <título> <dia> às <hora>  (ex.: agendar dentista sexta às 14h30 por 1 hora)
+- eventos de <dia ou período>    (ex.: eventos de amanhã, eventos da semana)
+- excluir evento <título>
+- excluir <número da lista>
+- mudar nome do evento <nome atual> para <nome novo>
+- mover todos os eventos de <dia> para <dia>
+"""
+
+_MISSING = object()
+
+
+class StubClient:
+    """Cliente local, sem rede: algumas regras de sinônimos no lugar do modelo.
+    latency simula o tempo de uma chamada (testes e benchmarks)"""
+
+    # (padrão, modelo do comando, valores para os grupos que não apareceram)
+    RULES = [
+        (re.compile(r'(?:paguei|comprei|gastei)\s(?:r\$\s?)?(?P<valor>\d+)(?:\sreais)?\s(?:(?:n[ao]s?|em|de|com)\s)?(?P<descricao>.+)'),
+         'gasto {valor} reais {descricao}', {}),
+        (re.compile(r'(?:recebi|entrou|ganhei)\s(?:r\$\s?)?(?P<valor>\d+)(?:\sreais)?\s(?:(?:de|do|da)\s)?(?P<descricao>.+)'),
+         'ganhei {valor} reais {descricao}', {}),
+        (re.compile(r'quanto (?:eu )?(?:gastei|gastamos)(?:\s(?:(?:n[oa]|em|d[eoa])\s)?(?P<periodo>.+))?'),
+         'total de {periodo}', {'periodo': 'mes'}),
+        (re.compile(r'(?:minha agenda|meus compromissos|o que (?:eu )?tenho)(?:\s(?:(?:para|pra|de|d[oa]|n[oa])\s)?(?P<periodo>.+))?'),
+         'eventos de {periodo}', {'periodo': 'hoje'}),
+        (re.compile(r'(?:marca|marque|marcar|agende|coloca na agenda)\s(?:(?:um|uma)\s)?(?P<resto>.+)'),
+         'agendar {resto}', {}),
+    ]
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def complete(self, texts):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._rewrite(normalize(text)) for text in texts]
+
+    def _rewrite(self, text):
+        for pattern, template, defaults in self.RULES:
+            found = pattern.match(text)
+            if found:
+                return template.format(**{key: value or defaults.get(key, '') for key, value in found.groupdict().items()})
+        return None
+
+
+class GeminiClient:
+    """Gemini pelo google-generativeai: uma chamada por lote, resposta em JSON"""
+
+    def __init__(self, model=NLU_MODEL, api_key=GEMINI_API_KEY):
+        # Importado só aqui: é pesado e só é usado com NLU_BACKEND=gemini
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(
+            model,
+            system_instruction=PROMPT,
+            generation_config={'response_mime_type': 'application/json', 'temperature': 0},
+        )
+
+    async def complete(self, texts):
+        response = await self.model.generate_content_async(json.dumps(texts, ensure_ascii=False))
+        commands = json.loads(response.text)
+        if not isinstance(commands, list) or len(commands) != len(texts):
+            raise ValueError(f"resposta com {len(commands) if isinstance(commands, list) else '?'} itens para {len(texts)} mensagens")
+        return [command if isinstance(command, str) else None for command in commands]
+
+
+def make_client(backend=NLU_BACKEND):
+    if backend == 'gemini':
+        return GeminiClient()
+    if backend == 'stub':
+        return StubClient()
+    raise ValueError(f"NLU_BACKEND desconhecido: {backend}")
+
+
+class FallbackNLU:
+    """Fila do fallback: cache, lotes e orçamento de latência em volta de um cliente.
+
+    accept(comando) decide se o comando devolvido vale (ex.: o roteador o reconhece);
+    os recusados contam como "não entendi"."""
+
+    def __init__(self, client, accept=None, latency_budget=LATENCY_BUDGET, batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH, cache_size=CACHE_SIZE, model_timeout=MODEL_TIMEOUT):
+        self.client = client
+        self.accept = accept or (lambda command: True)
+        self.latency_budget = latency_budget
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.model_timeout = model_timeout
+        self._cache = LRUCache(cache_size)
+        self._pending = {}  # texto normalizado -> future (no lote ou na chamada em andamento)
+        self._batch = []
+        self._timer = None
+        self._tasks = set()
+
+    async def interpret(self, text):
+        """Comando equivalente que o bot entende, ou None"""
+        key = normalize(text)
+        if not MIN_TEXT_LENGTH <= len(key) <= MAX_TEXT_LENGTH:
+            return None
+        cached = self._cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            increment('nlu.cache_hit')
+            return cached
+
+        future = self._pending.get(key)
+        if future is None:
+            # A mesma frase de vários chats ao mesmo tempo vira um item só
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            self._batch.append((key, text))
+            if len(self._batch) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.latency_budget)
+        except asyncio.TimeoutError:
+            increment('nlu.timeout')
+            return None
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._complete(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _complete(self, batch):
+        started = time.perf_counter()
+        try:
+            commands = await asyncio.wait_for(self.client.complete([text for _, text in batch]), self.model_timeout)
+            observe('nlu.model', time.perf_counter() - started)
+            increment('nlu.messages', len(batch))
+        except Exception as e:
+            # Erro não vai para o cache: a próxima vez tenta de novo
+            observe('nlu.model', time.perf_counter() - started, error=True)
+            logging.error(f"Erro no modelo de linguagem ({len(batch)} mensagens): {e}")
+            for key, _ in batch:
+                self._resolve(key, None)
+            return
+
+        for (key, _), command in zip(batch, commands):
+            command = ' '.join(command.lower().split()) if command else None
+            if command and not self.accept(command):
+                command = None
+            increment('nlu.understood' if command else 'nlu.not_understood')
+            self._cache.put(key, command)
+            self._resolve(key, command)
+
+    def _resolve(self, key, command):
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(command)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=5)
+        for key in list(self._pending):
+            self._resolve(key, None)
@@ -0,0 +1,255 @@
+"""Importação de extratos bancários (CSV ou OFX) para a planilha financeira.
+
+O arquivo é lido como fluxo, linha a linha: só o lote atual de lançamentos
+fica em memória. Cada lançamento recebe uma categoria (pelo histórico da
+planilha ou por palavras-chave) e é comparado por hash com as linhas que já
+estão na planilha, para que importar o mesmo extrato duas vezes não duplique
+nada. As linhas novas vão em appends de até CHUNK_ROWS linhas.
+"""
+import io
+import os
+import re
+import csv
+import codecs
+import hashlib
+import itertools
+import datetime
+from collections import Counter, namedtuple
+
+from utils.finance_storage import add_finance_entry, parse_value, DATE_FORMAT
+from utils.google_scheduler import background_calls
+from utils.calendar_cache import normalize
+
+# Linhas por chamada de append (10 mil lançamentos = 5 chamadas)
+CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+
+DEFAULT_CATEGORY = 'Outros'
+
+# Palavras-chave (sem acento, minúsculas) de cada categoria, na ordem de preferência
+CATEGORY_RULES = [
+    ('Mercado', ['supermercado', 'mercado', 'carrefour', 'pao de acucar', 'assai', 'atacadao', 'hortifruti']),
+    ('Alimentação', ['ifood', 'restaurante', 'lanchonete', 'padaria', 'pizzaria', 'burger', 'rappi', 'cafe']),
+    ('Transporte', ['uber', '99app', '99 pop', 'posto', 'combustivel', 'shell', 'ipiranga', 'estacionamento',
+                    'metro', 'sem parar', 'veloe', 'pedagio']),
+    ('Moradia', ['aluguel', 'condominio', 'enel', 'light', 'sabesp', 'cemig', 'copel', 'energia', 'agua', 'gas']),
+    ('Saúde', ['farmacia', 'drogaria', 'droga raia', 'drogasil', 'hospital', 'clinica', 'laboratorio', 'unimed']),
+    ('Assinaturas', ['netflix', 'spotify', 'amazon prime', 'youtube', 'disney', 'hbo', 'deezer', 'icloud']),
+    ('Telefone', ['vivo', 'claro', 'tim', 'oi fibra', 'internet']),
+    ('Salário', ['salario', 'folha de pagamento', 'proventos']),
+    ('Tarifas', ['tarifa', 'anuidade', 'iof', 'juros', 'encargos']),
+    ('Transferências', ['pix', 'ted', 'doc', 'transferencia']),
+]
+
+# Um único regex com um grupo por categoria; vence a palavra mais à esquerda
+_CATEGORY_PATTERN = re.compile(r'\b(?:' + '|'.join(
+    f'(?P<c{index}>{"|".join(re.escape(keyword) for keyword in keywords)})'
+    for index, (_, keywords) in enumerate(CATEGORY_RULES)
+) + r')\b')
+
+# Nomes de coluna aceitos no cabeçalho do CSV (já normalizados)
+_DATE_COLUMNS = {'data', 'date', 'data lancamento', 'data do lancamento', 'data movimento', 'dt'}
+_DESCRIPTION_COLUMNS = {'descricao', 'historico', 'description', 'title', 'memo', 'lancamento',
+                        'estabelecimento', 'detalhes'}
+_VALUE_COLUMNS = {'valor', 'amount', 'value', 'valor (r$)', 'valor r$', 'quantia'}
+_TYPE_COLUMNS = {'tipo', 'type', 'd/c', 'natureza'}
+
+_DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d/%m/%y', '%d-%m-%Y', '%d.%m.%Y')
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+Transaction = namedtuple('Transaction', 'date description value type')
+ImportResult = namedtuple('ImportResult', 'imported duplicates invalid appends expenses income')
+
+
+class StatementError(Exception):
+    """Arquivo que não parece ser um extrato CSV/OFX"""
+
+
+def categorize(description, history=None):
+    """Categoria pelo histórico (mesma descrição já lançada) ou pela primeira palavra-chave encontrada"""
+    if history:
+        category = history.get(description.lower())
+        if category:
+            return category
+    found = _CATEGORY_PATTERN.search(normalize(description))
+    if found is None:
+        return DEFAULT_CATEGORY
+    return CATEGORY_RULES[int(found.lastgroup[1:])][0]
+
+
+def entry_hash(entry_date, description, value, tipo):
+    """Identidade de um lançamento para a deduplicação (dia, valor, tipo e descrição)"""
+    key = f"{entry_date:%Y-%m-%d}|{abs(value):.2f}|{tipo}|{' '.join(normalize(description).split())}"
+    return hashlib.blake2b(key.encode(), digest_size=12).digest()
+
+
+def _parse_date(raw):
+    raw = raw.strip()[:10]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(raw, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _signed_type(value, marker=None):
+    """(valor absoluto, tipo). Sem coluna de tipo, negativo é despesa"""
+    if marker:
+        marker = normalize(marker).strip()
+        if marker.startswith(('d', 'saida', 'debit')):
+            return abs(value), 'Despesa'
+        if marker.startswith(('c', 'entrada', 'credit')):
+            return abs(value), 'Receita'
+    return abs(value), 'Despesa' if value < 0 else 'Receita'
+
+
+def _open_text(stream):
+    """Abre o arquivo binário como texto: UTF-8 se der, senão Latin-1 (comum em bancos brasileiros)"""
+    head = stream.peek(65536) if hasattr(stream, 'peek') else b''
+    encoding = 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = 'latin-1'
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def _find_columns(header):
+    def column(names):
+        return next((index for index, name in enumerate(header) if name in names), None)
+    return column(_DATE_COLUMNS), column(_DESCRIPTION_COLUMNS), column(_VALUE_COLUMNS), column(_TYPE_COLUMNS)
+
+
+def iter_csv(text, max_preamble=20):
+    """Lançamentos de um CSV (vírgula, ponto e vírgula ou tab), com ou sem cabeçalho.
+    Linhas que não puderem ser lidas saem como None"""
+    line, pending = text.readline(), []
+    if not line:
+        return
+
+    # Alguns bancos põem linhas de apresentação (agência, conta, período) antes do cabeçalho
+    for _ in range(max_preamble):
+        delimiter = max(';,\t', key=line.count)
+        header = [normalize(cell).strip() for cell in next(csv.reader([line], delimiter=delimiter), [])]
+        date_col, description_col, value_col, type_col = _find_columns(header)
+        if date_col is not None and value_col is not None:
+            break
+        if header and _parse_date(header[0]) is not None:
+            # Sem cabeçalho: data, descrição, valor (e a linha atual já é um lançamento)
+            date_col, description_col, value_col, type_col = 0, 1, 2, None
+            pending = [line]
+            break
+        line = text.readline()
+        if not line:
+            raise StatementError("Não encontrei as colunas de data e valor no CSV")
+    else:
+        raise StatementError("Não encontrei as colunas de data e valor no CSV")
+
+    for row in csv.reader(itertools.chain(pending, text), delimiter=delimiter):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            entry_date = _parse_date(row[date_col])
+            value = parse_value(row[value_col])
+        except (IndexError, ValueError):
+            yield None
+            continue
+        if entry_date is None:
+            yield None
+            continue
+        description = row[description_col] if description_col is not None and description_col < len(row) else ''
+        marker = row[type_col] if type_col is not None and type_col < len(row) else None
+        value, tipo = _signed_type(value, marker)
+        yield Transaction(entry_date, ' '.join(description.split()), value, tipo)
+
+
+def iter_ofx(text):
+    """Lançamentos (<STMTTRN>) de um OFX, tanto SGML (1.x) quanto XML (2.x)"""
+    current = None
+    found = False
+    for line in text:
+        for closing, tag, content in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    found = True
+                    yield _ofx_transaction(current)
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing:
+                current[tag] = content.strip()
+    if not found:
+        raise StatementError("Nenhum lançamento (<STMTTRN>) encontrado no OFX")
+
+
+def _ofx_transaction(fields):
+    try:
+        entry_date = datetime.datetime.strptime(fields['DTPOSTED'][:8], '%Y%m%d')
+        value = parse_value(fields['TRNAMT'])
+    except (KeyError, ValueError):
+        return None
+    description = fields.get('MEMO') or fields.get('NAME') or ''
+    value, tipo = _signed_type(value)
+    return Transaction(entry_date, ' '.join(description.split()), value, tipo)
+
+
+def iter_statement(stream, filename=''):
+    """Lançamentos do arquivo (binário), escolhendo o leitor pela extensão ou pelo conteúdo"""
+    head = stream.peek(512)[:512] if hasattr(stream, 'peek') else b''
+    text = _open_text(stream)
+    if filename.lower().endswith('.ofx') or b'OFXHEADER' in head or b'<OFX>' in head.upper():
+        return iter_ofx(text)
+    return iter_csv(text)
+
+
+def import_statement(path, spreadsheet_id, ledger, filename='', append_func=add_finance_entry,
+                     chunk_rows=CHUNK_ROWS, progress=None):
+    """Importa o extrato em path para a planilha, sem repetir lançamentos que já estão lá.
+    progress(importados), se passado, é chamado depois de cada append"""
+    ledger.sync(spreadsheet_id, force=True)
+
+    # Quantas vezes cada lançamento já aparece na planilha (dois cafés iguais no mesmo dia são dois lançamentos)
+    existing = Counter()
+    for entry_date, description, value, tipo, _ in ledger.iter_entries(spreadsheet_id):
+        existing[entry_hash(datetime.datetime.fromisoformat(entry_date), description or '', value, tipo)] += 1
+    history = ledger.category_by_description(spreadsheet_id)
+
+    imported = duplicates = invalid = appends = 0
+    totals = {'Despesa': 0.0, 'Receita': 0.0}
+    chunk = []
+
+    def send():
+        nonlocal appends
+        # Importação em massa: as mensagens dos usuários passam na frente na cota
+        with background_calls():
+            append_func(spreadsheet_id, chunk)
+        appends += 1
+        chunk.clear()
+        if progress:
+            progress(imported)
+
+    with open(path, 'rb') as stream:
+        for transaction in iter_statement(stream, filename):
+            if transaction is None:
+                invalid += 1
+                continue
+            key = entry_hash(*transaction)
+            if existing[key] > 0:
+                existing[key] -= 1
+                duplicates += 1
+                continue
+            category = categorize(transaction.description, history)
+            chunk.append([transaction.date.strftime(DATE_FORMAT), transaction.description,
+                          transaction.value, transaction.type, category])
+            totals[transaction.type] += transaction.value
+            imported += 1
+            if len(chunk) >= chunk_rows:
+                send()
+    if chunk:
+        send()
+
+    if imported:
+        ledger.sync(spreadsheet_id, force=True)
+    return ImportResult(imported, duplicates, invalid, appends, totals['Despesa'], totals['Receita'])
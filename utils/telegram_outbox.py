@@ -0,0 +1,285 @@
+"""Saída das mensagens para o Telegram, com controle de flood.
+
+O Telegram aceita uns 30 envios por segundo por bot, 1 por segundo em cada
+chat (20 por minuto em grupos). Quem passa disso leva 429 com retry_after e
+fica bloqueado. OutboundLimiter é o rate limiter do python-telegram-bot:
+toda chamada da API com chat_id passa por ele.
+
+- Cada chat tem uma fila própria, enviada em ordem no ritmo do chat, e todos
+  dividem o ritmo global.
+- Respostas de texto que se acumulam na fila de um chat saem juntas numa
+  mensagem só (até 4096 caracteres).
+- Edições pendentes da mesma mensagem ficam só com a última.
+- Um 429 pausa todos os envios pelo retry_after e a chamada é repetida.
+
+ProgressMessage mostra o andamento de operações longas editando uma única
+mensagem, em vez de mandar uma nova a cada passo.
+"""
+import os
+import time
+import asyncio
+import logging
+import datetime
+from collections import deque
+
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import increment, observe
+
+# TELEGRAM_OUTBOX=0 desliga a fila (ex.: teste de carga contra o Telegram falso)
+OUTBOX_ENABLED = os.getenv("TELEGRAM_OUTBOX", "1") == "1"
+
+# Envios por segundo: no total, por chat privado e por grupo (e quantos podem sair de uma vez)
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+
+# Tentativas depois de um 429
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Intervalo mínimo (em segundos) entre duas edições de uma mensagem de andamento
+PROGRESS_INTERVAL = float(os.getenv("TELEGRAM_PROGRESS_INTERVAL", "3"))
+
+MAX_MESSAGE_LENGTH = 4096
+MERGE_SEPARATOR = "\n\n"
+
+# sendMessage só com estes campos pode ser juntado a outro (teclados, respostas e afins não)
+_MERGEABLE_FIELDS = {'chat_id', 'text', 'parse_mode', 'disable_notification', 'message_thread_id',
+                     'link_preview_options', 'protect_content'}
+
+# De quanto em quanto tempo (em segundos) esquecer os chats parados
+_SWEEP_INTERVAL = 60
+
+
+def _retry_seconds(error):
+    delay = error.retry_after
+    if isinstance(delay, datetime.timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+class _Pace:
+    """Ritmo de envios (GCRA): rate por segundo, até burst de uma vez.
+    reserve() guarda a vaga e diz quanto esperar; como roda no loop sem await,
+    quem reserva primeiro sai primeiro"""
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate, burst):
+        self.interval = 1 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.tat = 0.0
+
+    def reserve(self, now):
+        start = max(now, self.tat - self.tolerance)
+        self.tat = max(self.tat, now) + self.interval
+        return start - now
+
+    def idle(self, now):
+        return self.tat <= now
+
+
+class _Request:
+    __slots__ = ('endpoint', 'data', 'callback', 'kwargs', 'future', 'merge', 'queued_at')
+
+    def __init__(self, endpoint, data, callback, kwargs, future, merge):
+        self.endpoint = endpoint
+        self.data = data
+        self.callback = callback
+        self.kwargs = kwargs
+        self.future = future
+        self.merge = merge
+        self.queued_at = time.monotonic()
+
+    def mergeable(self):
+        return self.merge and self.endpoint == 'sendMessage' and self.data.keys() <= _MERGEABLE_FIELDS
+
+    def signature(self):
+        return {key: value for key, value in self.data.items() if key != 'text'}
+
+
+class _ChatQueue:
+    __slots__ = ('pending', 'pace', 'task')
+
+    def __init__(self, pace):
+        self.pending = deque()
+        self.pace = pace
+        self.task = None
+
+
+class OutboundLimiter(BaseRateLimiter):
+    """Rate limiter do bot: filas por chat, ritmo global, junção de respostas e retry em 429.
+
+    rate_limit_args={'merge': False} num envio impede que ele seja juntado a
+    outros (ex.: uma mensagem que depois vai ser editada)."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, chat_rate=CHAT_RATE,
+                 group_rate=GROUP_RATE, chat_burst=CHAT_BURST, max_retries=MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = _Pace(global_rate, global_burst)
+        self._chats = {}
+        self._paused_until = 0.0
+        self._last_sweep = time.monotonic()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        # Entrega o que ainda está nas filas antes de fechar a conexão
+        tasks = [queue.task for queue in self._chats.values() if queue.task is not None]
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # getMe, getFile, setWebhook...: não contam como mensagem, só respeitam o 429
+            return await self._call(callback, endpoint, data, kwargs)
+
+        merge = (rate_limit_args or {}).get('merge', True)
+        future = asyncio.get_running_loop().create_future()
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = _ChatQueue(self._chat_pace(chat_id))
+        queue.pending.append(_Request(endpoint, data, callback, kwargs, future, merge))
+        if queue.task is None:
+            queue.task = asyncio.create_task(self._drain(queue))
+        self._sweep()
+        return await future
+
+    def _chat_pace(self, chat_id):
+        # Grupos e canais têm id negativo (ou @nome)
+        group = isinstance(chat_id, str) or chat_id < 0
+        return _Pace(self.group_rate if group else self.chat_rate, self.chat_burst)
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < _SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for chat_id in [chat_id for chat_id, queue in self._chats.items()
+                        if queue.task is None and queue.pace.idle(now)]:
+            del self._chats[chat_id]
+
+    async def _drain(self, queue):
+        try:
+            while queue.pending:
+                await asyncio.sleep(queue.pace.reserve(time.monotonic()))
+                # Enquanto esperava a vez do chat, outras respostas podem ter chegado
+                items = self._take(queue.pending)
+                if not items:
+                    continue
+                await asyncio.sleep(self._global.reserve(time.monotonic()))
+                await self._send(items)
+        finally:
+            queue.task = None
+
+    def _take(self, pending):
+        """Próximo envio da fila: uma chamada, várias respostas juntas ou a última edição da mensagem"""
+        while pending and pending[0].future.done():
+            pending.popleft()  # quem pediu desistiu (cancelado)
+        if not pending:
+            return []
+        first = pending.popleft()
+        items = [first]
+        if first.mergeable():
+            signature = first.signature()
+            length = len(first.data.get('text', ''))
+            while pending and pending[0].mergeable() and pending[0].signature() == signature:
+                length += len(MERGE_SEPARATOR) + len(pending[0].data.get('text', ''))
+                if length > MAX_MESSAGE_LENGTH:
+                    break
+                items.append(pending.popleft())
+        elif first.endpoint == 'editMessageText':
+            message_id = first.data.get('message_id')
+            for later in [item for item in pending
+                          if item.endpoint == 'editMessageText' and item.data.get('message_id') == message_id]:
+                pending.remove(later)
+                items.append(later)
+        return items
+
+    async def _send(self, items):
+        first, last = items[0], items[-1]
+        if first.endpoint == 'sendMessage' and len(items) > 1:
+            data = dict(first.data, text=MERGE_SEPARATOR.join(item.data.get('text', '') for item in items))
+            increment('telegram.merged', len(items) - 1)
+        else:
+            # Uma chamada só, ou a edição mais recente da mensagem
+            data = last.data
+        now = time.monotonic()
+        for item in items:
+            observe('telegram.outbox.wait', now - item.queued_at)
+        try:
+            result = await self._call(first.callback, first.endpoint, data, first.kwargs)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        for item in items:
+            if not item.future.done():
+                item.future.set_result(result)
+
+    async def _call(self, callback, endpoint, data, kwargs):
+        attempt = 0
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                return await callback(endpoint, data, **kwargs)
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = _retry_seconds(e)
+                increment('telegram.retry_after')
+                logging.warning(f"Telegram pediu para esperar {delay:.0f}s ({endpoint})")
+                # O bloqueio vale para o bot inteiro: todas as filas esperam
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+
+class ProgressMessage:
+    """Mensagem de andamento: enviada uma vez e depois editada,
+    no máximo a cada PROGRESS_INTERVAL segundos (o texto final sempre aparece)"""
+
+    def __init__(self, bot, chat_id, interval=PROGRESS_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message = None
+        self._text = None
+        self._edited = 0.0
+
+    async def start(self, text):
+        # merge=False: a mensagem vai ser editada, não pode virar parte de outra
+        extra = {'rate_limit_args': {'merge': False}} if getattr(self.bot, 'rate_limiter', None) else {}
+        self.message = await self.bot.send_message(chat_id=self.chat_id, text=text, **extra)
+        self._text = text
+        self._edited = time.monotonic()
+
+    async def update(self, text):
+        if self.message is None:
+            await self.start(text)
+        elif text != self._text and time.monotonic() - self._edited >= self.interval:
+            await self._edit(text)
+
+    async def finish(self, text):
+        if self.message is None:
+            await self.start(text)
+        elif text != self._text:
+            await self._edit(text)
+
+    async def _edit(self, text):
+        self._text = text
+        self._edited = time.monotonic()
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message.message_id, text=text)
+        except BadRequest as e:
+            # Ex.: mensagem apagada pelo usuário; o andamento não é essencial
+            logging.error(f"Erro ao editar a mensagem de andamento: {e}")
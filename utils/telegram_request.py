@@ -0,0 +1,24 @@
+import time
+
+from telegram.request import HTTPXRequest
+
+from utils.metrics import observe
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest que mede cada chamada à API do Telegram (métrica telegram.<método>)"""
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = f"telegram.{url.rsplit('/', 1)[-1]}"
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+            )
+        except Exception:
+            observe(name, time.perf_counter() - started, error=True)
+            raise
+        observe(name, time.perf_counter() - started, error=status >= 400)
+        return status, payload
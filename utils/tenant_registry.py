@@ -0,0 +1,225 @@
+"""Registro de usuários (multi-inquilino): cada usuário do Telegram com sua
+própria planilha, agenda e credenciais do Google.
+
+Os tokens ficam num SQLite local, criptografados com Fernet (chave em
+TENANT_STORE_KEY). Só os usuários ativos ficam em memória, num LRU limitado;
+os demais são carregados do disco quando voltam a mandar mensagem.
+
+Para cadastrar um usuário a partir de um token.json já autorizado:
+    python -m utils.tenant_registry add <id do telegram> <id da planilha> token.json [--calendar <id>]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+
+from utils.google_auth import SCOPES, build_service
+
+TENANT_STORE_PATH = os.getenv("TENANT_STORE_PATH", "tenants.db")
+# Gere com: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+TENANT_STORE_KEY = os.getenv("TENANT_STORE_KEY")
+
+# Quantos usuários manter com clientes autorizados em memória
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "256"))
+
+# Por quantos segundos lembrar que um usuário não está cadastrado. O cadastro
+# (python -m utils.tenant_registry add) roda em outro processo, então o bot só o
+# vê quando essa marca vence
+NOT_REGISTERED_TTL = float(os.getenv("TENANT_NOT_REGISTERED_TTL", "30"))
+
+
+class LRUCache:
+    """Dicionário limitado: ao passar de maxsize descarta o item usado há mais tempo"""
+
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                evicted.append(self._items.popitem(last=False))
+        if self.on_evict:
+            for item in evicted:
+                self.on_evict(*item)
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Tenant:
+    """Usuário carregado em memória: planilha, agenda, credenciais e clientes já montados"""
+    __slots__ = ('user_id', 'spreadsheet_id', 'calendar_id', 'creds', 'services', 'lock')
+
+    def __init__(self, user_id, spreadsheet_id, calendar_id, creds):
+        self.user_id = user_id
+        self.spreadsheet_id = spreadsheet_id
+        self.calendar_id = calendar_id
+        self.creds = creds
+        # Um cliente por (thread, api): o httplib2 não é thread-safe
+        self.services = {}
+        self.lock = threading.Lock()
+
+
+class _NotRegistered:
+    """Marca "usuário não cadastrado" no LRU, para não consultar o disco a cada mensagem"""
+    __slots__ = ('expires',)
+
+    def __init__(self):
+        self.expires = time.monotonic() + NOT_REGISTERED_TTL
+
+
+class TenantRegistry:
+    def __init__(self, path=TENANT_STORE_PATH, key=TENANT_STORE_KEY, cache_size=TENANT_CACHE_SIZE):
+        if not key:
+            raise ValueError("Defina TENANT_STORE_KEY para usar o cadastro de usuários")
+        from cryptography.fernet import Fernet
+        self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS tenants (
+                user_id INTEGER PRIMARY KEY,
+                spreadsheet_id TEXT NOT NULL,
+                calendar_id TEXT NOT NULL DEFAULT 'primary',
+                token BLOB NOT NULL
+            )
+        """)
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._cache = LRUCache(cache_size)
+
+    # --- Armazenamento criptografado ---
+    def register(self, user_id, spreadsheet_id, creds_json, calendar_id='primary'):
+        """Cadastra (ou atualiza) um usuário com o JSON das credenciais autorizadas"""
+        token = self._fernet.encrypt(creds_json.encode())
+        with self._db_lock:
+            self._db.execute("""
+                INSERT INTO tenants (user_id, spreadsheet_id, calendar_id, token) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    spreadsheet_id = excluded.spreadsheet_id,
+                    calendar_id = excluded.calendar_id,
+                    token = excluded.token
+            """, (user_id, spreadsheet_id, calendar_id, token))
+            self._db.commit()
+        self._cache.pop(user_id)
+
+    def unregister(self, user_id):
+        with self._db_lock:
+            self._db.execute("DELETE FROM tenants WHERE user_id = ?", (user_id,))
+            self._db.commit()
+        self._cache.pop(user_id)
+
+    def _save_token(self, tenant):
+        token = self._fernet.encrypt(tenant.creds.to_json().encode())
+        with self._db_lock:
+            self._db.execute("UPDATE tenants SET token = ? WHERE user_id = ?", (token, tenant.user_id))
+            self._db.commit()
+
+    def _load(self, user_id):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT spreadsheet_id, calendar_id, token FROM tenants WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return _NotRegistered()
+        from cryptography.fernet import InvalidToken
+        from google.oauth2.credentials import Credentials
+
+        spreadsheet_id, calendar_id, token = row
+        try:
+            info = json.loads(self._fernet.decrypt(token))
+        except InvalidToken:
+            logging.error(f"Não foi possível descriptografar o token do usuário {user_id}")
+            return _NotRegistered()
+        creds = Credentials.from_authorized_user_info(info, SCOPES)
+        return Tenant(user_id, spreadsheet_id, calendar_id, creds)
+
+    # --- Acesso em memória ---
+    def get(self, user_id):
+        """Usuário cadastrado (carregado do disco só na primeira vez) ou None"""
+        tenant = self._cache.get(user_id)
+        if tenant is None or (isinstance(tenant, _NotRegistered) and tenant.expires <= time.monotonic()):
+            tenant = self._load(user_id)
+            self._cache.put(user_id, tenant)
+        return None if isinstance(tenant, _NotRegistered) else tenant
+
+    def get_service(self, tenant, api, version):
+        """Cliente autorizado do usuário para a thread atual, renovando o token se preciso"""
+        with tenant.lock:
+            if not tenant.creds.valid:
+                from google.auth.transport.requests import Request
+                tenant.creds.refresh(Request())
+                self._save_token(tenant)
+            key = (threading.get_ident(), api, version)
+            service = tenant.services.get(key)
+            if service is None:
+                service = build_service(api, version, tenant.creds)
+                tenant.services[key] = service
+            return service
+
+    def loaded_count(self):
+        return len(self._cache)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add = subparsers.add_parser('add', help='cadastra um usuário')
+    add.add_argument('user_id', type=int)
+    add.add_argument('spreadsheet_id')
+    add.add_argument('token_file', help='token.json autorizado pelo usuário')
+    add.add_argument('--calendar', default='primary')
+    remove = subparsers.add_parser('remove', help='remove um usuário')
+    remove.add_argument('user_id', type=int)
+    args = parser.parse_args()
+
+    registry = TenantRegistry()
+    if args.command == 'add':
+        with open(args.token_file) as f:
+            registry.register(args.user_id, args.spreadsheet_id, f.read(), args.calendar)
+        print(f"Usuário {args.user_id} cadastrado.")
+    else:
+        registry.unregister(args.user_id)
+        print(f"Usuário {args.user_id} removido.")
+    registry.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
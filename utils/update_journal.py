@@ -0,0 +1,218 @@
+"""Diário local das atualizações do Telegram: nenhuma se perde e nenhuma é aplicada duas vezes.
+
+Cada atualização é gravada (SQLite, WAL) antes de ser processada e marcada
+como concluída depois. Assim:
+
+- o mesmo update_id que chega de novo (reenvio do webhook, getUpdates depois
+  de um reinício) é ignorado;
+- as que ficaram no meio quando o processo caiu são reprocessadas em lote na
+  próxima inicialização (replay), em ordem dentro de cada chat.
+
+O replay pode repetir um efeito que já tinha acontecido antes da queda, então
+as gravações usam chaves derivadas da atualização (idempotency_key): a fila
+dos lançamentos ignora a chave repetida e os eventos são criados com um id
+fixo, que o Google recusa (409) na segunda vez.
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from telegram import Update
+from telegram.ext import Application, SimpleUpdateProcessor
+
+from utils.metrics import increment
+
+# Um arquivo só para todos os processos (no modo webhook o servidor grava e os workers concluem)
+UPDATE_JOURNAL_PATH = os.getenv("UPDATE_JOURNAL_PATH", "updates.db")
+UPDATE_JOURNAL_ENABLED = os.getenv("UPDATE_JOURNAL", "1") == "1"
+
+# Por quanto tempo as concluídas são lembradas (o Telegram guarda as atualizações por 24 horas)
+RETENTION = float(os.getenv("UPDATE_JOURNAL_RETENTION_HOURS", "48")) * 3600
+# Limpa as antigas a cada N atualizações concluídas
+PRUNE_EVERY = 1000
+
+# Chats reprocessados ao mesmo tempo no replay
+REPLAY_CONCURRENCY = int(os.getenv("UPDATE_REPLAY_CONCURRENCY", "32"))
+
+
+def idempotency_key(update, index=0):
+    """Chave de uma gravação feita por esta atualização (index separa várias da mesma)"""
+    return f"{update.get_bot().id}:{update.update_id}:{index}"
+
+
+def calendar_event_id(key):
+    """Id de evento do Calendar derivado da chave (base32hex minúsculo, como a API exige)"""
+    digest = hashlib.sha1(key.encode()).digest()
+    return base64.b32hexencode(digest).decode().lower().rstrip('=')
+
+
+class UpdateJournal:
+    def __init__(self, path=UPDATE_JOURNAL_PATH):
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS updates (
+                update_id INTEGER PRIMARY KEY,
+                chat_id INTEGER,
+                data_json TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                done_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_updates_done ON updates (done_at);
+        """)
+        self._db.commit()
+        self._lock = threading.Lock()
+        # Em processamento neste processo: o reenvio de uma delas também é duplicado
+        self._active = set()
+        self._finished = 0
+        self.prune()
+
+    def record(self, data, chat_id=None):
+        """Grava a atualização (JSON cru) antes de processar. Retorna False se o update_id já passou por aqui"""
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO updates (update_id, chat_id, data_json, received_at) VALUES (?, ?, ?, ?)",
+                (data['update_id'], chat_id, json.dumps(data), time.time())
+            ).rowcount
+            self._db.commit()
+        return bool(inserted)
+
+    def begin(self, update):
+        """Marca o início do processamento. False se for duplicada (concluída ou em andamento)"""
+        update_id = update.update_id
+        with self._lock:
+            if update_id in self._active:
+                return False
+            # Só leitura quando já foi gravada (webhook, replay): não disputa a escrita com os outros processos
+            found = self._db.execute("SELECT done_at FROM updates WHERE update_id = ?", (update_id,)).fetchone()
+            if found is None:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO updates (update_id, chat_id, data_json, received_at) VALUES (?, ?, ?, ?)",
+                    (update_id, update.effective_chat.id if update.effective_chat else None,
+                     json.dumps(update.to_dict()), time.time())
+                )
+                self._db.commit()
+            elif found[0] is not None:
+                return False
+            # Gravada antes (pelo servidor do webhook ou por uma execução que caiu): processa
+            self._active.add(update_id)
+        return True
+
+    def finish(self, update_id):
+        with self._lock:
+            self._active.discard(update_id)
+            self._db.execute("UPDATE updates SET done_at = ? WHERE update_id = ?", (time.time(), update_id))
+            self._db.commit()
+            self._finished += 1
+            prune = self._finished % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def forget(self, update_id):
+        """Desfaz o record de uma atualização que não pôde ser aceita (o Telegram vai reenviar)"""
+        with self._lock:
+            self._db.execute("DELETE FROM updates WHERE update_id = ? AND done_at IS NULL", (update_id,))
+            self._db.commit()
+
+    def abandon(self, update_id):
+        """O processamento foi interrompido (desligamento): fica pendente para o próximo replay"""
+        with self._lock:
+            self._active.discard(update_id)
+
+    def pending(self):
+        """Atualizações gravadas e não concluídas, em ordem (JSON cru)"""
+        with self._lock:
+            return [json.loads(data) for (data,) in self._db.execute(
+                "SELECT data_json FROM updates WHERE done_at IS NULL ORDER BY update_id"
+            )]
+
+    def prune(self):
+        with self._lock:
+            self._db.execute("DELETE FROM updates WHERE done_at < ?", (time.time() - RETENTION,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JournaledApplication(Application):
+    """Application que passa cada atualização pelo diário (bot_data['update_journal'])"""
+
+    async def process_update(self, update):
+        journal = self.bot_data.get('update_journal')
+        if journal is None or not isinstance(update, Update):
+            return await super().process_update(update)
+        if not journal.begin(update):
+            increment('updates.duplicate')
+            return None
+        try:
+            await super().process_update(update)
+        except BaseException:
+            # Cancelada no meio: não marca como concluída, o replay termina o serviço
+            journal.abandon(update.update_id)
+            raise
+        journal.finish(update.update_id)
+        return None
+
+
+class ChatOrderedUpdateProcessor(SimpleUpdateProcessor):
+    """Atualizações de chats diferentes ao mesmo tempo; as de um mesmo chat, uma de cada
+    vez e na ordem de chegada (como _process_in_order no modo webhook). Sem isso um
+    "excluir 2" podia rodar antes da listagem que ele numera"""
+
+    def __init__(self, max_concurrent_updates=256):
+        super().__init__(max_concurrent_updates)
+        # chat -> Event da última atualização dele que entrou
+        self._tails = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        previous = self._tails.get(chat.id)
+        done = self._tails[chat.id] = asyncio.Event()
+        try:
+            if previous is not None:
+                await previous.wait()
+            await coroutine
+        finally:
+            done.set()
+            if self._tails.get(chat.id) is done:
+                del self._tails[chat.id]
+
+
+async def replay(application, journal, concurrency=REPLAY_CONCURRENCY):
+    """Reprocessa o que ficou pendente: cada chat em ordem, vários chats ao mesmo tempo.
+    Retorna quantas atualizações foram reprocessadas"""
+    pending = journal.pending()
+    if not pending:
+        return 0
+    started = time.perf_counter()
+    by_chat = {}
+    for data in pending:
+        update = Update.de_json(data, application.bot)
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        by_chat.setdefault(chat_id, []).append(update)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_chat(updates):
+        async with semaphore:
+            for update in updates:
+                await application.process_update(update)
+
+    # Sem chat não há ordem a manter: cada uma vai sozinha
+    groups = [[update] for update in by_chat.pop(None, [])] + list(by_chat.values())
+    await asyncio.gather(*(run_chat(updates) for updates in groups))
+    increment('updates.replayed', len(pending))
+    logging.info(f"{len(pending)} atualização(ões) pendente(s) reprocessada(s) em "
+                 f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    return len(pending)
@@ -0,0 +1,283 @@
+import os
+import re
+import glob
+import hmac
+import json
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telegram import Bot, Update
+
+from utils.google_scheduler import set_quota_share
+from utils.update_journal import UpdateJournal, UPDATE_JOURNAL_ENABLED
+
+# Modo webhook: um servidor HTTP local recebe as atualizações do Telegram e
+# distribui entre vários processos. Cada chat sempre cai no mesmo processo,
+# então as mensagens de um chat continuam em ordem.
+# Por padrão só aceita conexões locais (atrás de um proxy reverso). Para ouvir em
+# outra interface, ou registrar WEBHOOK_URL, o WEBHOOK_SECRET é obrigatório:
+# sem ele qualquer um poderia postar atualizações em nome de qualquer usuário.
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# URL pública registrada no Telegram (se vazia, o webhook não é registrado)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 2)))
+
+# Tamanho máximo da fila de cada processo (o servidor responde 503 se lotar)
+WORKER_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+
+# Maior corpo aceito (uma atualização do Telegram tem poucos KB)
+MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(1024 * 1024)))
+
+# De quanto em quanto tempo (segundos) o processo principal confere se os workers estão vivos
+WORKER_CHECK_INTERVAL = 5
+
+_LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+# Partes de uma atualização que trazem o chat
+_CHAT_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'my_chat_member', 'chat_member')
+
+
+def update_chat_id(data):
+    """Id do chat da atualização (JSON cru), ou None se não houver chat"""
+    for field in _CHAT_FIELDS:
+        if field in data:
+            return data[field].get('chat', {}).get('id')
+    if 'callback_query' in data:
+        return data['callback_query'].get('message', {}).get('chat', {}).get('id')
+    return None
+
+
+def shard_for(data, workers):
+    key = update_chat_id(data)
+    if key is None:
+        key = data.get('update_id', 0)
+    return key % workers
+
+
+def worker_path(path, worker_id):
+    """Arquivo local separado por processo: finance_journal.db -> finance_journal.worker1.db"""
+    if worker_id is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.worker{worker_id}{ext}"
+
+
+def orphan_worker_paths(path, workers=0):
+    """Arquivos de workers que não existem mais (id >= workers; no polling, workers=0, todos).
+    Ex.: o bot voltou de 8 para 4 processos e os diários worker4..7 ainda têm linhas"""
+    base, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(base) + r'\.worker(\d+)' + re.escape(ext) + '$')
+    orphans = []
+    for candidate in sorted(glob.glob(f"{glob.escape(base)}.worker*{glob.escape(ext)}")):
+        match = pattern.search(candidate)
+        if match and int(match.group(1)) >= workers:
+            orphans.append(candidate)
+    return orphans
+
+
+async def _process_in_order(application, previous, update):
+    # Espera a atualização anterior do mesmo chat terminar antes de começar
+    if previous is not None:
+        try:
+            await previous
+        except Exception:
+            pass
+    await application.process_update(update)
+
+
+async def _worker_loop(build_application, worker_id, queue, workers):
+    application = build_application(worker_id)
+    # O worker 0 recolhe os arquivos dos workers que não existem mais (ver orphan_worker_paths)
+    application.bot_data['workers'] = workers
+    await application.initialize()
+    # Serviços do Google, caches e filas são criados uma vez por processo
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    loop = asyncio.get_running_loop()
+    tails = {}
+    logging.info(f"Worker {worker_id} pronto")
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            update = Update.de_json(data, application.bot)
+            chat_id = update_chat_id(data)
+            task = asyncio.create_task(_process_in_order(application, tails.get(chat_id), update))
+            if chat_id is not None:
+                tails[chat_id] = task
+                task.add_done_callback(
+                    lambda done, chat_id=chat_id: tails.pop(chat_id) if tails.get(chat_id) is done else None
+                )
+        if tails:
+            await asyncio.gather(*tails.values(), return_exceptions=True)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def _worker_main(build_application, worker_id, queue, workers):
+    # Quem encerra os workers é o processo principal (com None na fila), depois de parar o servidor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f'%(asctime)s - worker{worker_id} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    # Todos os processos usam o mesmo projeto do Google: cada um fica com uma parte da cota dele
+    set_quota_share(workers)
+    asyncio.run(_worker_loop(build_application, worker_id, queue, workers))
+
+
+class _WebhookServer(ThreadingHTTPServer):
+    # O padrão (5) derruba conexões quando chegam muitas atualizações juntas
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _make_handler(queues, journal=None):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            if self.path != WEBHOOK_PATH:
+                self.send_error(404)
+                return
+            if WEBHOOK_SECRET and not hmac.compare_digest(
+                    self.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode(), WEBHOOK_SECRET.encode()):
+                self.send_error(403)
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                self.send_error(400)
+                return
+            if length > MAX_BODY_BYTES:
+                self.send_error(413)
+                return
+            try:
+                data = json.loads(self.rfile.read(max(length, 0)))
+            except ValueError:
+                self.send_error(400)
+                return
+            if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+                self.send_error(400)
+                return
+
+            # Gravada no diário antes do 200: se um processo cair, ela volta no replay.
+            # Um update_id repetido (reenvio do Telegram) só recebe o 200
+            if journal is None or journal.record(data, update_chat_id(data)):
+                try:
+                    queues[shard_for(data, len(queues))].put_nowait(data)
+                except Exception:
+                    # Fila cheia: o Telegram reenvia a atualização mais tarde
+                    if journal is not None:
+                        journal.forget(data.get('update_id'))
+                    self.send_error(503)
+                    return
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+async def _register_webhook(token, base_url=None):
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    async with bot:
+        await bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+
+
+def _supervise(processes, start_worker, queues, journal, stopping):
+    """Sobe de novo o worker que morrer; sem isso o shard dele ficaria sem resposta.
+    As atualizações que ele pegou e não concluiu voltam para a fila (o diário
+    descarta a cópia de uma que já tenha terminado)"""
+    while not stopping.wait(WORKER_CHECK_INTERVAL):
+        for worker_id, process in enumerate(processes):
+            if process.is_alive() or stopping.is_set():
+                continue
+            logging.error(f"Worker {worker_id} parou (código {process.exitcode}); iniciando outro")
+            processes[worker_id] = start_worker(worker_id)
+            if journal is None:
+                continue
+            lost = [data for data in journal.pending() if shard_for(data, len(queues)) == worker_id]
+            for data in lost:
+                try:
+                    queues[worker_id].put_nowait(data)
+                except Exception:
+                    # Fila cheia: as que sobrarem vão no replay da próxima inicialização
+                    break
+
+
+def run_webhook(build_application, token, base_url=None, workers=WEBHOOK_WORKERS):
+    """Sobe os processos de trabalho e o servidor HTTP que recebe as atualizações.
+
+    build_application(worker_id) deve montar a Application (com handlers) de cada
+    processo; ela precisa ser importável, pois os processos usam "spawn".
+    """
+    if not WEBHOOK_SECRET and (WEBHOOK_URL or WEBHOOK_HOST not in _LOOPBACK_HOSTS):
+        raise ValueError("Defina WEBHOOK_SECRET para registrar WEBHOOK_URL ou ouvir fora de 127.0.0.1")
+    if WEBHOOK_URL:
+        asyncio.run(_register_webhook(token, base_url))
+
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+
+    def start_worker(worker_id):
+        process = context.Process(target=_worker_main, args=(build_application, worker_id, queues[worker_id], workers),
+                                  name=f"bot-worker{worker_id}", daemon=True)
+        process.start()
+        return process
+
+    processes = [start_worker(worker_id) for worker_id in range(workers)]
+
+    journal = None
+    if UPDATE_JOURNAL_ENABLED:
+        journal = UpdateJournal()
+        # O que ficou pendente na última execução vai antes das atualizações novas
+        pending = journal.pending()
+        for data in pending:
+            queues[shard_for(data, workers)].put(data)
+        if pending:
+            logging.info(f"{len(pending)} atualização(ões) pendente(s) reenviada(s) aos workers")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    stopping = threading.Event()
+    supervisor = threading.Thread(target=_supervise, args=(processes, start_worker, queues, journal, stopping),
+                                  name="webhook-supervisor", daemon=True)
+    supervisor.start()
+
+    server = _WebhookServer((WEBHOOK_HOST, WEBHOOK_PORT), _make_handler(queues, journal))
+    logging.info(f"Webhook ouvindo em {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH} com {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stopping.set()
+        supervisor.join()
+        # Sinaliza o fim e espera cada processo esvaziar a fila e fechar (flush dos lançamentos)
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+        if journal is not None:
+            journal.close()